@@ -2,30 +2,39 @@
 
 This module provides a unified way to create boto3 clients that work with
 both LocalStack (local development) and real AWS services (production).
+Clients are pooled in a process-wide registry, so repeated lookups with the
+same service, region, endpoint and profile reuse one client.
 """
 import os
 from functools import lru_cache
 from typing import Any, Optional
 
 import boto3  # type: ignore[import-untyped]
-from botocore.config import Config  # type: ignore[import-untyped]
+
+from video_processor_shared.aws.client_registry import (
+    DEFAULT_PROFILE,
+    ClientProfile,
+    registry,
+)
 
 
 def get_aws_client(
     service_name: str,
     region_name: str = "us-east-1",
     endpoint_url: Optional[str] = None,
+    profile: str = DEFAULT_PROFILE,
 ) -> Any:
     """
-    Get a boto3 client configured for LocalStack or AWS.
+    Get a pooled boto3 client configured for LocalStack or AWS.
 
     Args:
         service_name: AWS service name (s3, sqs, sns, ses, etc.)
         region_name: AWS region (default: us-east-1)
         endpoint_url: Custom endpoint URL (for LocalStack)
+        profile: Name of a registered ClientProfile (default: "default")
 
     Returns:
-        boto3 client instance
+        boto3 client instance, shared by every caller using the same key
 
     Usage:
         # Auto-detects LocalStack if AWS_ENDPOINT_URL is set
@@ -39,26 +48,58 @@ def get_aws_client(
     if endpoint_url is None:
         endpoint_url = os.getenv("AWS_ENDPOINT_URL")
 
-    config = Config(
-        retries={"max_attempts": 3, "mode": "standard"},
-        connect_timeout=5,
-        read_timeout=60,
-    )
+    def build(client_profile: ClientProfile) -> Any:
+        client_kwargs = {
+            "service_name": service_name,
+            "region_name": region_name,
+            "config": client_profile.to_config(service_name),
+        }
 
-    client_kwargs = {
-        "service_name": service_name,
-        "region_name": region_name,
-        "config": config,
-    }
+        # If using LocalStack, configure endpoint and dummy credentials
+        if endpoint_url:
+            client_kwargs["endpoint_url"] = endpoint_url
+            # LocalStack accepts any credentials
+            client_kwargs["aws_access_key_id"] = os.getenv("AWS_ACCESS_KEY_ID", "test")
+            client_kwargs["aws_secret_access_key"] = os.getenv("AWS_SECRET_ACCESS_KEY", "test")
 
-    # If using LocalStack, configure endpoint and dummy credentials
-    if endpoint_url:
-        client_kwargs["endpoint_url"] = endpoint_url
-        # LocalStack accepts any credentials
-        client_kwargs["aws_access_key_id"] = os.getenv("AWS_ACCESS_KEY_ID", "test")
-        client_kwargs["aws_secret_access_key"] = os.getenv("AWS_SECRET_ACCESS_KEY", "test")
+        return boto3.client(**client_kwargs)
+
+    return registry.get_client(service_name, region_name, endpoint_url or None, profile, build)
+
+
+def configure_client_profile(name: str, profile: ClientProfile) -> None:
+    """
+    Register connection settings under a profile name.
+
+    Usage:
+        configure_client_profile(
+            "workers",
+            ClientProfile(max_pool_connections=50, service_timeouts={"sqs": (5, 30)}),
+        )
+        sqs = get_aws_client("sqs", profile="workers")
+
+    Clients built with the old settings are closed, and the cached
+    get_*_client getters rebuild theirs on next use.
+    """
+    registry.configure_profile(name, profile)
+    _clear_cached_getters()
+
+
+def close_all_clients() -> None:
+    """Close every pooled client, e.g. on application shutdown."""
+    registry.close_all()
+    _clear_cached_getters()
 
-    return boto3.client(**client_kwargs)
+
+def reset_clients() -> None:
+    """
+    Forget pooled clients without closing them.
+
+    Runs automatically in forked children so workers never reuse the
+    parent's connection pools.
+    """
+    registry.reset()
+    _clear_cached_getters()
 
 
 def get_aws_resource(
@@ -113,6 +154,15 @@ def get_ses_client() -> Any:
     return get_aws_client("ses")
 
 
+def _clear_cached_getters() -> None:
+    for getter in (get_s3_client, get_sqs_client, get_sns_client, get_ses_client):
+        getter.cache_clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=reset_clients)
+
+
 # Queue and topic URL helpers
 def get_sqs_queue_url(queue_name: str) -> str:
     """Get SQS queue URL by name."""
@@ -0,0 +1,189 @@
+"""Helpers for SQS/SNS batch APIs.
+
+Batch APIs accept at most 10 entries and 256 KiB of payload per request and
+can fail per entry. run_batched packs entries into requests, sends them
+concurrently and retries only the entries that failed for a transient
+reason, with jittered exponential backoff. A request that raises (a network
+error, a throttled call) fails all of its entries transiently, without
+discarding the results of the other requests.
+"""
+import asyncio
+import random
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+MAX_BATCH_ENTRIES = 10
+MAX_BATCH_BYTES = 256 * 1024
+
+
+@dataclass(frozen=True)
+class EntryFailure:
+    """
+    Failure of a single batch entry.
+
+    Attributes:
+        code: Error code returned by AWS.
+        message: Error message returned by AWS.
+        sender_fault: True when retrying the same entry cannot succeed.
+    """
+
+    code: str
+    message: str = ""
+    sender_fault: bool = False
+
+    @classmethod
+    def from_response(cls, entry: Dict[str, Any]) -> "EntryFailure":
+        """Build from a Failed entry of a batch response."""
+        return cls(
+            code=str(entry.get("Code", "")),
+            message=str(entry.get("Message", "")),
+            sender_fault=bool(entry.get("SenderFault", False)),
+        )
+
+    def __str__(self) -> str:
+        return f"{self.code}: {self.message}" if self.message else self.code
+
+
+class BatchOperationError(Exception):
+    """
+    Raised when some batch entries still failed after all retries.
+
+    Attributes:
+        results: Per-entry results in input order (None for failed entries).
+        failures: Failure of each failed entry, by input index.
+    """
+
+    def __init__(self, results: List[Optional[Any]], failures: Dict[int, EntryFailure]) -> None:
+        self.results = results
+        self.failures = failures
+        super().__init__(f"{len(failures)} of {len(results)} batch entries failed")
+
+
+BatchSender = Callable[[List[int]], Awaitable[Tuple[Dict[int, Any], Dict[int, EntryFailure]]]]
+
+
+def pack_batches(
+    sizes: Sequence[int],
+    max_entries: int = MAX_BATCH_ENTRIES,
+    max_bytes: int = MAX_BATCH_BYTES,
+) -> List[List[int]]:
+    """
+    Group entry indexes into batches within the entry and payload limits.
+
+    Args:
+        sizes: Payload size in bytes of each entry
+
+    Returns:
+        Lists of entry indexes, preserving input order
+
+    Raises:
+        ValueError: If a single entry exceeds max_bytes
+    """
+    batches: List[List[int]] = []
+    current: List[int] = []
+    current_bytes = 0
+    for index, size in enumerate(sizes):
+        if size > max_bytes:
+            raise ValueError(f"Batch entry {index} is {size} bytes; the limit is {max_bytes}")
+        if current and (len(current) == max_entries or current_bytes + size > max_bytes):
+            batches.append(current)
+            current, current_bytes = [], 0
+        current.append(index)
+        current_bytes += size
+    if current:
+        batches.append(current)
+    return batches
+
+
+def backoff_delay(attempt: int, base: float = 0.1, cap: float = 5.0) -> float:
+    """Full-jitter exponential backoff delay for a retry attempt (1-based)."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+async def run_batched(
+    sizes: Sequence[int],
+    send_batch: BatchSender,
+    max_attempts: int = 3,
+    base_delay: float = 0.1,
+    max_entries: int = MAX_BATCH_ENTRIES,
+    max_bytes: int = MAX_BATCH_BYTES,
+    concurrent: bool = True,
+) -> List[Any]:
+    """
+    Send entries in concurrent batches, retrying transient per-entry failures.
+
+    Args:
+        sizes: Payload size of each entry
+        send_batch: Sends the entries at the given indexes and returns
+            (results by index, failures by index)
+        max_attempts: Attempts per entry, including the first
+        base_delay: Base delay in seconds for the backoff between attempts
+        concurrent: Send the batches of an attempt concurrently; when False
+            they are sent one after another, in order
+
+    Returns:
+        Per-entry results in input order
+
+    Raises:
+        BatchOperationError: If entries still failed after the last attempt
+    """
+    results: List[Optional[Any]] = [None] * len(sizes)
+    failures: Dict[int, EntryFailure] = {}
+    pending = list(range(len(sizes)))
+
+    for attempt in range(1, max_attempts + 1):
+        batches = pack_batches([sizes[index] for index in pending], max_entries, max_bytes)
+        requests = [[pending[position] for position in batch] for batch in batches]
+        if concurrent:
+            responses = await asyncio.gather(
+                *(send_batch(indexes) for indexes in requests), return_exceptions=True
+            )
+        else:
+            responses = []
+            for indexes in requests:
+                try:
+                    responses.append(await send_batch(indexes))
+                except Exception as error:
+                    responses.append(error)
+        retry: List[int] = []
+        for indexes, response in zip(requests, responses):
+            succeeded: Dict[int, Any]
+            failed: Dict[int, EntryFailure]
+            if isinstance(response, Exception):
+                failure = EntryFailure(type(response).__name__, str(response))
+                succeeded, failed = {}, {index: failure for index in indexes}
+            elif isinstance(response, BaseException):
+                raise response
+            else:
+                succeeded, failed = response
+            for index, result in succeeded.items():
+                results[index] = result
+                failures.pop(index, None)
+            for index, failure in failed.items():
+                failures[index] = failure
+                if not failure.sender_fault:
+                    retry.append(index)
+        if not retry or attempt == max_attempts:
+            break
+        pending = sorted(retry)
+        await asyncio.sleep(backoff_delay(attempt, base_delay))
+
+    if failures:
+        raise BatchOperationError(results, failures)
+    return results
+
+
+def batch_outcome(
+    response: Dict[str, Any],
+    result_field: str,
+) -> Tuple[Dict[int, Any], Dict[int, EntryFailure]]:
+    """
+    Split an SQS/SNS batch response into (results by index, failures by index).
+
+    Entry Ids must be the input indexes, as sent by run_batched callers.
+    """
+    succeeded = {int(entry["Id"]): entry.get(result_field) for entry in response.get("Successful", [])}
+    failed = {
+        int(entry["Id"]): EntryFailure.from_response(entry) for entry in response.get("Failed", [])
+    }
+    return succeeded, failed
@@ -0,0 +1,77 @@
+"""Thread-safe in-process LRU cache with optional expiry."""
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Generic, Hashable, Optional, Tuple, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class LRUCache(Generic[K, V]):
+    """
+    Bounded least-recently-used cache.
+
+    Entries may carry a time-to-live; expired entries behave as missing and
+    are dropped on access. When full, the least recently used entry is
+    evicted.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        """
+        Create a cache.
+
+        Args:
+            max_entries: Maximum number of entries kept
+            ttl: Default time-to-live in seconds (None = never expires)
+            clock: Time source, injectable for tests
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[K, Tuple[V, Optional[float]]]" = OrderedDict()
+
+    def get(self, key: K, default: Optional[V] = None) -> Optional[V]:
+        """Get a live entry and mark it as recently used."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= self._clock():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: K, value: V, ttl: Optional[float] = None) -> None:
+        """Store an entry, evicting the least recently used one when full."""
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = self._clock() + ttl if ttl is not None else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def pop(self, key: K) -> Optional[V]:
+        """Remove an entry and return its value if present."""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        return entry[0] if entry is not None else None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __contains__(self, key: object) -> bool:
+        return self.get(key) is not None  # type: ignore[arg-type]
+
+    def __len__(self) -> int:
+        return len(self._entries)
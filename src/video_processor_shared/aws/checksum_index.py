@@ -0,0 +1,117 @@
+"""Checksum indexes for content-addressed upload deduplication.
+
+An index maps a content checksum to the S3 key already holding that content.
+InMemoryChecksumIndex keeps a bounded LRU per process; SQLiteChecksumIndex
+persists entries in a local database (fronted by the same LRU) so they
+survive restarts and are shared by processes on the host.
+"""
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Optional
+
+from video_processor_shared.aws.cache import LRUCache
+
+
+class ChecksumIndex(ABC):
+    """Mapping of content checksum to S3 key."""
+
+    @abstractmethod
+    def get(self, checksum: str) -> Optional[str]:
+        """Get the key stored for a checksum, if any."""
+
+    @abstractmethod
+    def put(self, checksum: str, key: str) -> None:
+        """Record the key holding a checksum's content."""
+
+    @abstractmethod
+    def discard(self, checksum: str) -> None:
+        """Forget a checksum, e.g. after its object was deleted."""
+
+
+class InMemoryChecksumIndex(ChecksumIndex):
+    """Process-local checksum index bounded by an LRU."""
+
+    def __init__(self, max_entries: int = 10_000) -> None:
+        self._entries: LRUCache[str, str] = LRUCache(max_entries=max_entries)
+
+    def get(self, checksum: str) -> Optional[str]:
+        return self._entries.get(checksum)
+
+    def put(self, checksum: str, key: str) -> None:
+        self._entries.set(checksum, key)
+
+    def discard(self, checksum: str) -> None:
+        self._entries.pop(checksum)
+
+
+class SQLiteChecksumIndex(ChecksumIndex):
+    """Checksum index persisted in a local SQLite database."""
+
+    def __init__(self, path: str, cache_size: int = 1024) -> None:
+        """
+        Open (and create if needed) an index database.
+
+        Args:
+            path: SQLite database file
+            cache_size: Entries kept in the in-memory LRU in front of SQLite
+        """
+        self.path = path
+        self._cache = InMemoryChecksumIndex(cache_size)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS checksums ("
+            "checksum TEXT PRIMARY KEY, s3_key TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+
+    def get(self, checksum: str) -> Optional[str]:
+        key = self._cache.get(checksum)
+        if key is not None:
+            return key
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT s3_key FROM checksums WHERE checksum = ?", (checksum,)
+            ).fetchone()
+        if row is None:
+            return None
+        self._cache.put(checksum, row[0])
+        return str(row[0])
+
+    def put(self, checksum: str, key: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO checksums (checksum, s3_key, created_at) VALUES (?, ?, ?)",
+                (checksum, key, time.time()),
+            )
+        self._cache.put(checksum, key)
+
+    def discard(self, checksum: str) -> None:
+        self._cache.discard(checksum)
+        with self._lock:
+            self._conn.execute("DELETE FROM checksums WHERE checksum = ?", (checksum,))
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_default_index: Optional[ChecksumIndex] = None
+_default_lock = threading.Lock()
+
+
+def default_checksum_index() -> ChecksumIndex:
+    """
+    Get the process-wide checksum index.
+
+    Uses SQLite when S3_CHECKSUM_INDEX_PATH is set, otherwise memory.
+    """
+    global _default_index
+    with _default_lock:
+        if _default_index is None:
+            path = os.getenv("S3_CHECKSUM_INDEX_PATH")
+            _default_index = SQLiteChecksumIndex(path) if path else InMemoryChecksumIndex()
+        return _default_index
@@ -0,0 +1,178 @@
+"""S3 claim checks for oversized SQS/SNS payloads.
+
+SQS and SNS reject messages above 256 KiB. ClaimCheckStore moves bodies
+above a threshold to S3 (optionally gzip-compressed) and replaces them with
+a small pointer message; receivers resolve the pointer back into the
+original body. Offloaded objects live under the claim-checks/ prefix and
+are never deleted by the receiver, since an SNS message can fan out to many
+queues: expire them with an S3 lifecycle rule on that prefix.
+
+SNS subscriptions without RawMessageDelivery wrap the pointer in a
+notification envelope; resolving it restores the original payload in the
+envelope's Message field, so the receiver sees what it would have seen had
+the payload never been offloaded.
+"""
+import gzip
+import json
+import os
+import re
+from typing import Any, Dict, Optional
+from uuid import uuid4
+
+from video_processor_shared.aws import get_s3_client
+from video_processor_shared.aws.executor import AsyncExecutor, get_executor
+
+CLAIM_CHECK_KEY = "__claim_check__"
+
+# Leaves room below the 256 KiB limit for message attributes.
+DEFAULT_THRESHOLD = 240 * 1024
+
+_POINTER_PREFIX = '{"' + CLAIM_CHECK_KEY + '"'
+
+# SNS always puts "Type" first in the envelopes it delivers to SQS.
+_NOTIFICATION = re.compile(r'\s*\{\s*"Type"\s*:\s*"Notification"')
+
+
+def is_claim_check(body: str) -> bool:
+    """
+    Check whether a message body is a claim-check pointer, either directly
+    or inside an SNS notification envelope.
+    """
+    if body.startswith(_POINTER_PREFIX):
+        return True
+    envelope = sns_notification(body)
+    return envelope is not None and str(envelope.get("Message", "")).startswith(_POINTER_PREFIX)
+
+
+def sns_notification(body: str) -> Optional[Dict[str, Any]]:
+    """
+    Parse the SNS notification envelope of a message delivered to SQS
+    without RawMessageDelivery.
+
+    Returns:
+        The envelope, or None if body is not one
+    """
+    if not _NOTIFICATION.match(body):
+        return None
+    try:
+        envelope = json.loads(body)
+    except ValueError:
+        return None
+    return envelope if isinstance(envelope, dict) else None
+
+
+class ClaimCheckStore:
+    """Offloads large message bodies to S3 and resolves them back."""
+
+    def __init__(
+        self,
+        bucket: Optional[str] = None,
+        prefix: str = "claim-checks/",
+        threshold: Optional[int] = None,
+        compress: Optional[bool] = None,
+        client: Any = None,
+        executor: Optional[AsyncExecutor] = None,
+    ) -> None:
+        """
+        Create a store.
+
+        Args:
+            bucket: Bucket for offloaded bodies (default: CLAIM_CHECK_BUCKET,
+                then S3_OUTPUT_BUCKET)
+            prefix: Key prefix for offloaded bodies
+            threshold: Bodies larger than this many bytes are offloaded
+                (default: CLAIM_CHECK_THRESHOLD_BYTES or 240 KiB)
+            compress: Gzip bodies before offloading (default: CLAIM_CHECK_COMPRESS)
+            client: boto3 S3 client (default: the shared client, created on first use)
+            executor: Executor for S3 calls (default: the shared "s3" executor)
+        """
+        self.bucket: str = (
+            bucket
+            or os.getenv("CLAIM_CHECK_BUCKET")
+            or os.getenv("S3_OUTPUT_BUCKET")
+            or "video-outputs"
+        )
+        self.prefix = prefix
+        self.threshold = (
+            threshold
+            if threshold is not None
+            else int(os.getenv("CLAIM_CHECK_THRESHOLD_BYTES", str(DEFAULT_THRESHOLD)))
+        )
+        self.compress = (
+            compress
+            if compress is not None
+            else os.getenv("CLAIM_CHECK_COMPRESS", "false").lower() == "true"
+        )
+        self._client = client
+        self._executor = executor
+
+    @property
+    def client(self) -> Any:
+        if self._client is None:
+            self._client = get_s3_client()
+        return self._client
+
+    @property
+    def executor(self) -> AsyncExecutor:
+        return self._executor or get_executor("s3")
+
+    def needs_offload(self, body: str) -> bool:
+        return len(body.encode("utf-8")) > self.threshold
+
+    async def offload(self, body: str) -> str:
+        """
+        Return body unchanged if it is small enough, otherwise store it in
+        S3 and return a pointer message.
+        """
+        if not self.needs_offload(body):
+            return body
+        return await self.executor.run(self.put, body)
+
+    async def resolve(self, body: str) -> str:
+        """Return the original body for a pointer, or body itself."""
+        if not is_claim_check(body):
+            return body
+        return await self.executor.run(self.fetch, body)
+
+    def put(self, body: str) -> str:
+        """Store body in S3 (blocking) and return the pointer message."""
+        data = body.encode("utf-8")
+        encoding = None
+        if self.compress:
+            data = gzip.compress(data)
+            encoding = "gzip"
+        key = f"{self.prefix}{uuid4().hex}.json" + (".gz" if encoding else "")
+        self.client.put_object(
+            Bucket=self.bucket,
+            Key=key,
+            Body=data,
+            ContentType="application/json",
+            **({"ContentEncoding": encoding} if encoding else {}),
+        )
+        pointer: Dict[str, Any] = {"bucket": self.bucket, "key": key, "size": len(body)}
+        if encoding:
+            pointer["encoding"] = encoding
+        return json.dumps({CLAIM_CHECK_KEY: pointer})
+
+    def fetch(self, body: str) -> str:
+        """Download the body a pointer message refers to (blocking)."""
+        envelope = sns_notification(body)
+        if envelope is not None:
+            return json.dumps({**envelope, "Message": self.fetch(envelope["Message"])})
+        pointer = json.loads(body)[CLAIM_CHECK_KEY]
+        response = self.client.get_object(Bucket=pointer["bucket"], Key=pointer["key"])
+        data = response["Body"].read()
+        if pointer.get("encoding") == "gzip":
+            data = gzip.decompress(data)
+        return str(data.decode("utf-8"))
+
+
+_default_store: Optional[ClaimCheckStore] = None
+
+
+def default_claim_check_store() -> ClaimCheckStore:
+    """Get the process-wide claim-check store configured from the environment."""
+    global _default_store
+    if _default_store is None:
+        _default_store = ClaimCheckStore()
+    return _default_store
@@ -0,0 +1,164 @@
+"""Pooled boto3 client registry.
+
+Building a boto3 client loads the service model and resolves endpoints, which
+costs hundreds of milliseconds. The registry builds each client once per
+(service, region, endpoint, profile) key and hands the same instance to every
+caller. boto3 clients are thread-safe once created, so a single instance can
+serve all worker threads of a process.
+"""
+import os
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from botocore.config import Config  # type: ignore[import-untyped]
+
+ClientKey = Tuple[str, str, Optional[str], str]
+
+DEFAULT_PROFILE = "default"
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+@dataclass(frozen=True)
+class ClientProfile:
+    """
+    Connection settings shared by every client built with a profile.
+
+    Attributes:
+        max_pool_connections: Size of the urllib3 connection pool per client.
+        tcp_keepalive: Enable TCP keepalive on pooled sockets.
+        connect_timeout: Default connect timeout in seconds.
+        read_timeout: Default read timeout in seconds.
+        max_attempts: Retry attempts for botocore's retry handler.
+        retry_mode: botocore retry mode (legacy, standard or adaptive).
+        service_timeouts: Per-service (connect_timeout, read_timeout) overrides.
+    """
+
+    max_pool_connections: int = 10
+    tcp_keepalive: bool = True
+    connect_timeout: float = 5
+    read_timeout: float = 60
+    max_attempts: int = 3
+    retry_mode: str = "standard"
+    service_timeouts: Dict[str, Tuple[float, float]] = field(default_factory=dict)
+
+    @classmethod
+    def from_env(cls) -> "ClientProfile":
+        """Build the default profile from AWS_* environment variables."""
+        return cls(
+            max_pool_connections=int(os.getenv("AWS_MAX_POOL_CONNECTIONS", "10")),
+            tcp_keepalive=_env_bool("AWS_TCP_KEEPALIVE", True),
+            connect_timeout=float(os.getenv("AWS_CONNECT_TIMEOUT", "5")),
+            read_timeout=float(os.getenv("AWS_READ_TIMEOUT", "60")),
+        )
+
+    def timeouts_for(self, service_name: str) -> Tuple[float, float]:
+        """Get (connect_timeout, read_timeout) for a service."""
+        return self.service_timeouts.get(
+            service_name, (self.connect_timeout, self.read_timeout)
+        )
+
+    def to_config(self, service_name: str) -> Config:
+        """Build the botocore Config for a service."""
+        connect_timeout, read_timeout = self.timeouts_for(service_name)
+        return Config(
+            retries={"max_attempts": self.max_attempts, "mode": self.retry_mode},
+            connect_timeout=connect_timeout,
+            read_timeout=read_timeout,
+            max_pool_connections=self.max_pool_connections,
+            tcp_keepalive=self.tcp_keepalive,
+        )
+
+
+class ClientRegistry:
+    """Thread-safe registry of boto3 clients keyed by service, region, endpoint and profile."""
+
+    def __init__(self) -> None:
+        self._lock = threading.RLock()
+        self._clients: Dict[ClientKey, Any] = {}
+        self._profiles: Dict[str, ClientProfile] = {}
+
+    def configure_profile(self, name: str, profile: ClientProfile) -> None:
+        """
+        Register or replace a client profile.
+
+        Clients already built with the profile are closed so the next
+        lookup picks up the new settings.
+        """
+        with self._lock:
+            self._profiles[name] = profile
+            stale = [key for key in self._clients if key[3] == name]
+            for key in stale:
+                _close_client(self._clients.pop(key))
+
+    def get_profile(self, name: str = DEFAULT_PROFILE) -> ClientProfile:
+        """Get a registered profile; the default profile is built from the environment."""
+        with self._lock:
+            if name not in self._profiles:
+                if name != DEFAULT_PROFILE:
+                    raise KeyError(f"Unknown AWS client profile: {name}")
+                self._profiles[name] = ClientProfile.from_env()
+            return self._profiles[name]
+
+    def get_client(
+        self,
+        service_name: str,
+        region_name: str,
+        endpoint_url: Optional[str],
+        profile: str,
+        factory: Callable[[ClientProfile], Any],
+    ) -> Any:
+        """
+        Get the client for a key, building it with factory on first use.
+
+        Construction happens under the registry lock so concurrent callers
+        never build the same client twice.
+        """
+        key: ClientKey = (service_name, region_name, endpoint_url, profile)
+        client = self._clients.get(key)
+        if client is not None:
+            return client
+
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                client = factory(self.get_profile(profile))
+                self._clients[key] = client
+            return client
+
+    def __len__(self) -> int:
+        return len(self._clients)
+
+    def close_all(self) -> None:
+        """Close every cached client and drop it from the registry."""
+        with self._lock:
+            clients = list(self._clients.values())
+            self._clients.clear()
+        for client in clients:
+            _close_client(client)
+
+    def reset(self) -> None:
+        """
+        Drop cached clients without closing them.
+
+        Used in forked children: the pooled sockets belong to the parent
+        process and must not be shared or shut down from the child.
+        Registered profiles are kept.
+        """
+        self._lock = threading.RLock()
+        self._clients = {}
+
+
+def _close_client(client: Any) -> None:
+    close = getattr(client, "close", None)
+    if callable(close):
+        close()
+
+
+registry = ClientRegistry()
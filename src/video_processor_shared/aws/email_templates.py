@@ -0,0 +1,154 @@
+"""Precompiled notification email templates.
+
+Templates use the Handlebars placeholders SES understands: {{name}} inserts
+an HTML-escaped value and {{{name}}} a raw one. The same source can
+therefore be registered as an SES template for bulk templated sending, or
+rendered locally. Local rendering parses each template once (the compiled
+form is cached) and afterwards only joins literal segments and values.
+"""
+import functools
+import html
+import re
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Mapping, Optional, Tuple
+
+PLACEHOLDER = re.compile(r"{{{\s*(\w+)\s*}}}|{{\s*(\w+)\s*}}")
+
+Renderer = Callable[[Mapping[str, Any]], str]
+
+
+@dataclass(frozen=True)
+class EmailContent:
+    """Subject and bodies of an email, ready to send."""
+
+    subject: str
+    body_text: str
+    body_html: Optional[str] = None
+
+
+@dataclass(frozen=True)
+class EmailTemplate:
+    """
+    Email template with {{placeholders}}.
+
+    Attributes:
+        name: SES template name.
+        subject: Subject source.
+        text: Plain text body source.
+        html: HTML body source, if any.
+    """
+
+    name: str
+    subject: str
+    text: str
+    html: Optional[str] = None
+
+    def render(self, data: Mapping[str, Any]) -> EmailContent:
+        """Render the template locally with the given values."""
+        return EmailContent(
+            subject=compile_template(self.subject)(data),
+            body_text=compile_template(self.text)(data),
+            body_html=compile_template(self.html)(data) if self.html is not None else None,
+        )
+
+    def to_ses(self) -> Dict[str, str]:
+        """Get the Template argument of SES CreateTemplate/UpdateTemplate."""
+        template = {"TemplateName": self.name, "SubjectPart": self.subject, "TextPart": self.text}
+        if self.html is not None:
+            template["HtmlPart"] = self.html
+        return template
+
+
+@functools.lru_cache(maxsize=256)
+def compile_template(source: str) -> Renderer:
+    """
+    Compile a template source into a render function.
+
+    Missing values render as empty strings, as in SES.
+    """
+    literals: List[str] = []
+    placeholders: List[Tuple[str, bool]] = []
+    position = 0
+    for match in PLACEHOLDER.finditer(source):
+        literals.append(source[position:match.start()])
+        raw, escaped = match.groups()
+        placeholders.append((raw, False) if raw else (escaped, True))
+        position = match.end()
+    literals.append(source[position:])
+
+    def render(data: Mapping[str, Any]) -> str:
+        parts = [literals[0]]
+        for (name, escape), literal in zip(placeholders, literals[1:]):
+            value = data.get(name)
+            text = "" if value is None else str(value)
+            parts.append(html.escape(text) if escape else text)
+            parts.append(literal)
+        return "".join(parts)
+
+    return render
+
+
+JOB_COMPLETED_TEMPLATE = EmailTemplate(
+    name="VideoProcessorJobCompleted",
+    subject="✅ Video Processing Complete: {{{video_filename}}}",
+    text="""Hello!
+
+Your video "{{{video_filename}}}" has been processed successfully!
+
+📊 Processing Results:
+- Frames extracted: {{{frame_count}}}
+- Status: COMPLETED
+
+📥 Download your frames:
+{{{download_url}}}
+
+Thank you for using Video Processor!
+
+Best regards,
+Video Processor Team""",
+    html="""<html>
+<body style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
+    <h2 style="color: #22c55e;">✅ Video Processing Complete</h2>
+    <p>Your video <strong>"{{video_filename}}"</strong> has been processed successfully!</p>
+
+    <div style="background: #f3f4f6; padding: 16px; border-radius: 8px; margin: 16px 0;">
+        <h3 style="margin-top: 0;">📊 Processing Results</h3>
+        <ul>
+            <li>Frames extracted: <strong>{{frame_count}}</strong></li>
+            <li>Status: <strong style="color: #22c55e;">COMPLETED</strong></li>
+        </ul>
+    </div>
+
+    <a href="{{download_url}}" style="display: inline-block; background: #3b82f6; color: white; padding: 12px 24px; text-decoration: none; border-radius: 6px; margin: 16px 0;">
+        📥 Download Frames
+    </a>
+
+    <p style="color: #6b7280; font-size: 14px; margin-top: 32px;">
+        Thank you for using Video Processor!<br>
+        Best regards,<br>
+        <strong>Video Processor Team</strong>
+    </p>
+</body>
+</html>""",
+)
+
+JOB_FAILED_TEMPLATE = EmailTemplate(
+    name="VideoProcessorJobFailed",
+    subject="❌ Video Processing Failed: {{{video_filename}}}",
+    text="""Hello!
+
+Unfortunately, we encountered an error processing your video "{{{video_filename}}}".
+
+❌ Error Details:
+{{{error_message}}}
+
+Please try uploading your video again. If the problem persists,
+please contact our support team.
+
+We apologize for the inconvenience.
+
+Best regards,
+Video Processor Team""",
+)
+
+NOTIFICATION_TEMPLATES = (JOB_COMPLETED_TEMPLATE, JOB_FAILED_TEMPLATE)
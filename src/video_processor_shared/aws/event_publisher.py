@@ -0,0 +1,330 @@
+"""Background buffered publishing of domain events to SNS.
+
+BufferedEventPublisher takes SNS round trips off the caller's critical path:
+publish() only enqueues the event in memory, and a background task sends
+queued events with SNSService.publish_batch. The queue is bounded; when it
+is full, the overflow policy decides what happens to new events:
+
+- "block": publish() waits until the queue has room (backpressure)
+- "drop_oldest": the oldest queued event is discarded
+- "spill": the event is appended to a JSON-lines file on local disk and
+  re-queued once there is room (also after a restart)
+
+close() publishes everything still queued or spilled before returning.
+Spill file I/O runs on the shared "events" executor, off the event loop.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import deque
+from dataclasses import dataclass
+from types import TracebackType
+from typing import Any, Callable, Deque, List, Mapping, Optional, Tuple, Type
+
+from video_processor_shared.aws.batching import BatchOperationError, backoff_delay
+from video_processor_shared.aws.executor import get_executor
+from video_processor_shared.aws.sns_service import Event, SNSService, event_payload
+
+logger = logging.getLogger(__name__)
+
+OVERFLOW_POLICIES = ("block", "drop_oldest", "spill")
+
+QueuedEvent = Tuple[float, Mapping[str, Any]]
+
+
+@dataclass(frozen=True)
+class PublisherStats:
+    """
+    Counters and lag of a BufferedEventPublisher.
+
+    Attributes:
+        queued: Events waiting in memory.
+        spilled: Events waiting in the spill file.
+        published: Events published so far.
+        dropped: Events discarded by the drop_oldest policy.
+        failed: Events SNS rejected permanently.
+        lag_seconds: Age of the oldest queued event.
+        last_publish_seconds: Enqueue-to-publish delay of the last published batch.
+    """
+
+    queued: int
+    spilled: int
+    published: int
+    dropped: int
+    failed: int
+    lag_seconds: float
+    last_publish_seconds: float
+
+
+class BufferedEventPublisher:
+    """
+    Publishes events to SNS from a bounded in-memory queue.
+
+    Usage:
+        async with BufferedEventPublisher(SNSService()) as publisher:
+            await publisher.publish(JobCompletedEvent(job_id=job_id, ...))
+        # everything is published when the block exits
+    """
+
+    def __init__(
+        self,
+        sns: SNSService,
+        max_queue: int = 10_000,
+        overflow: str = "block",
+        spill_path: Optional[str] = None,
+        flush_interval: float = 0.2,
+        max_batch_events: int = 100,
+        max_attempts: int = 3,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        """
+        Create a publisher.
+
+        Args:
+            sns: SNSService to publish through
+            max_queue: Maximum events held in memory
+            overflow: "block", "drop_oldest" or "spill"
+            spill_path: JSON-lines file for the spill policy
+            flush_interval: Seconds to wait for more events before sending
+                a partial batch
+            max_batch_events: Events sent per publish_batch call (split into
+                requests of 10)
+            max_attempts: Attempts per event within one publish_batch call
+            clock: Time source, injectable for tests
+        """
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(
+                f"Unknown overflow policy {overflow!r}; expected one of {OVERFLOW_POLICIES}"
+            )
+        if overflow == "spill" and not spill_path:
+            raise ValueError("The spill overflow policy requires spill_path")
+        self.sns = sns
+        self.max_queue = max_queue
+        self.overflow = overflow
+        self.spill_path = spill_path
+        self.flush_interval = flush_interval
+        self.max_batch_events = max_batch_events
+        self.max_attempts = max_attempts
+        self.published = 0
+        self.dropped = 0
+        self.failed = 0
+        self.last_publish_seconds = 0.0
+        self._clock = clock
+        self._queue: Deque[QueuedEvent] = deque()
+        self._spilled = _count_lines(spill_path) if spill_path else 0
+        self._changed: Optional[asyncio.Condition] = None
+        self._task: Optional["asyncio.Task[None]"] = None
+        self._in_flight: List[QueuedEvent] = []
+        self._closed = False
+
+    @property
+    def stats(self) -> PublisherStats:
+        oldest = self._queue[0][0] if self._queue else None
+        return PublisherStats(
+            queued=len(self._queue),
+            spilled=self._spilled,
+            published=self.published,
+            dropped=self.dropped,
+            failed=self.failed,
+            lag_seconds=self._clock() - oldest if oldest is not None else 0.0,
+            last_publish_seconds=self.last_publish_seconds,
+        )
+
+    async def publish(self, event: Event) -> None:
+        """Queue an event for publishing."""
+        if self._closed:
+            raise RuntimeError("BufferedEventPublisher is closed")
+        self.start()
+        changed = self._condition()
+        payload = event_payload(event)
+        async with changed:
+            full = len(self._queue) >= self.max_queue
+            if self.overflow == "spill" and (full or self._spilled):
+                # Spilled events keep their place: once spilling starts, new
+                # events go to the file until it has been drained.
+                await get_executor("events").run(self._spill, [payload])
+                return
+            if full and self.overflow == "block":
+                await changed.wait_for(lambda: len(self._queue) < self.max_queue)
+            elif full:
+                self._queue.popleft()
+                self.dropped += 1
+            self._queue.append((self._clock(), payload))
+            changed.notify_all()
+
+    async def flush(self) -> None:
+        """Wait until every queued and spilled event has been sent."""
+        self.start()
+        changed = self._condition()
+        async with changed:
+            changed.notify_all()
+            await changed.wait_for(
+                lambda: not self._queue and not self._spilled and not self._in_flight
+            )
+
+    def start(self) -> None:
+        """Start the background sender (publish() starts it on first use)."""
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def close(self, timeout: Optional[float] = None) -> None:
+        """
+        Publish everything pending, then stop the background sender.
+
+        Args:
+            timeout: Seconds to wait for pending events (None = no limit).
+                Events still unsent after it are written to spill_path
+                when one is configured, and lost otherwise
+        """
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            await asyncio.wait_for(self.flush(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Closing publisher with %d unsent events", len(self._queue))
+        finally:
+            if self._task is not None:
+                self._task.cancel()
+                await asyncio.gather(self._task, return_exceptions=True)
+                self._task = None
+            async with self._condition():
+                unsent = self._in_flight + list(self._queue)
+                if unsent and self.spill_path:
+                    # In-flight events may have been published: resending them
+                    # after a restart is at-least-once, like SNS itself. They
+                    # are older than anything already spilled, so they go first.
+                    await get_executor("events").run(
+                        self._spill, [payload for _, payload in unsent], True
+                    )
+                self._in_flight = []
+                self._queue.clear()
+
+    async def __aenter__(self) -> "BufferedEventPublisher":
+        self.start()
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        await self.close()
+
+    async def _run(self) -> None:
+        changed = self._condition()
+        attempt = 0
+        while True:
+            async with changed:
+                if self._spilled and self._room_to_unspill():
+                    unspill = asyncio.ensure_future(get_executor("events").run(self._unspill))
+                    try:
+                        await asyncio.shield(unspill)
+                    except asyncio.CancelledError:
+                        # The thread keeps running after a cancel: hold the
+                        # lock until it is done so close() can spill safely.
+                        await unspill
+                        raise
+                if not self._queue:
+                    await changed.wait_for(lambda: bool(self._queue) or bool(self._spilled))
+                    continue
+            if len(self._queue) < 10 and not self._closed:
+                # Give a partial batch a moment to fill up.
+                await asyncio.sleep(self.flush_interval)
+
+            async with changed:
+                count = min(len(self._queue), self.max_batch_events)
+                batch = [self._queue.popleft() for _ in range(count)]
+                self._in_flight = batch
+                changed.notify_all()
+            try:
+                retry = await self._send(batch)
+            except Exception:
+                logger.exception("Publishing %d events to %s failed", count, self.sns.topic_name)
+                retry = batch
+            async with changed:
+                self._queue.extendleft(reversed(retry))
+                self._in_flight = []
+                changed.notify_all()
+            if retry:
+                attempt += 1
+                await asyncio.sleep(backoff_delay(attempt, base=0.5, cap=30.0))
+            else:
+                attempt = 0
+
+    async def _send(self, batch: List[QueuedEvent]) -> List[QueuedEvent]:
+        try:
+            await self.sns.publish_batch(
+                [payload for _, payload in batch], max_attempts=self.max_attempts
+            )
+        except BatchOperationError as error:
+            retry = []
+            for index, failure in error.failures.items():
+                if failure.sender_fault:
+                    self.failed += 1
+                    logger.error("SNS rejected event %s: %s", batch[index][1].get("event_id"), failure)
+                else:
+                    retry.append(batch[index])
+            self._record_published(batch, len(batch) - len(error.failures))
+            return retry
+        self._record_published(batch, len(batch))
+        return []
+
+    def _record_published(self, batch: List[QueuedEvent], count: int) -> None:
+        self.published += count
+        if batch:
+            self.last_publish_seconds = self._clock() - batch[0][0]
+
+    def _spill(self, payloads: List[Mapping[str, Any]], first: bool = False) -> None:
+        assert self.spill_path is not None
+        lines = [json.dumps(payload, default=str) + "\n" for payload in payloads]
+        if first and self._spilled:
+            with open(self.spill_path, "r", encoding="utf-8") as handle:
+                lines.extend(handle.readlines())
+            self._rewrite_spill(lines)
+        else:
+            with open(self.spill_path, "a", encoding="utf-8") as handle:
+                handle.writelines(lines)
+        self._spilled += len(payloads)
+
+    def _room_to_unspill(self) -> bool:
+        # The file is rewritten on every unspill, so wait until a full batch
+        # (or everything left) fits instead of moving one event at a time.
+        wanted = min(self._spilled, self.max_batch_events, self.max_queue)
+        return self.max_queue - len(self._queue) >= wanted
+
+    def _unspill(self) -> None:
+        room = self.max_queue - len(self._queue)
+        if not self._spilled or room <= 0 or self.spill_path is None:
+            return
+        with open(self.spill_path, "r", encoding="utf-8") as handle:
+            lines = handle.readlines()
+        now = self._clock()
+        for line in lines[:room]:
+            self._queue.append((now, json.loads(line)))
+        remaining = lines[room:]
+        self._rewrite_spill(remaining)
+        self._spilled = len(remaining)
+
+    def _rewrite_spill(self, lines: List[str]) -> None:
+        assert self.spill_path is not None
+        temporary = f"{self.spill_path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as handle:
+            handle.writelines(lines)
+        os.replace(temporary, self.spill_path)
+
+    def _condition(self) -> asyncio.Condition:
+        if self._changed is None:
+            self._changed = asyncio.Condition()
+        return self._changed
+
+
+def _count_lines(path: str) -> int:
+    try:
+        with open(path, "r", encoding="utf-8") as handle:
+            return sum(1 for _ in handle)
+    except FileNotFoundError:
+        return 0
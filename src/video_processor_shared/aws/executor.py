@@ -0,0 +1,161 @@
+"""Async execution layer for blocking boto3 calls.
+
+boto3 is synchronous: calling it from a coroutine blocks the event loop for
+the whole request, including 20 second SQS long polls and large S3 transfers.
+AsyncExecutor runs those calls on a bounded thread pool dedicated to one
+service, so a slow S3 upload cannot starve SQS polling and neither of them
+blocks the loop.
+"""
+import asyncio
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, TypeVar
+
+T = TypeVar("T")
+
+_DEFAULT_TIMEOUT: Any = object()
+
+
+class AsyncExecutor:
+    """
+    Bounded thread pool that exposes blocking calls as awaitables.
+
+    At most max_workers calls run at once; extra calls wait in the pool
+    queue. Cancelling the awaiting task (directly or through a timeout)
+    removes a queued call before it starts. A call that already started
+    runs to completion in its thread, but its result is discarded.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_workers: int = 10,
+        timeout: Optional[float] = None,
+    ) -> None:
+        """
+        Create an executor.
+
+        Args:
+            name: Name used for worker threads (usually the AWS service)
+            max_workers: Maximum number of concurrent blocking calls
+            timeout: Default timeout in seconds for each call (None = no timeout)
+        """
+        self.name = name
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self._pool = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix=f"aws-{name}",
+        )
+
+    async def run(
+        self,
+        func: Callable[..., T],
+        *args: Any,
+        timeout: Optional[float] = _DEFAULT_TIMEOUT,
+        **kwargs: Any,
+    ) -> T:
+        """
+        Run func(*args, **kwargs) on the pool and await its result.
+
+        Args:
+            func: Blocking callable, typically a bound boto3 client method
+            timeout: Per-call timeout overriding the executor default
+
+        Raises:
+            asyncio.TimeoutError: If the call does not finish in time
+        """
+        if timeout is _DEFAULT_TIMEOUT:
+            timeout = self.timeout
+
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._pool, functools.partial(func, *args, **kwargs))
+        if timeout is None:
+            return await future
+        return await asyncio.wait_for(future, timeout)
+
+    def resize(self, max_workers: int, timeout: Optional[float] = None) -> None:
+        """
+        Change the limits in place.
+
+        New calls go to a pool of the new size. Calls already submitted
+        finish on the old pool, which is released once they are done.
+        """
+        previous = self._pool
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self._pool = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix=f"aws-{self.name}",
+        )
+        previous.shutdown(wait=False)
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Stop accepting calls and cancel the ones still queued."""
+        self._pool.shutdown(wait=wait, cancel_futures=True)
+
+
+_executors: Dict[str, AsyncExecutor] = {}
+_lock = threading.Lock()
+
+
+def _default_max_workers(service_name: str) -> int:
+    value = os.getenv(f"AWS_{service_name.upper()}_MAX_CONCURRENCY")
+    return int(value or os.getenv("AWS_MAX_CONCURRENCY") or "10")
+
+
+def get_executor(service_name: str) -> AsyncExecutor:
+    """
+    Get the shared executor for a service.
+
+    The pool size comes from AWS_<SERVICE>_MAX_CONCURRENCY, falling back
+    to AWS_MAX_CONCURRENCY (default: 10).
+    """
+    with _lock:
+        executor = _executors.get(service_name)
+        if executor is None:
+            executor = AsyncExecutor(service_name, _default_max_workers(service_name))
+            _executors[service_name] = executor
+        return executor
+
+
+def configure_executor(
+    service_name: str,
+    max_workers: int,
+    timeout: Optional[float] = None,
+) -> AsyncExecutor:
+    """
+    Set new limits on the shared executor for a service.
+
+    An existing executor is resized in place, so services that already
+    hold it keep working with the new limits.
+    """
+    with _lock:
+        executor = _executors.get(service_name)
+        if executor is None:
+            executor = AsyncExecutor(service_name, max_workers, timeout)
+            _executors[service_name] = executor
+            return executor
+    executor.resize(max_workers, timeout)
+    return executor
+
+
+def shutdown_executors(wait: bool = True) -> None:
+    """Shut down every shared executor, e.g. on application shutdown."""
+    with _lock:
+        executors = list(_executors.values())
+        _executors.clear()
+    for executor in executors:
+        executor.shutdown(wait=wait)
+
+
+def _reset_after_fork() -> None:
+    global _lock
+    _lock = threading.Lock()
+    _executors.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
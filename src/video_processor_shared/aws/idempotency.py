@@ -0,0 +1,229 @@
+"""Idempotency stores for at-least-once message consumption.
+
+SQS and SNS may deliver a message more than once. An idempotency store
+records the ids of messages and events that were processed successfully so
+consumers can skip redeliveries before running the handler. Entries expire
+after a TTL, which should exceed the longest redelivery window (the queue's
+message retention period is a safe upper bound).
+
+InMemoryIdempotencyStore keeps a bounded LRU per process.
+SQLiteIdempotencyStore and FileIdempotencyStore persist entries on local
+disk so they survive restarts. Their methods block on disk I/O; async
+callers run them on an executor.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, List, Mapping, Optional
+
+from video_processor_shared.aws.cache import LRUCache
+
+DEFAULT_TTL = 24 * 60 * 60
+
+
+class IdempotencyStore(ABC):
+    """Set of processed keys with expiry."""
+
+    @abstractmethod
+    def seen(self, key: str) -> bool:
+        """Check whether a key was marked processed and has not expired."""
+
+    @abstractmethod
+    def mark(self, key: str) -> None:
+        """Record a key as processed."""
+
+
+class InMemoryIdempotencyStore(IdempotencyStore):
+    """Process-local idempotency store bounded by an LRU."""
+
+    def __init__(
+        self,
+        max_entries: int = 100_000,
+        ttl: float = DEFAULT_TTL,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.ttl = ttl
+        self._entries: LRUCache[str, bool] = LRUCache(max_entries=max_entries, ttl=ttl, clock=clock)
+
+    def seen(self, key: str) -> bool:
+        return key in self._entries
+
+    def mark(self, key: str, ttl: Optional[float] = None) -> None:
+        self._entries.set(key, True, ttl=ttl)
+
+
+class SQLiteIdempotencyStore(IdempotencyStore):
+    """Idempotency store persisted in a local SQLite database."""
+
+    def __init__(
+        self,
+        path: str,
+        ttl: float = DEFAULT_TTL,
+        cache_size: int = 10_000,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        """
+        Open (and create if needed) a store database.
+
+        Args:
+            path: SQLite database file
+            ttl: Seconds a key is remembered
+            cache_size: Keys kept in the in-memory LRU in front of SQLite
+            clock: Wall-clock time source, injectable for tests
+        """
+        self.path = path
+        self.ttl = ttl
+        self._clock = clock
+        self._cache = InMemoryIdempotencyStore(cache_size, ttl, clock)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS processed ("
+            "key TEXT PRIMARY KEY, expires_at REAL NOT NULL)"
+        )
+        self.prune()
+
+    def seen(self, key: str) -> bool:
+        if self._cache.seen(key):
+            return True
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM processed WHERE key = ? AND expires_at > ?", (key, self._clock())
+            ).fetchone()
+        return row is not None
+
+    def mark(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO processed (key, expires_at) VALUES (?, ?)",
+                (key, self._clock() + self.ttl),
+            )
+        self._cache.mark(key)
+
+    def prune(self) -> int:
+        """Delete expired keys and return how many were removed."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM processed WHERE expires_at <= ?", (self._clock(),)
+            )
+        return int(cursor.rowcount)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class FileIdempotencyStore(IdempotencyStore):
+    """
+    Idempotency store backed by an append-only JSON-lines file.
+
+    Every mark appends one line; the file is compacted to its live keys
+    when the store is opened. Every live key is also indexed in memory, so
+    lookups never read the file. Suited to a single process per file.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        ttl: float = DEFAULT_TTL,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.path = path
+        self.ttl = ttl
+        self._clock = clock
+        self._live: Dict[str, float] = {}
+        self._prune_at = 0
+        self._lock = threading.Lock()
+        self._compact()
+        self._file = open(path, "a", encoding="utf-8")
+
+    def seen(self, key: str) -> bool:
+        with self._lock:
+            expires_at = self._live.get(key)
+        return expires_at is not None and expires_at > self._clock()
+
+    def mark(self, key: str) -> None:
+        expires_at = self._clock() + self.ttl
+        with self._lock:
+            self._file.write(json.dumps({"key": key, "expires_at": expires_at}) + "\n")
+            self._file.flush()
+            self._live[key] = expires_at
+            if len(self._live) >= self._prune_at:
+                self._prune()
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+    def _compact(self) -> None:
+        now = self._clock()
+        live: Dict[str, float] = {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as handle:
+                for line in handle:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # Torn final line from a crash mid-write.
+                        continue
+                    if entry["expires_at"] > now:
+                        live[entry["key"]] = entry["expires_at"]
+        except FileNotFoundError:
+            pass
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as handle:
+            for key, expires_at in sorted(live.items(), key=lambda item: item[1]):
+                handle.write(json.dumps({"key": key, "expires_at": expires_at}) + "\n")
+        os.replace(temporary, self.path)
+        self._live = live
+        self._prune_at = 2 * len(live) + 1024
+
+    def _prune(self) -> None:
+        # Drop expired keys from the index once it doubled since the last prune.
+        now = self._clock()
+        self._live = {key: expires_at for key, expires_at in self._live.items() if expires_at > now}
+        self._prune_at = 2 * len(self._live) + 1024
+
+
+def idempotency_keys(message: Mapping[str, Any]) -> List[str]:
+    """
+    Get the keys identifying a received message.
+
+    The SQS message id catches redeliveries of one message; the event id of
+    a domain event body also catches the same event sent twice.
+    """
+    keys = [f"message:{message['message_id']}"]
+    body = message["body"]
+    if isinstance(body, Mapping) and body.get("event_id"):
+        keys.append(f"event:{body['event_id']}")
+    return keys
+
+
+_default_store: Optional[IdempotencyStore] = None
+_default_lock = threading.Lock()
+
+
+def default_idempotency_store() -> IdempotencyStore:
+    """
+    Get the process-wide idempotency store.
+
+    IDEMPOTENCY_STORE_PATH selects a persistent store: SQLite for paths
+    ending in .db, .sqlite or .sqlite3, an append-only file otherwise.
+    IDEMPOTENCY_TTL_SECONDS sets the TTL (default: 86400).
+    """
+    global _default_store
+    with _default_lock:
+        if _default_store is None:
+            path = os.getenv("IDEMPOTENCY_STORE_PATH")
+            ttl = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", str(DEFAULT_TTL)))
+            if not path:
+                _default_store = InMemoryIdempotencyStore(ttl=ttl)
+            elif path.endswith((".db", ".sqlite", ".sqlite3")):
+                _default_store = SQLiteIdempotencyStore(path, ttl=ttl)
+            else:
+                _default_store = FileIdempotencyStore(path, ttl=ttl)
+        return _default_store
@@ -0,0 +1,167 @@
+"""Received queue messages with lazily loaded bodies."""
+from typing import Any, Dict, ItemsView, Iterator, List, Optional, ValuesView
+
+from video_processor_shared.aws.claim_check import (
+    ClaimCheckStore,
+    is_claim_check,
+    sns_notification,
+)
+from video_processor_shared.aws.serializers import JSON_CONTENT_TYPE, serializer_for
+
+
+class QueueMessage(Dict[str, Any]):
+    """
+    A received SQS message.
+
+    A dict {"message_id", "body", "receipt_handle"}, as returned by
+    receive_messages, whose body is decoded with the serializer named by its
+    content_type attribute (and, for claim-check pointers, downloaded from S3)
+    only when it is first accessed, so routers can dispatch on attributes
+    without touching it. A body that is an SNS notification envelope (a
+    subscription without RawMessageDelivery) decodes to the envelope; its
+    Message is decoded too when the envelope tags it with a non-JSON
+    content_type, since that text is unreadable as is. Anything that reads
+    every value (items(), values(), copy(), json.dumps, ==) loads the body
+    first. Accessing "body" on a claim-check pointer downloads it
+    synchronously; async code should ``await message.load_body()`` first.
+    """
+
+    KEYS = ("message_id", "body", "receipt_handle")
+
+    def __init__(
+        self,
+        message_id: str,
+        receipt_handle: str,
+        raw_body: str,
+        attributes: Optional[Dict[str, str]] = None,
+        message_attributes: Optional[Dict[str, Any]] = None,
+        claim_checks: Optional[ClaimCheckStore] = None,
+    ) -> None:
+        super().__init__(message_id=message_id, receipt_handle=receipt_handle)
+        self.raw_body = raw_body
+        self.attributes = attributes or {}
+        self.message_attributes = message_attributes or {}
+        self._claim_checks = claim_checks
+        self._loaded = False
+
+    @classmethod
+    def from_response(
+        cls,
+        message: Dict[str, Any],
+        claim_checks: Optional[ClaimCheckStore] = None,
+    ) -> "QueueMessage":
+        """Build from an entry of a ReceiveMessage response."""
+        return cls(
+            message_id=message["MessageId"],
+            receipt_handle=message["ReceiptHandle"],
+            raw_body=message["Body"],
+            attributes=message.get("Attributes"),
+            message_attributes=message.get("MessageAttributes"),
+            claim_checks=claim_checks,
+        )
+
+    @property
+    def message_id(self) -> str:
+        return str(super().__getitem__("message_id"))
+
+    @property
+    def receipt_handle(self) -> str:
+        return str(super().__getitem__("receipt_handle"))
+
+    @property
+    def group_id(self) -> Optional[str]:
+        """FIFO message group, if the message came from a FIFO queue."""
+        return self.attributes.get("MessageGroupId")
+
+    @property
+    def is_claim_check(self) -> bool:
+        return is_claim_check(self.raw_body)
+
+    @property
+    def body(self) -> Any:
+        if self._pending():
+            text = self.raw_body
+            if self._claim_checks is not None and self.is_claim_check:
+                text = self._claim_checks.fetch(text)
+            self._store_body(text)
+        return super().__getitem__("body")
+
+    async def load_body(self) -> Any:
+        """Decode the body, resolving a claim check without blocking the loop."""
+        if self._pending():
+            text = self.raw_body
+            if self._claim_checks is not None:
+                text = await self._claim_checks.resolve(text)
+            self._store_body(text)
+        return super().__getitem__("body")
+
+    def attribute(self, name: str, default: Optional[str] = None) -> Optional[str]:
+        """Get the string value of a message attribute."""
+        attribute = self.message_attributes.get(name)
+        if attribute is None:
+            return default
+        return str(attribute.get("StringValue", default))
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Plain dict copy, e.g. to pickle for a process pool."""
+        return {key: self[key] for key in self}
+
+    def _pending(self) -> bool:
+        return not self._loaded and not super().__contains__("body")
+
+    def _store_body(self, text: str) -> None:
+        body = _decode_notification(text)
+        if body is None:
+            body = serializer_for(self.message_attributes).loads(text)
+        super().__setitem__("body", body)
+        self._loaded = True
+
+    def __missing__(self, key: str) -> Any:
+        if key == "body" and self._pending():
+            return self.body
+        raise KeyError(key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self[key] if key in self else default
+
+    def __contains__(self, key: object) -> bool:
+        return super().__contains__(key) or (key == "body" and self._pending())
+
+    def __iter__(self) -> Iterator[str]:
+        keys: List[str] = [key for key in self.KEYS if key in self]
+        keys.extend(key for key in super().__iter__() if key not in self.KEYS)
+        return iter(keys)
+
+    def __len__(self) -> int:
+        return super().__len__() + (1 if self._pending() else 0)
+
+    def keys(self) -> List[str]:  # type: ignore[override]
+        return list(self)
+
+    def items(self) -> ItemsView[str, Any]:  # type: ignore[override]
+        return self.to_dict().items()
+
+    def values(self) -> ValuesView[Any]:  # type: ignore[override]
+        return self.to_dict().values()
+
+    def copy(self) -> Dict[str, Any]:
+        return self.to_dict()
+
+    def __eq__(self, other: object) -> bool:
+        return self.to_dict() == other
+
+    def __ne__(self, other: object) -> bool:
+        return not self == other
+
+    def __repr__(self) -> str:
+        return f"QueueMessage(message_id={self.message_id!r})"
+
+
+def _decode_notification(text: str) -> Optional[Dict[str, Any]]:
+    envelope = sns_notification(text)
+    if envelope is None:
+        return None
+    serializer = serializer_for(envelope.get("MessageAttributes") or {})
+    if serializer.content_type != JSON_CONTENT_TYPE:
+        envelope["Message"] = serializer.loads(envelope["Message"])
+    return envelope
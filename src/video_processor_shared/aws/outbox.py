@@ -0,0 +1,463 @@
+"""Durable local outbox for domain events.
+
+Publishing straight to SNS after committing job state loses the event if
+the process dies in between. With an outbox, the event is appended to
+local durable storage first (a local write, no network round trip), and an
+OutboxRelay publishes pending records in batches and checkpoints what was
+sent, so every appended event is published at least once.
+
+SQLiteOutbox stores records in a WAL-mode SQLite database; callers that
+keep their own state in the same database pass their connection to append()
+so the event commits or rolls back with that state. FileOutbox appends JSON
+lines to a file and keeps the checkpoint in a separate file.
+
+Records are keyed by an aggregate id (by default the event's job_id). Each
+round, the relay publishes the pending records in waves: a wave holds the
+next record of every aggregate and is only sent once the previous wave was
+published, and an aggregate stops at its first failure. Events of one job
+are therefore published in the order they were appended, while a round
+still drains every job's backlog.
+"""
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from dataclasses import dataclass
+from types import TracebackType
+from typing import Any, Deque, Dict, Iterable, List, Mapping, Optional, Set, Tuple, Type, Union
+
+from video_processor_shared.aws.batching import BatchOperationError, backoff_delay
+from video_processor_shared.aws.executor import get_executor
+from video_processor_shared.aws.sns_service import Event, SNSService, event_payload
+from video_processor_shared.aws.sqs_service import SQSService
+
+logger = logging.getLogger(__name__)
+
+SQLiteConnection = Union[sqlite3.Connection, sqlite3.Cursor]
+
+
+@dataclass(frozen=True)
+class OutboxRecord:
+    """
+    An event waiting in the outbox.
+
+    Attributes:
+        id: Sequence number, increasing in append order.
+        aggregate_id: Key whose records are published in order (None = unordered).
+        payload: Message payload.
+        created_at: Wall-clock time the record was appended.
+    """
+
+    id: int
+    aggregate_id: Optional[str]
+    payload: Dict[str, Any]
+    created_at: float
+
+
+class Outbox(ABC):
+    """Durable queue of events to publish."""
+
+    @abstractmethod
+    def append(self, event: Event, aggregate_id: Optional[str] = None) -> int:
+        """
+        Append an event and return its record id.
+
+        Args:
+            event: Domain event or dictionary payload
+            aggregate_id: Ordering key (default: the payload's job_id)
+        """
+
+    @abstractmethod
+    def pending(self, limit: int = 100) -> List[OutboxRecord]:
+        """Get the oldest unpublished records, in append order."""
+
+    @abstractmethod
+    def acknowledge(self, record_ids: Iterable[int]) -> None:
+        """Checkpoint records as published."""
+
+
+class SQLiteOutbox(Outbox):
+    """Outbox stored in a local SQLite database."""
+
+    def __init__(self, path: str) -> None:
+        """
+        Open (and create if needed) an outbox database.
+
+        Args:
+            path: SQLite database file
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS outbox ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, aggregate_id TEXT, payload TEXT NOT NULL, "
+            "created_at REAL NOT NULL, published_at REAL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS outbox_pending ON outbox (id) WHERE published_at IS NULL"
+        )
+
+    def append(
+        self,
+        event: Event,
+        aggregate_id: Optional[str] = None,
+        connection: Optional[SQLiteConnection] = None,
+    ) -> int:
+        """
+        Append an event and return its record id.
+
+        Args:
+            event: Domain event or dictionary payload
+            aggregate_id: Ordering key (default: the payload's job_id)
+            connection: Connection (or cursor) to the outbox database with
+                an open transaction; the record is inserted in it and
+                commits with the caller's own changes (default: the
+                outbox's connection, committed immediately)
+        """
+        return self.append_all([event], aggregate_id, connection)[0]
+
+    def append_all(
+        self,
+        events: Iterable[Event],
+        aggregate_id: Optional[str] = None,
+        connection: Optional[SQLiteConnection] = None,
+    ) -> List[int]:
+        """Append several events in one transaction (see append)."""
+        rows = [_record_row(event, aggregate_id) for event in events]
+        if connection is not None:
+            return [_insert(connection, row) for row in rows]
+        ids = []
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for row in rows:
+                    ids.append(_insert(self._conn, row))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return ids
+
+    def pending(self, limit: int = 100) -> List[OutboxRecord]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, aggregate_id, payload, created_at FROM outbox "
+                "WHERE published_at IS NULL ORDER BY id LIMIT ?",
+                (limit,),
+            ).fetchall()
+        return [OutboxRecord(row[0], row[1], json.loads(row[2]), row[3]) for row in rows]
+
+    def acknowledge(self, record_ids: Iterable[int]) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE outbox SET published_at = ? WHERE id = ?",
+                [(now, record_id) for record_id in record_ids],
+            )
+
+    def prune(self, older_than: float) -> int:
+        """Delete records published more than older_than seconds ago."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM outbox WHERE published_at IS NOT NULL AND published_at < ?",
+                (time.time() - older_than,),
+            )
+        return int(cursor.rowcount)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class FileOutbox(Outbox):
+    """
+    Outbox stored as an append-only JSON-lines file.
+
+    The checkpoint file holds the highest id below which every record was
+    published. Records acknowledged out of order past it are remembered in
+    memory only, so after a restart they may be published again. The log
+    is truncated once every record in it has been published. Suited to a
+    single process per directory.
+    """
+
+    def __init__(self, directory: str) -> None:
+        """
+        Open (and create if needed) an outbox directory.
+
+        Args:
+            directory: Directory for the log and checkpoint files
+        """
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.log_path = os.path.join(directory, "outbox.jsonl")
+        self.checkpoint_path = os.path.join(directory, "checkpoint")
+        self._lock = threading.Lock()
+        self._checkpoint = self._read_checkpoint()
+        self._acknowledged: Set[int] = set()
+        self._records: Deque[OutboxRecord] = deque(
+            record for record in self._read_log() if record.id > self._checkpoint
+        )
+        self._next_id = max([self._checkpoint] + [record.id for record in self._records]) + 1
+        if not self._records:
+            self._truncate()
+        self._log = open(self.log_path, "a", encoding="utf-8")
+
+    def append(self, event: Event, aggregate_id: Optional[str] = None) -> int:
+        aggregate, payload, created_at = _record_row(event, aggregate_id)
+        with self._lock:
+            record = OutboxRecord(self._next_id, aggregate, json.loads(payload), created_at)
+            line = json.dumps(
+                {"id": record.id, "aggregate_id": aggregate, "payload": payload, "created_at": created_at}
+            )
+            self._log.write(line + "\n")
+            self._log.flush()
+            os.fsync(self._log.fileno())
+            self._records.append(record)
+            self._next_id += 1
+        return record.id
+
+    def pending(self, limit: int = 100) -> List[OutboxRecord]:
+        with self._lock:
+            records: List[OutboxRecord] = []
+            for record in self._records:
+                if len(records) >= limit:
+                    break
+                if record.id not in self._acknowledged:
+                    records.append(record)
+            return records
+
+    def acknowledge(self, record_ids: Iterable[int]) -> None:
+        with self._lock:
+            self._acknowledged.update(record_ids)
+            checkpoint = self._checkpoint
+            while self._records and self._records[0].id in self._acknowledged:
+                record = self._records.popleft()
+                self._acknowledged.discard(record.id)
+                checkpoint = record.id
+            if checkpoint == self._checkpoint:
+                return
+            self._checkpoint = checkpoint
+            _write_atomic(self.checkpoint_path, str(checkpoint))
+            if not self._records:
+                self._log.close()
+                self._truncate()
+                self._log = open(self.log_path, "a", encoding="utf-8")
+
+    def close(self) -> None:
+        with self._lock:
+            self._log.close()
+
+    def _read_checkpoint(self) -> int:
+        try:
+            with open(self.checkpoint_path, "r", encoding="utf-8") as handle:
+                return int(handle.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def _read_log(self) -> List[OutboxRecord]:
+        records = []
+        try:
+            with open(self.log_path, "r", encoding="utf-8") as handle:
+                for line in handle:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # Torn final line from a crash mid-append.
+                        continue
+                    records.append(
+                        OutboxRecord(
+                            entry["id"],
+                            entry["aggregate_id"],
+                            json.loads(entry["payload"]),
+                            entry["created_at"],
+                        )
+                    )
+        except FileNotFoundError:
+            pass
+        return records
+
+    def _truncate(self) -> None:
+        # The checkpoint keeps ids increasing across truncations.
+        _write_atomic(self.checkpoint_path, str(self._next_id - 1))
+        _write_atomic(self.log_path, "")
+
+
+class OutboxRelay:
+    """
+    Publishes outbox records to SNS or SQS in batches.
+
+    Usage:
+        outbox = SQLiteOutbox("/var/lib/worker/outbox.db")
+        outbox.append(JobCompletedEvent(job_id=job_id, ...))
+        async with OutboxRelay(outbox, SNSService()):
+            ...  # records are relayed in the background
+    """
+
+    def __init__(
+        self,
+        outbox: Outbox,
+        target: Union[SNSService, SQSService],
+        batch_size: int = 100,
+        interval: float = 0.5,
+        max_attempts: int = 3,
+    ) -> None:
+        """
+        Create a relay.
+
+        Args:
+            outbox: Outbox to drain
+            target: SNSService (uses publish_batch) or SQSService (uses send_messages)
+            batch_size: Pending records read per round
+            interval: Seconds to wait between rounds when the outbox is empty
+            max_attempts: Attempts per record within a round
+        """
+        self.outbox = outbox
+        self.target = target
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_attempts = max_attempts
+        self.relayed = 0
+        self.failed = 0
+        self._task: Optional["asyncio.Task[None]"] = None
+
+    async def relay_once(self) -> int:
+        """
+        Publish one round of pending records.
+
+        Returns:
+            Number of records checkpointed (published or permanently rejected)
+        """
+        checkpointed = 0
+        stopped: Set[str] = set()
+        # Outbox reads and checkpoints hit the disk; keep them off the loop.
+        executor = get_executor("outbox")
+        for wave in _waves(await executor.run(self.outbox.pending, self.batch_size)):
+            # Concurrent batches and retries may reorder records, so a record
+            # only goes out once the one before it in its aggregate was sent.
+            records = [record for record in wave if record.aggregate_id not in stopped]
+            if not records:
+                break
+            done = await self._relay(records)
+            await executor.run(self.outbox.acknowledge, [record.id for record in done])
+            checkpointed += len(done)
+            stopped.update(
+                record.aggregate_id
+                for record in records
+                if record.aggregate_id is not None and record not in done
+            )
+        return checkpointed
+
+    async def _relay(self, records: List[OutboxRecord]) -> List[OutboxRecord]:
+        try:
+            await self._send([record.payload for record in records])
+        except BatchOperationError as error:
+            done = []
+            for index, record in enumerate(records):
+                failure = error.failures.get(index)
+                if failure is None:
+                    self.relayed += 1
+                elif failure.sender_fault:
+                    # Retrying a rejected record would block its aggregate forever.
+                    self.failed += 1
+                    logger.error("Outbox record %d was rejected: %s", record.id, failure)
+                else:
+                    continue
+                done.append(record)
+            return done
+        self.relayed += len(records)
+        return records
+
+    async def drain(self) -> None:
+        """Relay rounds until the outbox has no pending records."""
+        while await get_executor("outbox").run(self.outbox.pending, 1):
+            if not await self.relay_once():
+                raise RuntimeError("Outbox relay made no progress")
+
+    def start(self) -> None:
+        """Start relaying in the background."""
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def __aenter__(self) -> "OutboxRelay":
+        self.start()
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        await self.close()
+
+    async def _send(self, payloads: List[Dict[str, Any]]) -> None:
+        if isinstance(self.target, SNSService):
+            await self.target.publish_batch(payloads, max_attempts=self.max_attempts)
+        else:
+            await self.target.send_messages(payloads, max_attempts=self.max_attempts)
+
+    async def _run(self) -> None:
+        attempt = 0
+        while True:
+            try:
+                relayed = await self.relay_once()
+                attempt = 0
+            except Exception:
+                attempt += 1
+                logger.exception("Outbox relay round failed")
+                await asyncio.sleep(backoff_delay(attempt, base=0.5, cap=30.0))
+                continue
+            if not relayed:
+                await asyncio.sleep(self.interval)
+
+
+def _waves(records: List[OutboxRecord]) -> List[List[OutboxRecord]]:
+    # Wave n holds the n-th pending record of every aggregate; records
+    # without an aggregate are unordered and all go in the first wave.
+    waves: List[List[OutboxRecord]] = []
+    depth: Dict[str, int] = {}
+    for record in records:
+        index = 0
+        if record.aggregate_id is not None:
+            index = depth.get(record.aggregate_id, 0)
+            depth[record.aggregate_id] = index + 1
+        if index == len(waves):
+            waves.append([])
+        waves[index].append(record)
+    return waves
+
+
+def _insert(connection: SQLiteConnection, row: Tuple[Optional[str], str, float]) -> int:
+    cursor = connection.execute(
+        "INSERT INTO outbox (aggregate_id, payload, created_at) VALUES (?, ?, ?)", row
+    )
+    return int(cursor.lastrowid or 0)
+
+
+def _record_row(event: Event, aggregate_id: Optional[str]) -> Tuple[Optional[str], str, float]:
+    payload: Mapping[str, Any] = event_payload(event)
+    if aggregate_id is None and payload.get("job_id") is not None:
+        aggregate_id = str(payload["job_id"])
+    return aggregate_id, json.dumps(payload, default=str), time.time()
+
+
+def _write_atomic(path: str, content: str) -> None:
+    temporary = f"{path}.tmp"
+    with open(temporary, "w", encoding="utf-8") as handle:
+        handle.write(content)
+        handle.flush()
+        os.fsync(handle.fileno())
+    os.replace(temporary, path)
@@ -0,0 +1,250 @@
+"""Parallel byte-range downloads from S3.
+
+The object is split into fixed-size ranges that are fetched over several
+connections and written straight into a preallocated destination file (or a
+memory map of it). Ranges are scheduled in order, so the beginning of the
+file lands first: callers can start reading the first N bytes while the rest
+is still downloading.
+"""
+import asyncio
+import mmap
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, List, Optional, Set
+
+from video_processor_shared.aws.transfer import MIB
+
+ProgressCallback = Callable[[int, int], None]
+
+READ_CHUNK_SIZE = 1 * MIB
+
+
+class DownloadCancelledError(Exception):
+    """Raised when a ranged download is cancelled before it finishes."""
+
+
+class RangedDownload:
+    """
+    Handle for an in-progress ranged download.
+
+    Attributes:
+        destination: Local path being written.
+        size: Total object size in bytes.
+        prefix_bytes: Number of leading bytes signalled by wait_for_prefix.
+    """
+
+    def __init__(self, destination: str, size: int, part_size: int, prefix_bytes: int) -> None:
+        self.destination = destination
+        self.size = size
+        self.part_size = part_size
+        self.prefix_bytes = min(prefix_bytes, size)
+        self.bytes_downloaded = 0
+        self._lock = threading.Lock()
+        self._completed_parts: Set[int] = set()
+        self._contiguous_parts = 0
+        self._cancelled = threading.Event()
+        self._prefix: "Future[int]" = _running_future()
+        self._done: "Future[str]" = _running_future()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    @property
+    def done(self) -> bool:
+        return self._done.done()
+
+    def cancel(self) -> None:
+        """Stop the download; in-flight ranges stop at their next chunk."""
+        self._cancelled.set()
+
+    def result(self, timeout: Optional[float] = None) -> str:
+        """Block until the download finishes and return the destination path."""
+        return self._done.result(timeout)
+
+    def prefix(self, timeout: Optional[float] = None) -> int:
+        """Block until the first prefix_bytes are on disk and return that count."""
+        return self._prefix.result(timeout)
+
+    async def wait(self) -> str:
+        """Wait for the whole download to finish."""
+        return await asyncio.wrap_future(self._done)
+
+    async def wait_for_prefix(self) -> int:
+        """Wait until the first prefix_bytes bytes are readable at destination."""
+        return await asyncio.wrap_future(self._prefix)
+
+    def _add_bytes(self, count: int) -> int:
+        with self._lock:
+            self.bytes_downloaded += count
+            return self.bytes_downloaded
+
+    def _part_completed(self, index: int) -> None:
+        with self._lock:
+            self._completed_parts.add(index)
+            while self._contiguous_parts in self._completed_parts:
+                self._contiguous_parts += 1
+            contiguous_bytes = min(self.size, self._contiguous_parts * self.part_size)
+            if contiguous_bytes >= self.prefix_bytes and not self._prefix.done():
+                self._prefix.set_result(self.prefix_bytes)
+
+    def _finish(self) -> None:
+        with self._lock:
+            if not self._prefix.done():
+                self._prefix.set_result(self.prefix_bytes)
+            if not self._done.done():
+                self._done.set_result(self.destination)
+
+    def _fail(self, error: BaseException) -> None:
+        self._cancelled.set()
+        with self._lock:
+            for future in (self._prefix, self._done):
+                if not future.done():
+                    future.set_exception(error)
+
+
+class RangedDownloader:
+    """Multi-connection S3 downloader writing ranges into a preallocated file."""
+
+    def __init__(
+        self,
+        client: Any,
+        part_size: int = 8 * MIB,
+        max_concurrency: int = 8,
+        use_mmap: bool = False,
+    ) -> None:
+        """
+        Create a downloader.
+
+        Args:
+            client: boto3 S3 client
+            part_size: Size of each ranged GET in bytes
+            max_concurrency: Number of ranges fetched in parallel
+            use_mmap: Write through a memory map instead of positional writes
+        """
+        self.client = client
+        self.part_size = part_size
+        self.max_concurrency = max_concurrency
+        self.use_mmap = use_mmap
+
+    def start(
+        self,
+        bucket: str,
+        key: str,
+        destination: str,
+        prefix_bytes: int = 0,
+        progress_callback: Optional[ProgressCallback] = None,
+    ) -> RangedDownload:
+        """
+        Start downloading an object and return immediately.
+
+        Blocks only for the HEAD request that sizes the object.
+
+        Args:
+            bucket: Source bucket
+            key: Source object key
+            destination: Local file path (created or truncated)
+            prefix_bytes: Leading byte count that wait_for_prefix waits for
+            progress_callback: Called with (bytes_downloaded, total_bytes)
+
+        Returns:
+            RangedDownload handle
+        """
+        head = self.client.head_object(Bucket=bucket, Key=key)
+        size = int(head["ContentLength"])
+        etag = head.get("ETag")
+
+        download = RangedDownload(destination, size, self.part_size, prefix_bytes)
+        with open(destination, "wb") as handle:
+            handle.truncate(size)
+        if size == 0:
+            download._finish()
+            return download
+
+        fd = os.open(destination, os.O_RDWR | getattr(os, "O_BINARY", 0))
+        mapped = mmap.mmap(fd, size) if self.use_mmap else None
+        ranges = [
+            (index, offset, min(offset + self.part_size, size) - 1)
+            for index, offset in enumerate(range(0, size, self.part_size))
+        ]
+
+        write_lock = threading.Lock()
+
+        def write(offset: int, data: bytes) -> None:
+            if mapped is not None:
+                mapped[offset:offset + len(data)] = data
+            elif hasattr(os, "pwrite"):
+                os.pwrite(fd, data, offset)
+            else:  # pragma: no cover - Windows has no positional writes
+                with write_lock:
+                    os.lseek(fd, offset, os.SEEK_SET)
+                    os.write(fd, data)
+
+        def fetch(index: int, start: int, end: int) -> None:
+            if download.cancelled:
+                raise DownloadCancelledError(f"Download of {key} was cancelled")
+            params = {"Bucket": bucket, "Key": key, "Range": f"bytes={start}-{end}"}
+            if etag:
+                params["IfMatch"] = etag
+            body = self.client.get_object(**params)["Body"]
+            offset = start
+            while offset <= end:
+                if download.cancelled:
+                    raise DownloadCancelledError(f"Download of {key} was cancelled")
+                data = body.read(min(READ_CHUNK_SIZE, end - offset + 1))
+                if not data:
+                    raise IOError(f"Unexpected end of stream for {key} at byte {offset}")
+                write(offset, data)
+                offset += len(data)
+                total = download._add_bytes(len(data))
+                if progress_callback is not None:
+                    progress_callback(total, size)
+            download._part_completed(index)
+
+        pool = ThreadPoolExecutor(
+            max_workers=min(self.max_concurrency, len(ranges)),
+            thread_name_prefix="s3-range",
+        )
+        futures: List["Future[None]"] = [pool.submit(fetch, *part) for part in ranges]
+        remaining = [len(futures)]
+        remaining_lock = threading.Lock()
+
+        def on_part_done(future: "Future[None]") -> None:
+            error = future.exception()
+            if error is not None:
+                download._fail(error)
+            with remaining_lock:
+                remaining[0] -= 1
+                last = remaining[0] == 0
+            if last:
+                if mapped is not None:
+                    mapped.flush()
+                    mapped.close()
+                os.close(fd)
+                pool.shutdown(wait=False)
+                # Resolves only if no range failed; _fail already settled it otherwise.
+                download._finish()
+
+        for future in futures:
+            future.add_done_callback(on_part_done)
+
+        return download
+
+    def download(
+        self,
+        bucket: str,
+        key: str,
+        destination: str,
+        progress_callback: Optional[ProgressCallback] = None,
+    ) -> str:
+        """Download an object and block until it is complete."""
+        return self.start(bucket, key, destination, progress_callback=progress_callback).result()
+
+
+def _running_future() -> Future:
+    # A running future cannot be cancelled by asyncio.wrap_future, so one
+    # cancelled waiter does not break the handle for other waiters.
+    future: Future = Future()
+    future.set_running_or_notify_cancel()
+    return future
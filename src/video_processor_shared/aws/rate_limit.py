@@ -0,0 +1,134 @@
+"""Token buckets for pacing calls to rate-limited AWS APIs.
+
+A bucket holds up to capacity tokens and refills at a fixed rate; callers
+take one token per unit of work (for SES, one per recipient) before calling
+the API. shared_token_bucket hands out one bucket per name per process, so
+every sender of the same account draws from the same budget.
+"""
+import asyncio
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket.
+
+    Tokens refill continuously at rate per second, up to capacity. While
+    the bucket is paused, no tokens are handed out.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        capacity: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        """
+        Create a full bucket.
+
+        Args:
+            rate: Tokens added per second
+            capacity: Maximum tokens (default: one second of rate, at least 1)
+            clock: Time source, injectable for tests
+        """
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._paused_until = 0.0
+
+    def configure(self, rate: float, capacity: Optional[float] = None) -> None:
+        """Change the refill rate and capacity, keeping the current tokens."""
+        with self._lock:
+            self._refill()
+            self.rate = rate
+            self.capacity = capacity if capacity is not None else max(rate, 1.0)
+            self._tokens = min(self._tokens, self.capacity)
+
+    def try_acquire(self, tokens: float = 1.0) -> float:
+        """
+        Take tokens if available.
+
+        A request for more tokens than the bucket holds is granted once it
+        is full and leaves it in debt, so later callers wait for the excess.
+
+        Returns:
+            0 when the tokens were taken, otherwise the seconds to wait
+            until they would be available
+        """
+        with self._lock:
+            self._refill()
+            paused = self._paused_until - self._updated
+            if paused > 0:
+                return paused
+            needed = min(tokens, self.capacity)
+            if self._tokens >= needed:
+                self._tokens -= tokens
+                return 0.0
+            if self.rate <= 0:
+                return float("inf")
+            return (needed - self._tokens) / self.rate
+
+    async def acquire(self, tokens: float = 1.0) -> None:
+        """Wait until tokens are available and take them."""
+        while True:
+            wait = self.try_acquire(tokens)
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+    def drain(self) -> None:
+        """Discard the available tokens, e.g. after SES reported throttling."""
+        with self._lock:
+            self._refill()
+            self._tokens = min(self._tokens, 0.0)
+
+    def pause(self, seconds: float) -> None:
+        """
+        Discard the available tokens and hand out none for seconds, e.g.
+        after SES reported throttling. Overlapping pauses end with the
+        latest one.
+        """
+        with self._lock:
+            self._refill()
+            self._tokens = min(self._tokens, 0.0)
+            self._paused_until = max(self._paused_until, self._updated + seconds)
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+
+_buckets: Dict[str, TokenBucket] = {}
+_buckets_lock = threading.Lock()
+
+
+def shared_token_bucket(name: str = "ses", rate: float = 1.0) -> TokenBucket:
+    """
+    Get the process-wide token bucket for a name.
+
+    The bucket is created with rate on first use; schedulers reconfigure it
+    from the account quota.
+    """
+    with _buckets_lock:
+        bucket = _buckets.get(name)
+        if bucket is None:
+            bucket = TokenBucket(rate)
+            _buckets[name] = bucket
+        return bucket
+
+
+def _reset_after_fork() -> None:
+    global _buckets_lock
+    _buckets_lock = threading.Lock()
+    _buckets.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
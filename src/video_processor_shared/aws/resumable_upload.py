@@ -0,0 +1,261 @@
+"""Resumable S3 multipart uploads with local checkpoints.
+
+The multipart upload id and the ETag of every completed part are persisted
+to a checkpoint file as the upload progresses. When a worker restarts and
+uploads the same file again, the upload continues from the parts S3 already
+has instead of starting over. Stale multipart uploads left behind by
+processes that never came back are aborted by abort_stale_multipart_uploads.
+"""
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from datetime import UTC, datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from botocore.exceptions import ClientError  # type: ignore[import-untyped]
+
+from video_processor_shared.aws.transfer import MIB, MIN_PART_SIZE
+
+
+@dataclass
+class UploadCheckpoint:
+    """
+    Persisted state of an in-progress multipart upload.
+
+    Attributes:
+        bucket: Destination bucket.
+        key: Destination key.
+        upload_id: S3 multipart upload id.
+        source: Absolute path of the file being uploaded.
+        size: Source size when the upload started.
+        mtime: Source modification time when the upload started.
+        part_size: Part size used for the upload.
+        parts: ETag of every completed part, by part number.
+    """
+
+    bucket: str
+    key: str
+    upload_id: str
+    source: str
+    size: int
+    mtime: float
+    part_size: int
+    parts: Dict[int, str] = field(default_factory=dict)
+
+    def matches(self, path: str) -> bool:
+        """Check the source file is unchanged since the checkpoint was written."""
+        stat = os.stat(path)
+        return stat.st_size == self.size and stat.st_mtime == self.mtime
+
+    @classmethod
+    def load(cls, path: str) -> Optional["UploadCheckpoint"]:
+        try:
+            with open(path, "r", encoding="utf-8") as handle:
+                data = json.load(handle)
+        except (OSError, ValueError):
+            return None
+        data["parts"] = {int(number): etag for number, etag in data.get("parts", {}).items()}
+        return cls(**data)
+
+    def save(self, path: str) -> None:
+        """Write the checkpoint atomically."""
+        temporary = f"{path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as handle:
+            json.dump(asdict(self), handle)
+        os.replace(temporary, path)
+
+
+class ResumableUploader:
+    """Multipart uploader that checkpoints completed parts to local disk."""
+
+    def __init__(
+        self,
+        client: Any,
+        checkpoint_dir: str,
+        part_size: int = 8 * MIB,
+        max_concurrency: int = 4,
+    ) -> None:
+        """
+        Create an uploader.
+
+        Args:
+            client: boto3 S3 client
+            checkpoint_dir: Directory for checkpoint files (created if missing)
+            part_size: Part size for new uploads (at least 5 MiB)
+            max_concurrency: Parts uploaded in parallel
+        """
+        self.client = client
+        self.checkpoint_dir = checkpoint_dir
+        self.part_size = max(part_size, MIN_PART_SIZE)
+        self.max_concurrency = max_concurrency
+        os.makedirs(checkpoint_dir, exist_ok=True)
+
+    def checkpoint_path(self, checkpoint_id: str) -> str:
+        name = hashlib.sha256(checkpoint_id.encode()).hexdigest()
+        return os.path.join(self.checkpoint_dir, f"{name}.json")
+
+    def upload_file(
+        self,
+        path: str,
+        bucket: str,
+        key: str,
+        content_type: str,
+        checkpoint_id: Optional[str] = None,
+    ) -> str:
+        """
+        Upload a file, resuming a checkpointed upload of it if one exists.
+
+        Args:
+            path: Local file to upload
+            bucket: Destination bucket
+            key: Destination key for a new upload
+            content_type: Content type of the object
+            checkpoint_id: Identifies the upload across restarts
+                (default: bucket, key and source path)
+
+        Returns:
+            The key the file was uploaded to; a resumed upload keeps the
+            key it was started with
+        """
+        path = os.path.abspath(path)
+        checkpoint_file = self.checkpoint_path(checkpoint_id or f"{bucket}\0{key}\0{path}")
+        stat = os.stat(path)
+
+        if stat.st_size <= self.part_size:
+            with open(path, "rb") as handle:
+                self.client.put_object(Bucket=bucket, Key=key, Body=handle, ContentType=content_type)
+            return key
+
+        checkpoint = self._resume(checkpoint_file, path)
+        if checkpoint is None:
+            response = self.client.create_multipart_upload(
+                Bucket=bucket, Key=key, ContentType=content_type
+            )
+            checkpoint = UploadCheckpoint(
+                bucket=bucket,
+                key=key,
+                upload_id=response["UploadId"],
+                source=path,
+                size=stat.st_size,
+                mtime=stat.st_mtime,
+                part_size=self.part_size,
+            )
+            checkpoint.save(checkpoint_file)
+
+        self._upload_missing_parts(checkpoint, checkpoint_file)
+        self.client.complete_multipart_upload(
+            Bucket=checkpoint.bucket,
+            Key=checkpoint.key,
+            UploadId=checkpoint.upload_id,
+            MultipartUpload={
+                "Parts": [
+                    {"PartNumber": number, "ETag": etag}
+                    for number, etag in sorted(checkpoint.parts.items())
+                ]
+            },
+        )
+        os.remove(checkpoint_file)
+        return checkpoint.key
+
+    def _resume(self, checkpoint_file: str, path: str) -> Optional[UploadCheckpoint]:
+        checkpoint = UploadCheckpoint.load(checkpoint_file)
+        if checkpoint is None:
+            return None
+        if not checkpoint.matches(path):
+            self._abort(checkpoint)
+            return None
+        try:
+            # S3 is the source of truth for which parts arrived.
+            checkpoint.parts = self._list_parts(checkpoint)
+        except ClientError as error:
+            if error.response.get("Error", {}).get("Code") != "NoSuchUpload":
+                raise
+            return None
+        return checkpoint
+
+    def _list_parts(self, checkpoint: UploadCheckpoint) -> Dict[int, str]:
+        parts: Dict[int, str] = {}
+        args: Dict[str, Any] = {
+            "Bucket": checkpoint.bucket,
+            "Key": checkpoint.key,
+            "UploadId": checkpoint.upload_id,
+        }
+        while True:
+            response = self.client.list_parts(**args)
+            for part in response.get("Parts", []):
+                parts[int(part["PartNumber"])] = part["ETag"]
+            if not response.get("IsTruncated"):
+                return parts
+            args["PartNumberMarker"] = response["NextPartNumberMarker"]
+
+    def _upload_missing_parts(self, checkpoint: UploadCheckpoint, checkpoint_file: str) -> None:
+        part_count = -(-checkpoint.size // checkpoint.part_size)
+        missing = [
+            number for number in range(1, part_count + 1) if number not in checkpoint.parts
+        ]
+        lock = threading.Lock()
+
+        def upload(number: int) -> None:
+            with open(checkpoint.source, "rb") as handle:
+                handle.seek((number - 1) * checkpoint.part_size)
+                body = handle.read(checkpoint.part_size)
+            response = self.client.upload_part(
+                Bucket=checkpoint.bucket,
+                Key=checkpoint.key,
+                UploadId=checkpoint.upload_id,
+                PartNumber=number,
+                Body=body,
+            )
+            with lock:
+                checkpoint.parts[number] = response["ETag"]
+                checkpoint.save(checkpoint_file)
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as pool:
+            for future in [pool.submit(upload, number) for number in missing]:
+                future.result()
+
+    def _abort(self, checkpoint: UploadCheckpoint) -> None:
+        try:
+            self.client.abort_multipart_upload(
+                Bucket=checkpoint.bucket, Key=checkpoint.key, UploadId=checkpoint.upload_id
+            )
+        except ClientError:
+            pass
+
+
+def abort_stale_multipart_uploads(
+    client: Any,
+    bucket: str,
+    older_than: timedelta,
+    prefix: str = "",
+) -> List[str]:
+    """
+    Abort multipart uploads that were started longer ago than older_than.
+
+    Args:
+        client: boto3 S3 client
+        bucket: Bucket to sweep
+        older_than: Minimum age of an upload to abort
+        prefix: Only consider keys under this prefix
+
+    Returns:
+        Upload ids that were aborted
+    """
+    cutoff = datetime.now(UTC) - older_than
+    aborted: List[str] = []
+    args: Dict[str, Any] = {"Bucket": bucket, "Prefix": prefix}
+    while True:
+        response = client.list_multipart_uploads(**args)
+        for upload in response.get("Uploads", []):
+            if upload["Initiated"] < cutoff:
+                client.abort_multipart_upload(
+                    Bucket=bucket, Key=upload["Key"], UploadId=upload["UploadId"]
+                )
+                aborted.append(upload["UploadId"])
+        if not response.get("IsTruncated"):
+            return aborted
+        args["KeyMarker"] = response["NextKeyMarker"]
+        args["UploadIdMarker"] = response["NextUploadIdMarker"]
@@ -1,12 +1,109 @@
 """S3 Storage Service using boto3.
 
-Works with both LocalStack and real AWS S3.
+Works with both LocalStack and real AWS S3. Blocking boto3 calls run on the
+shared "s3" executor so they never block the event loop.
 """
+import asyncio
+import hashlib
+import mimetypes
 import os
-from typing import BinaryIO, Optional
+import tempfile
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, BinaryIO, Dict, Iterable, List, Optional, Tuple
 from uuid import uuid4
 
+from botocore.exceptions import ClientError  # type: ignore[import-untyped]
+
 from video_processor_shared.aws import get_s3_client
+from video_processor_shared.aws.cache import LRUCache
+from video_processor_shared.aws.checksum_index import ChecksumIndex, default_checksum_index
+from video_processor_shared.aws.executor import AsyncExecutor, get_executor
+from video_processor_shared.aws.ranged_download import (
+    ProgressCallback,
+    RangedDownload,
+    RangedDownloader,
+)
+from video_processor_shared.aws.resumable_upload import (
+    ResumableUploader,
+    abort_stale_multipart_uploads,
+)
+from video_processor_shared.aws.transfer import TransferProfile
+from video_processor_shared.aws.video_cache import LocalVideoCache
+from video_processor_shared.aws.zip_stream import FrameData, FramesZipWriter
+
+# (endpoint, access key, bucket, key, expires_in)
+PresignCacheKey = Tuple[str, str, str, str, int]
+
+# Shared by every service instance so per-request services still hit the cache.
+_presigned_urls: LRUCache[PresignCacheKey, str] = LRUCache(
+    max_entries=int(os.getenv("S3_PRESIGN_CACHE_SIZE", "10000"))
+)
+
+# DeleteObjects accepts at most 1000 keys per request.
+MAX_DELETE_BATCH = 1000
+
+
+@dataclass
+class DeleteResult:
+    """
+    Outcome of a batch deletion.
+
+    Attributes:
+        deleted: Keys that were deleted.
+        errors: Keys that could not be deleted, mapped to the S3 error.
+    """
+
+    deleted: List[str] = field(default_factory=list)
+    errors: Dict[str, str] = field(default_factory=dict)
+
+    @property
+    def ok(self) -> bool:
+        """Check if every key was deleted."""
+        return not self.errors
+
+    def merge(self, other: "DeleteResult") -> "DeleteResult":
+        """Add the keys of another result to this one."""
+        self.deleted.extend(other.deleted)
+        self.errors.update(other.errors)
+        return self
+
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+@dataclass(frozen=True)
+class VideoUploadResult:
+    """
+    Outcome of a deduplicated video upload.
+
+    Attributes:
+        key: S3 key holding the video content.
+        checksum: SHA-256 of the content (hex).
+        deduplicated: True when identical content was already stored and
+            key points at it; processing output for that key can be reused.
+    """
+
+    key: str
+    checksum: str
+    deduplicated: bool = False
+
+
+class _HashingReader:
+    """Read-only wrapper hashing content as it is streamed to S3."""
+
+    def __init__(self, file: BinaryIO) -> None:
+        self._file = file
+        self._hash = hashlib.sha256()
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._file.read(size)
+        self._hash.update(data)
+        return data
+
+    def hexdigest(self) -> str:
+        return self._hash.hexdigest()
 
 
 class S3StorageService:
@@ -16,8 +113,30 @@ class S3StorageService:
         self,
         input_bucket: Optional[str] = None,
         output_bucket: Optional[str] = None,
+        executor: Optional[AsyncExecutor] = None,
+        transfer_profile: Optional[TransferProfile] = None,
+        presign_cache: Optional[LRUCache[PresignCacheKey, str]] = None,
+        presign_min_remaining: Optional[int] = None,
+        checksum_index: Optional[ChecksumIndex] = None,
+        video_cache: Optional[LocalVideoCache] = None,
+        checkpoint_dir: Optional[str] = None,
     ) -> None:
         self.client = get_s3_client()
+        self.executor = executor or get_executor("s3")
+        self.transfer_profile = transfer_profile or TransferProfile.from_env()
+        self.presign_cache = _presigned_urls if presign_cache is None else presign_cache
+        self.presign_min_remaining: int = (
+            presign_min_remaining
+            if presign_min_remaining is not None
+            else int(os.getenv("S3_PRESIGN_MIN_REMAINING_SECONDS", "300"))
+        )
+        self.checksum_index = checksum_index or default_checksum_index()
+        self.video_cache = video_cache or default_video_cache()
+        self.checkpoint_dir: str = (
+            checkpoint_dir
+            or os.getenv("S3_CHECKPOINT_DIR")
+            or os.path.join(tempfile.gettempdir(), "video-processor-uploads")
+        )
         self.input_bucket: str = input_bucket or os.getenv("S3_INPUT_BUCKET") or "video-uploads"
         self.output_bucket: str = output_bucket or os.getenv("S3_OUTPUT_BUCKET") or "video-outputs"
 
@@ -26,52 +145,341 @@ class S3StorageService:
         file: BinaryIO,
         filename: str,
         user_id: str,
+        content_type: Optional[str] = None,
+        file_size: Optional[int] = None,
+        transfer_profile: Optional[TransferProfile] = None,
     ) -> str:
         """
         Upload a video file to S3.
 
+        Args:
+            file: Readable binary file object
+            filename: Original filename
+            user_id: Owner of the video
+            content_type: MIME type (default: guessed from filename)
+            file_size: Size in bytes (e.g. VideoUploadDTO.file_size), used to size parts
+            transfer_profile: Per-call override of the service transfer profile
+
         Returns the S3 key of the uploaded file.
         """
         key = f"videos/{user_id}/{uuid4()}/{filename}"
+        await self._upload_video_object(
+            file, key, filename, content_type, file_size, transfer_profile
+        )
+        return key
 
-        self.client.upload_fileobj(
-            file,
+    async def upload_video_deduplicated(
+        self,
+        file: BinaryIO,
+        filename: str,
+        user_id: str,
+        content_type: Optional[str] = None,
+        file_size: Optional[int] = None,
+        transfer_profile: Optional[TransferProfile] = None,
+    ) -> VideoUploadResult:
+        """
+        Upload a video unless the user already uploaded identical content.
+
+        The SHA-256 of the content is looked up in the checksum index
+        (scoped per user). Seekable files are hashed before uploading, so a
+        duplicate is never sent. Non-seekable streams are hashed while they
+        upload; a duplicate is then deleted again and the existing key
+        returned.
+
+        Args:
+            Same as upload_video.
+
+        Returns:
+            VideoUploadResult with the key and whether it was deduplicated
+        """
+        if _is_seekable(file):
+            checksum = await self.executor.run(_hash_seekable, file)
+            existing = await self._find_existing(user_id, checksum)
+            if existing is not None:
+                return VideoUploadResult(existing, checksum, deduplicated=True)
+            key = await self.upload_video(
+                file, filename, user_id, content_type, file_size, transfer_profile
+            )
+        else:
+            reader = _HashingReader(file)
+            key = await self.upload_video(
+                reader,  # type: ignore[arg-type]
+                filename,
+                user_id,
+                content_type,
+                file_size,
+                transfer_profile,
+            )
+            checksum = reader.hexdigest()
+            existing = await self._find_existing(user_id, checksum)
+            if existing is not None:
+                await self.delete_video(key)
+                return VideoUploadResult(existing, checksum, deduplicated=True)
+
+        await self.executor.run(self.checksum_index.put, _index_key(user_id, checksum), key)
+        return VideoUploadResult(key, checksum)
+
+    async def upload_video_resumable(
+        self,
+        file_path: str,
+        filename: str,
+        user_id: str,
+        content_type: Optional[str] = None,
+        transfer_profile: Optional[TransferProfile] = None,
+    ) -> str:
+        """
+        Upload a local video file so an interrupted upload can be resumed.
+
+        Completed parts are checkpointed under checkpoint_dir. Calling this
+        again for the same file and user after a restart continues the
+        original upload (and keeps its key) instead of starting over.
+
+        Returns the S3 key of the uploaded file.
+        """
+        key = f"videos/{user_id}/{uuid4()}/{filename}"
+        checkpoint_id = f"video\0{self.input_bucket}\0{user_id}\0{os.path.abspath(file_path)}"
+        uploader = self._resumable_uploader(file_path, transfer_profile)
+        return await self.executor.run(
+            uploader.upload_file,
+            file_path,
             self.input_bucket,
             key,
-            ExtraArgs={"ContentType": "video/mp4"},
+            content_type or _guess_content_type(filename),
+            checkpoint_id,
         )
 
-        return key
+    async def abort_stale_uploads(self, older_than: timedelta = timedelta(days=1)) -> List[str]:
+        """
+        Abort multipart uploads left behind in both buckets.
+
+        Returns the aborted upload ids.
+        """
+        aborted = await asyncio.gather(
+            self.executor.run(
+                abort_stale_multipart_uploads, self.client, self.input_bucket, older_than, "videos/"
+            ),
+            self.executor.run(
+                abort_stale_multipart_uploads, self.client, self.output_bucket, older_than, "frames/"
+            ),
+        )
+        return [upload_id for upload_ids in aborted for upload_id in upload_ids]
+
+    def _resumable_uploader(
+        self,
+        file_path: str,
+        transfer_profile: Optional[TransferProfile],
+    ) -> ResumableUploader:
+        profile = (transfer_profile or self.transfer_profile).for_size(_file_size(file_path))
+        return ResumableUploader(
+            self.client,
+            self.checkpoint_dir,
+            part_size=profile.part_size,
+            max_concurrency=profile.effective_concurrency,
+        )
+
+    async def _find_existing(self, user_id: str, checksum: str) -> Optional[str]:
+        index_key = _index_key(user_id, checksum)
+        existing = await self.executor.run(self.checksum_index.get, index_key)
+        if existing is None:
+            return None
+        try:
+            await self.executor.run(self.client.head_object, Bucket=self.input_bucket, Key=existing)
+        except ClientError as error:
+            if error.response.get("Error", {}).get("Code") not in ("404", "NoSuchKey"):
+                raise
+            # The indexed object was deleted since; upload again.
+            await self.executor.run(self.checksum_index.discard, index_key)
+            return None
+        return existing
+
+    async def _upload_video_object(
+        self,
+        file: BinaryIO,
+        key: str,
+        filename: str,
+        content_type: Optional[str],
+        file_size: Optional[int],
+        transfer_profile: Optional[TransferProfile],
+    ) -> None:
+        profile = (transfer_profile or self.transfer_profile).for_size(file_size)
+        await self.executor.run(
+            self.client.upload_fileobj,
+            file,
+            self.input_bucket,
+            key,
+            ExtraArgs={"ContentType": content_type or _guess_content_type(filename)},
+            Config=profile.to_transfer_config(),
+        )
 
     async def download_video(self, key: str, destination: str) -> None:
-        """Download a video from S3 to local path."""
-        self.client.download_file(self.input_bucket, key, destination)
+        """
+        Download a video from S3 to local path.
+
+        With a video cache configured, the object's ETag is checked and a
+        cached copy is delivered instead of downloading it again.
+        """
+        if self.video_cache is None:
+            await self.executor.run(self.client.download_file, self.input_bucket, key, destination)
+            return
+
+        head = await self.executor.run(self.client.head_object, Bucket=self.input_bucket, Key=key)
+        etag = head["ETag"]
+        await self.executor.run(
+            self.video_cache.fetch,
+            key,
+            etag,
+            destination,
+            lambda path: self._download_version(key, path, etag, head.get("VersionId")),
+        )
+
+    def _download_version(
+        self, key: str, path: str, etag: str, version_id: Optional[str]
+    ) -> None:
+        # New content must never be cached under the ETag the HEAD saw:
+        # pin versioned objects to that version, and check the others again
+        # afterwards (download_file does not accept IfMatch).
+        if version_id:
+            self.client.download_file(
+                self.input_bucket, key, path, ExtraArgs={"VersionId": version_id}
+            )
+            return
+        self.client.download_file(self.input_bucket, key, path)
+        current = self.client.head_object(Bucket=self.input_bucket, Key=key)["ETag"]
+        if current != etag:
+            raise RuntimeError(f"s3://{self.input_bucket}/{key} changed during download")
+
+    async def start_video_download(
+        self,
+        key: str,
+        destination: str,
+        prefix_bytes: int = 0,
+        progress_callback: Optional[ProgressCallback] = None,
+        use_mmap: bool = False,
+    ) -> RangedDownload:
+        """
+        Start a parallel byte-range download of a video.
+
+        Ranges are fetched over several connections (part size and
+        concurrency come from the transfer profile) and written in place
+        into a preallocated file, so frame extraction can begin as soon as
+        the first prefix_bytes are on disk.
+
+        Args:
+            key: S3 object key in the input bucket
+            destination: Local file path
+            prefix_bytes: Leading byte count to signal early via wait_for_prefix()
+            progress_callback: Called with (bytes_downloaded, total_bytes)
+            use_mmap: Write ranges through a memory map of the destination
+
+        Returns:
+            RangedDownload handle; await wait() for the complete file
+
+        Usage:
+            download = await storage.start_video_download(key, "/tmp/video.mp4", 4 * MIB)
+            await download.wait_for_prefix()   # container header is readable
+            await download.wait()
+        """
+        downloader = RangedDownloader(
+            self.client,
+            part_size=self.transfer_profile.part_size,
+            max_concurrency=self.transfer_profile.effective_concurrency,
+            use_mmap=use_mmap,
+        )
+        return await self.executor.run(
+            downloader.start,
+            self.input_bucket,
+            key,
+            destination,
+            prefix_bytes=prefix_bytes,
+            progress_callback=progress_callback,
+        )
 
     async def upload_frames_zip(
         self,
         file_path: str,
         job_id: str,
+        transfer_profile: Optional[TransferProfile] = None,
+        resumable: bool = False,
     ) -> str:
         """
         Upload processed frames ZIP to output bucket.
 
+        With resumable=True completed parts are checkpointed, and a retry
+        after a restart continues the interrupted upload.
+
         Returns the S3 key of the uploaded file.
         """
         key = f"frames/{job_id}/frames.zip"
+        if resumable:
+            uploader = self._resumable_uploader(file_path, transfer_profile)
+            return await self.executor.run(
+                uploader.upload_file, file_path, self.output_bucket, key, "application/zip"
+            )
+
+        profile = (transfer_profile or self.transfer_profile).for_size(_file_size(file_path))
 
-        self.client.upload_file(
+        await self.executor.run(
+            self.client.upload_file,
             file_path,
             self.output_bucket,
             key,
             ExtraArgs={"ContentType": "application/zip"},
+            Config=profile.to_transfer_config(),
         )
 
         return key
 
+    def open_frames_zip_writer(
+        self,
+        job_id: str,
+        transfer_profile: Optional[TransferProfile] = None,
+    ) -> FramesZipWriter:
+        """
+        Open a streaming writer for the frames ZIP of a job.
+
+        Frames are zipped and uploaded as multipart parts while extraction
+        is still running, without a local ZIP file. JPEG/PNG frames are
+        stored uncompressed. The writer is synchronous and meant to be
+        driven from the extraction thread.
+
+        Returns a FramesZipWriter targeting frames/{job_id}/frames.zip.
+        """
+        profile = transfer_profile or self.transfer_profile
+        return FramesZipWriter(
+            self.client,
+            self.output_bucket,
+            f"frames/{job_id}/frames.zip",
+            part_size=profile.part_size,
+            max_concurrency=profile.effective_concurrency,
+        )
+
+    async def upload_frames(
+        self,
+        frames: Iterable[Tuple[str, FrameData]],
+        job_id: str,
+        transfer_profile: Optional[TransferProfile] = None,
+    ) -> str:
+        """
+        Stream (name, bytes-or-path) frames into the job's frames ZIP.
+
+        Returns the S3 key of the uploaded file.
+        """
+        def write_all() -> str:
+            with self.open_frames_zip_writer(job_id, transfer_profile) as writer:
+                for name, data in frames:
+                    writer.add_frame(name, data)
+            return writer.key
+
+        return await self.executor.run(write_all)
+
     def get_download_url(self, key: str, expires_in: int = 3600) -> str:
         """
         Generate a presigned URL for downloading a file.
 
+        A URL signed earlier for the same key and expiration is reused while
+        it still has at least presign_min_remaining seconds left, which
+        keeps repeated status polls cheap and their responses stable.
+
         Args:
             key: S3 object key
             expires_in: URL expiration time in seconds (default: 1 hour)
@@ -79,13 +487,172 @@ class S3StorageService:
         Returns:
             Presigned URL string
         """
-        url = self.client.generate_presigned_url(
-            "get_object",
-            Params={"Bucket": self.output_bucket, "Key": key},
-            ExpiresIn=expires_in,
+        access_key, credentials_expire_at = _signing_credentials(self.client)
+        cache_key: PresignCacheKey = (
+            str(self.client.meta.endpoint_url),
+            access_key,
+            self.output_bucket,
+            key,
+            expires_in,
         )
-        return str(url)
+        url = self.presign_cache.get(cache_key)
+        if url is None:
+            url = str(self.client.generate_presigned_url(
+                "get_object",
+                Params={"Bucket": self.output_bucket, "Key": key},
+                ExpiresIn=expires_in,
+            ))
+            reusable_for = float(expires_in - self.presign_min_remaining)
+            if credentials_expire_at is not None:
+                # A URL signed with temporary credentials stops working when they expire.
+                reusable_for = min(
+                    reusable_for, credentials_expire_at - time.time() - self.presign_min_remaining
+                )
+            if reusable_for > 0:
+                self.presign_cache.set(cache_key, url, ttl=reusable_for)
+        return url
+
+    def get_download_urls(self, keys: Iterable[str], expires_in: int = 3600) -> Dict[str, str]:
+        """
+        Generate presigned URLs for many keys in one pass.
+
+        Returns a mapping of key to presigned URL, reusing cached URLs.
+        """
+        return {key: self.get_download_url(key, expires_in) for key in keys}
 
     async def delete_video(self, key: str) -> None:
         """Delete a video from S3."""
-        self.client.delete_object(Bucket=self.input_bucket, Key=key)
+        await self.executor.run(self.client.delete_object, Bucket=self.input_bucket, Key=key)
+
+    async def delete_videos(self, keys: Iterable[str]) -> DeleteResult:
+        """
+        Delete many videos from the input bucket.
+
+        Keys are sent in DeleteObjects batches of 1000, and batches run
+        concurrently on the S3 executor.
+
+        Returns a DeleteResult listing deleted keys and per-key errors.
+        """
+        keys = list(keys)
+        batches = [
+            keys[start:start + MAX_DELETE_BATCH]
+            for start in range(0, len(keys), MAX_DELETE_BATCH)
+        ]
+        results = await asyncio.gather(
+            *(self._delete_batch(self.input_bucket, batch) for batch in batches)
+        )
+        return _merge_results(results)
+
+    async def delete_user_data(self, user_id: str, job_ids: Iterable[str] = ()) -> DeleteResult:
+        """
+        Delete every object stored for a user.
+
+        Removes everything under videos/{user_id}/ in the input bucket and
+        frames/{job_id}/ in the output bucket for the given jobs. Frame keys
+        do not carry the user id, so the caller passes the user's job ids.
+        Prefixes are listed and deleted concurrently.
+
+        Returns a DeleteResult listing deleted keys and per-key errors.
+        """
+        prefixes = [(self.input_bucket, f"videos/{user_id}/")]
+        prefixes += [(self.output_bucket, f"frames/{job_id}/") for job_id in job_ids]
+        results = await asyncio.gather(
+            *(self._delete_prefix(bucket, prefix) for bucket, prefix in prefixes)
+        )
+        return _merge_results(results)
+
+    async def _delete_prefix(self, bucket: str, prefix: str) -> DeleteResult:
+        pending: List["asyncio.Future[DeleteResult]"] = []
+        list_args: Dict[str, Any] = {"Bucket": bucket, "Prefix": prefix}
+        while True:
+            page = await self.executor.run(self.client.list_objects_v2, **list_args)
+            keys = [item["Key"] for item in page.get("Contents", [])]
+            if keys:
+                # Delete this page while the next one is being listed.
+                pending.append(asyncio.ensure_future(self._delete_batch(bucket, keys)))
+            if not page.get("IsTruncated"):
+                break
+            list_args["ContinuationToken"] = page["NextContinuationToken"]
+        return _merge_results(await asyncio.gather(*pending))
+
+    async def _delete_batch(self, bucket: str, keys: List[str]) -> DeleteResult:
+        response = await self.executor.run(
+            self.client.delete_objects,
+            Bucket=bucket,
+            Delete={"Objects": [{"Key": key} for key in keys], "Quiet": True},
+        )
+        errors = {
+            error["Key"]: f"{error.get('Code')}: {error.get('Message')}"
+            for error in response.get("Errors", [])
+        }
+        return DeleteResult(
+            deleted=[key for key in keys if key not in errors],
+            errors=errors,
+        )
+
+
+_default_video_cache: Optional[LocalVideoCache] = None
+
+
+def default_video_cache() -> Optional[LocalVideoCache]:
+    """
+    Get the process-wide video cache, if one is configured.
+
+    Enabled by S3_VIDEO_CACHE_DIR; S3_VIDEO_CACHE_MAX_MB sets its size
+    (default: 10240).
+    """
+    global _default_video_cache
+    directory = os.getenv("S3_VIDEO_CACHE_DIR")
+    if not directory:
+        return None
+    if _default_video_cache is None or _default_video_cache.directory != directory:
+        max_bytes = int(os.getenv("S3_VIDEO_CACHE_MAX_MB", "10240")) * 1024 * 1024
+        _default_video_cache = LocalVideoCache(directory, max_bytes)
+    return _default_video_cache
+
+
+def _signing_credentials(client: Any) -> Tuple[str, Optional[float]]:
+    """Get the access key a client signs with and when its credentials expire (epoch seconds)."""
+    get_credentials = getattr(client, "_get_credentials", None)
+    credentials = get_credentials() if callable(get_credentials) else None
+    if credentials is None:
+        return "", None
+    expiry = getattr(credentials, "_expiry_time", None)
+    expires_at = expiry.timestamp() if isinstance(expiry, datetime) else None
+    return str(credentials.access_key), expires_at
+
+
+def _merge_results(results: Iterable[DeleteResult]) -> DeleteResult:
+    merged = DeleteResult()
+    for result in results:
+        merged.merge(result)
+    return merged
+
+
+def _index_key(user_id: str, checksum: str) -> str:
+    return f"{user_id}:{checksum}"
+
+
+def _is_seekable(file: Any) -> bool:
+    seekable = getattr(file, "seekable", None)
+    return bool(seekable()) if callable(seekable) else False
+
+
+def _hash_seekable(file: BinaryIO) -> str:
+    start = file.tell()
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b""):
+        digest.update(chunk)
+    file.seek(start)
+    return digest.hexdigest()
+
+
+def _guess_content_type(filename: str) -> str:
+    return mimetypes.guess_type(filename)[0] or "application/octet-stream"
+
+
+def _file_size(path: str) -> Optional[int]:
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return None
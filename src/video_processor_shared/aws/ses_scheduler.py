@@ -0,0 +1,362 @@
+"""Rate-limited, quota-aware sending queue for SES.
+
+SES throttles accounts that exceed their maximum send rate, and boto3's
+retries turn a burst of throttled sends into long stalls. SESSendScheduler
+queues emails instead of sending them immediately and releases them
+through a token bucket refilled at the account's MaxSendRate. The bucket is
+shared by every scheduler of the process. The scheduler also stops sending
+once the rolling 24-hour quota is used up. Queued emails go out by priority
+(failure notices before success notices, then in submission order). If SES
+still throttles a send, the email is requeued and the shared bucket is
+paused with backoff, so every sender of the process slows down together.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from dataclasses import dataclass, field
+from types import TracebackType
+from typing import Callable, List, Optional, Type
+
+from botocore.exceptions import ClientError  # type: ignore[import-untyped]
+
+from video_processor_shared.aws.batching import backoff_delay
+from video_processor_shared.aws.email_templates import EmailContent
+from video_processor_shared.aws.rate_limit import TokenBucket, shared_token_bucket
+from video_processor_shared.aws.ses_service import (
+    THROTTLING_CODES,
+    SendQuota,
+    SESService,
+    job_completed_email,
+    job_failed_email,
+)
+
+logger = logging.getLogger(__name__)
+
+FAILURE_PRIORITY = 0
+DEFAULT_PRIORITY = 5
+SUCCESS_PRIORITY = 10
+
+
+@dataclass(frozen=True)
+class SchedulerStats:
+    """
+    Queue depth, counters and latency of a SESSendScheduler.
+
+    Attributes:
+        queued: Emails waiting to be sent.
+        sent: Emails sent so far.
+        failed: Emails that failed permanently.
+        throttled: Sends SES rejected with throttling (and were requeued).
+        latency_seconds: Smoothed submit-to-sent delay.
+        quota_remaining: Emails left in the rolling 24-hour quota (None until fetched).
+    """
+
+    queued: int
+    sent: int
+    failed: int
+    throttled: int
+    latency_seconds: float
+    quota_remaining: Optional[float]
+
+
+@dataclass(order=True)
+class _QueuedEmail:
+    priority: int
+    sequence: int
+    to: str = field(compare=False)
+    content: EmailContent = field(compare=False)
+    submitted_at: float = field(compare=False)
+    future: "asyncio.Future[str]" = field(compare=False)
+    attempts: int = field(default=0, compare=False)
+
+
+class SESSendScheduler:
+    """
+    Sends emails through SES within the account's rate and daily quota.
+
+    Usage:
+        async with SESSendScheduler(SESService()) as scheduler:
+            await scheduler.send_job_failed_email(to, "video.mp4", "Corrupt file")
+            ...
+            stats = scheduler.stats  # queue depth and send latency
+    """
+
+    def __init__(
+        self,
+        ses: SESService,
+        bucket: Optional[TokenBucket] = None,
+        concurrency: int = 4,
+        quota_refresh_interval: float = 300.0,
+        max_attempts: int = 5,
+        smoothing: float = 0.2,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        """
+        Create a scheduler.
+
+        Args:
+            ses: SESService to send through
+            bucket: Token bucket limiting the send rate (default: the
+                process-wide "ses" bucket)
+            concurrency: Sends in flight at once
+            quota_refresh_interval: Seconds between GetSendQuota calls
+            max_attempts: Attempts per email before it fails
+            smoothing: EWMA weight of the newest latency sample (0-1]
+            clock: Time source, injectable for tests
+        """
+        self.ses = ses
+        self.bucket = bucket or shared_token_bucket("ses")
+        self.concurrency = concurrency
+        self.quota_refresh_interval = quota_refresh_interval
+        self.max_attempts = max_attempts
+        self.smoothing = smoothing
+        self.sent = 0
+        self.failed = 0
+        self.throttled = 0
+        self.latency_seconds = 0.0
+        self.quota: Optional[SendQuota] = None
+        self._clock = clock
+        self._sent_since_refresh = 0
+        self._quota_fetched_at: Optional[float] = None
+        self._quota_retry_at = 0.0
+        self._quota_failures = 0
+        self._quota_refreshing = False
+        self._queue: List[_QueuedEmail] = []
+        self._sequence = itertools.count()
+        self._changed: Optional[asyncio.Condition] = None
+        self._tasks: List["asyncio.Task[None]"] = []
+        self._in_flight = 0
+        self._throttle_attempt = 0
+
+    @property
+    def stats(self) -> SchedulerStats:
+        return SchedulerStats(
+            queued=len(self._queue),
+            sent=self.sent,
+            failed=self.failed,
+            throttled=self.throttled,
+            latency_seconds=self.latency_seconds,
+            quota_remaining=self._quota_remaining(),
+        )
+
+    async def submit(
+        self,
+        to: str,
+        content: EmailContent,
+        priority: int = DEFAULT_PRIORITY,
+    ) -> "asyncio.Future[str]":
+        """
+        Queue an email.
+
+        Args:
+            to: Recipient email address
+            content: Email to send
+            priority: Lower values are sent first
+
+        Returns:
+            Future resolved with the SES message id once the email is sent
+        """
+        self.start()
+        future: "asyncio.Future[str]" = asyncio.get_running_loop().create_future()
+        email = _QueuedEmail(priority, next(self._sequence), to, content, self._clock(), future)
+        changed = self._condition()
+        async with changed:
+            heapq.heappush(self._queue, email)
+            changed.notify_all()
+        return future
+
+    async def send_email(
+        self,
+        to: str,
+        subject: str,
+        body_text: str,
+        body_html: Optional[str] = None,
+        priority: int = DEFAULT_PRIORITY,
+    ) -> str:
+        """Queue an email and wait until it is sent; returns the message id."""
+        content = EmailContent(subject, body_text, body_html)
+        return await (await self.submit(to, content, priority))
+
+    async def send_job_completed_email(
+        self,
+        to: str,
+        video_filename: str,
+        frame_count: int,
+        download_url: str,
+    ) -> str:
+        """Queue a job completed notification at success priority."""
+        content = job_completed_email(video_filename, frame_count, download_url)
+        return await (await self.submit(to, content, SUCCESS_PRIORITY))
+
+    async def send_job_failed_email(
+        self,
+        to: str,
+        video_filename: str,
+        error_message: str,
+    ) -> str:
+        """Queue a job failed notification at failure priority."""
+        content = job_failed_email(video_filename, error_message)
+        return await (await self.submit(to, content, FAILURE_PRIORITY))
+
+    async def refresh_quota(self) -> SendQuota:
+        """Fetch the account quota and apply its send rate to the bucket."""
+        quota = await self.ses.get_send_quota()
+        self.quota = quota
+        self._sent_since_refresh = 0
+        self._quota_fetched_at = self._clock()
+        self.bucket.configure(quota.max_send_rate)
+        return quota
+
+    async def flush(self) -> None:
+        """Wait until every queued email has been sent or failed."""
+        changed = self._condition()
+        async with changed:
+            await changed.wait_for(lambda: not self._queue and not self._in_flight)
+
+    def start(self) -> None:
+        """Start the sender tasks (submit() starts them on first use)."""
+        if not self._tasks:
+            self._tasks = [
+                asyncio.ensure_future(self._run()) for _ in range(max(self.concurrency, 1))
+            ]
+
+    async def close(self, timeout: Optional[float] = None) -> None:
+        """
+        Send everything queued, then stop the sender tasks.
+
+        Args:
+            timeout: Seconds to wait for queued emails (None = no limit);
+                futures of emails still queued after it are cancelled
+        """
+        try:
+            await asyncio.wait_for(self.flush(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(
+                "Closing SES scheduler with %d unsent emails", len(self._queue) + self._in_flight
+            )
+        finally:
+            for task in self._tasks:
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+            self._tasks = []
+            for email in self._queue:
+                email.future.cancel()
+            self._queue.clear()
+
+    async def __aenter__(self) -> "SESSendScheduler":
+        await self.refresh_quota()
+        self.start()
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        await self.close()
+
+    async def _run(self) -> None:
+        changed = self._condition()
+        while True:
+            async with changed:
+                await changed.wait_for(lambda: bool(self._queue))
+                email = heapq.heappop(self._queue)
+                self._in_flight += 1
+            try:
+                # The email is taken before its token, so senders woken for
+                # the same email never spend a token on nothing.
+                await self._wait_for_quota()
+                await self.bucket.acquire()
+                await self._send(email)
+            except asyncio.CancelledError:
+                email.future.cancel()
+                raise
+            finally:
+                async with changed:
+                    self._in_flight -= 1
+                    changed.notify_all()
+
+    async def _send(self, email: _QueuedEmail) -> None:
+        if email.future.done():
+            return
+        email.attempts += 1
+        try:
+            message_id = await self.ses.send_content(email.to, email.content)
+        except ClientError as error:
+            code = error.response.get("Error", {}).get("Code")
+            if code in THROTTLING_CODES and email.attempts < self.max_attempts:
+                await self._requeue_throttled(email)
+                return
+            self._fail(email, error)
+            return
+        except Exception as error:
+            self._fail(email, error)
+            return
+        self._throttle_attempt = 0
+        self.sent += 1
+        self._sent_since_refresh += 1
+        latency = self._clock() - email.submitted_at
+        self.latency_seconds = (
+            latency
+            if self.sent == 1
+            else self.smoothing * latency + (1 - self.smoothing) * self.latency_seconds
+        )
+        email.future.set_result(message_id)
+
+    async def _requeue_throttled(self, email: _QueuedEmail) -> None:
+        self.throttled += 1
+        self._throttle_attempt += 1
+        # Pausing the shared bucket backs off every sender, not just this one.
+        self.bucket.pause(backoff_delay(self._throttle_attempt, base=1.0, cap=60.0))
+        async with self._condition():
+            heapq.heappush(self._queue, email)
+
+    def _fail(self, email: _QueuedEmail, error: Exception) -> None:
+        self.failed += 1
+        logger.error("Sending email to %s failed: %s", email.to, error)
+        email.future.set_exception(error)
+
+    async def _wait_for_quota(self) -> None:
+        while True:
+            now = self._clock()
+            if (
+                not self._quota_refreshing
+                and now >= self._quota_retry_at
+                and (
+                    self._quota_fetched_at is None
+                    or now - self._quota_fetched_at >= self.quota_refresh_interval
+                )
+            ):
+                # Concurrent senders keep the last known quota meanwhile.
+                self._quota_refreshing = True
+                try:
+                    await self.refresh_quota()
+                    self._quota_failures = 0
+                except Exception:
+                    # The quota stays due, retried with backoff so a failing
+                    # GetSendQuota is not called before every send.
+                    self._quota_failures += 1
+                    self._quota_retry_at = now + backoff_delay(
+                        self._quota_failures, base=1.0, cap=self.quota_refresh_interval
+                    )
+                    logger.exception("Fetching the SES send quota failed")
+                finally:
+                    self._quota_refreshing = False
+            remaining = self._quota_remaining()
+            if remaining is None or remaining > 0:
+                return
+            logger.warning("SES daily quota exhausted; %d emails queued", len(self._queue))
+            await asyncio.sleep(self.quota_refresh_interval)
+
+    def _quota_remaining(self) -> Optional[float]:
+        if self.quota is None:
+            return None
+        return max(self.quota.remaining - self._sent_since_refresh, 0.0)
+
+    def _condition(self) -> asyncio.Condition:
+        if self._changed is None:
+            self._changed = asyncio.Condition()
+        return self._changed
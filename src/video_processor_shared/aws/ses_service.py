@@ -1,19 +1,93 @@
 """SES Email Service using boto3.
 
-Works with both LocalStack and real AWS SES.
+Works with both LocalStack and real AWS SES. Blocking boto3 calls run on the
+shared "ses" executor so they never block the event loop.
+
+Notifications are rendered from the precompiled templates in
+email_templates. For high volumes, send_bulk_job_completed registers the
+template with SES once and sends up to 50 recipients per request with
+SendBulkTemplatedEmail.
 """
+import json
 import os
-from typing import Optional
+from dataclasses import dataclass
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Set, Tuple
+
+from botocore.exceptions import ClientError  # type: ignore[import-untyped]
 
 from video_processor_shared.aws import get_ses_client
+from video_processor_shared.aws.batching import EntryFailure, backoff_delay, run_batched
+from video_processor_shared.aws.email_templates import (
+    JOB_COMPLETED_TEMPLATE,
+    JOB_FAILED_TEMPLATE,
+    EmailContent,
+    EmailTemplate,
+)
+from video_processor_shared.aws.executor import AsyncExecutor, get_executor
+from video_processor_shared.aws.rate_limit import TokenBucket, shared_token_bucket
+
+MAX_BULK_DESTINATIONS = 50
+MAX_BULK_BYTES = 10 * 1024 * 1024
+
+# Bulk statuses worth retrying; every other non-success status is permanent.
+TRANSIENT_BULK_STATUSES = ("AccountThrottled", "TransientFailure", "Failed")
+
+THROTTLING_CODES = ("Throttling", "ThrottlingException", "MaxSendingRateExceeded")
+
+
+@dataclass(frozen=True)
+class SendQuota:
+    """
+    SES sending limits of the account.
+
+    Attributes:
+        max_24_hour_send: Emails allowed per rolling 24 hours.
+        max_send_rate: Emails allowed per second.
+        sent_last_24_hours: Emails sent in the last 24 hours.
+    """
+
+    max_24_hour_send: float
+    max_send_rate: float
+    sent_last_24_hours: float
+
+    @property
+    def remaining(self) -> float:
+        return max(self.max_24_hour_send - self.sent_last_24_hours, 0.0)
+
+
+@dataclass(frozen=True)
+class JobCompletedNotification:
+    """Recipient and values of one job completed email."""
+
+    to: str
+    video_filename: str
+    frame_count: int
+    download_url: str
 
 
 class SESService:
     """SES email sending service."""
 
-    def __init__(self, from_email: Optional[str] = None) -> None:
+    def __init__(
+        self,
+        from_email: Optional[str] = None,
+        executor: Optional[AsyncExecutor] = None,
+        bucket: Optional[TokenBucket] = None,
+    ) -> None:
+        """
+        Args:
+            from_email: Sender address (default: SES_FROM_EMAIL)
+            executor: Executor for SES calls (default: the shared "ses" executor)
+            bucket: Token bucket bulk sends draw one token per recipient from
+                (default: the process-wide "ses" bucket, shared with
+                SESSendScheduler)
+        """
         self.client = get_ses_client()
+        self.executor = executor or get_executor("ses")
         self.from_email: str = from_email or os.getenv("SES_FROM_EMAIL") or "noreply@videoprocessor.local"
+        self.bucket = bucket or shared_token_bucket("ses")
+        self._registered_templates: Set[str] = set()
+        self._rate_configured = False
 
     async def send_email(
         self,
@@ -39,7 +113,8 @@ class SESService:
         if body_html:
             message_body["Html"] = {"Data": body_html, "Charset": "UTF-8"}
 
-        response = self.client.send_email(
+        response = await self.executor.run(
+            self.client.send_email,
             Source=self.from_email,
             Destination={"ToAddresses": [to]},
             Message={
@@ -50,62 +125,134 @@ class SESService:
 
         return str(response["MessageId"])
 
-    async def send_job_completed_email(
-        self,
-        to: str,
-        video_filename: str,
-        frame_count: int,
-        download_url: str,
-    ) -> str:
-        """Send a job completed notification email."""
-        subject = f"✅ Video Processing Complete: {video_filename}"
+    async def send_content(self, to: str, content: EmailContent) -> str:
+        """Send a prebuilt email."""
+        return await self.send_email(to, content.subject, content.body_text, content.body_html)
 
-        body_text = f"""
-Hello!
+    async def get_send_quota(self) -> SendQuota:
+        """Get the account's sending limits."""
+        response = await self.executor.run(self.client.get_send_quota)
+        return SendQuota(
+            max_24_hour_send=float(response["Max24HourSend"]),
+            max_send_rate=float(response["MaxSendRate"]),
+            sent_last_24_hours=float(response["SentLast24Hours"]),
+        )
 
-Your video "{video_filename}" has been processed successfully!
+    async def register_template(self, template: EmailTemplate) -> None:
+        """Create or update an SES template."""
+        try:
+            await self.executor.run(self.client.create_template, Template=template.to_ses())
+        except ClientError as error:
+            if error.response.get("Error", {}).get("Code") != "AlreadyExists":
+                raise
+            await self.executor.run(self.client.update_template, Template=template.to_ses())
+        self._registered_templates.add(template.name)
 
-📊 Processing Results:
-- Frames extracted: {frame_count}
-- Status: COMPLETED
+    async def send_bulk_templated_email(
+        self,
+        template: EmailTemplate,
+        destinations: Sequence[Tuple[str, Mapping[str, Any]]],
+        max_attempts: int = 3,
+    ) -> List[str]:
+        """
+        Send a template to many recipients with per-recipient values.
 
-📥 Download your frames:
-{download_url}
+        The template is registered with SES on first use by this service.
+        Requests go out one at a time, each after taking a token per
+        recipient from the bucket, which is set to the account's send rate
+        on first use. A request throttled as a whole pauses the bucket and
+        its recipients are retried like any other transient failure.
 
-Thank you for using Video Processor!
+        Args:
+            template: Template to send
+            destinations: (recipient, replacement values) pairs
+            max_attempts: Attempts per recipient for transient failures
 
-Best regards,
-Video Processor Team
-        """.strip()
+        Returns:
+            Message IDs in input order
 
-        body_html = f"""
-<html>
-<body style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
-    <h2 style="color: #22c55e;">✅ Video Processing Complete</h2>
-    <p>Your video <strong>"{video_filename}"</strong> has been processed successfully!</p>
+        Raises:
+            BatchOperationError: If some recipients still failed after all attempts
+        """
+        if template.name not in self._registered_templates:
+            await self.register_template(template)
+        if not self._rate_configured:
+            quota = await self.get_send_quota()
+            self.bucket.configure(quota.max_send_rate)
+            self._rate_configured = True
+        entries = [
+            {
+                "Destination": {"ToAddresses": [to]},
+                "ReplacementTemplateData": json.dumps(dict(data), default=str),
+            }
+            for to, data in destinations
+        ]
 
-    <div style="background: #f3f4f6; padding: 16px; border-radius: 8px; margin: 16px 0;">
-        <h3 style="margin-top: 0;">📊 Processing Results</h3>
-        <ul>
-            <li>Frames extracted: <strong>{frame_count}</strong></li>
-            <li>Status: <strong style="color: #22c55e;">COMPLETED</strong></li>
-        </ul>
-    </div>
+        throttled = 0
 
-    <a href="{download_url}" style="display: inline-block; background: #3b82f6; color: white; padding: 12px 24px; text-decoration: none; border-radius: 6px; margin: 16px 0;">
-        📥 Download Frames
-    </a>
+        async def send_entries(indexes: List[int]) -> Tuple[Dict[int, Any], Dict[int, EntryFailure]]:
+            nonlocal throttled
+            await self.bucket.acquire(len(indexes))
+            try:
+                response = await self.executor.run(
+                    self.client.send_bulk_templated_email,
+                    Source=self.from_email,
+                    Template=template.name,
+                    DefaultTemplateData="{}",
+                    Destinations=[entries[index] for index in indexes],
+                )
+            except ClientError as error:
+                code = error.response.get("Error", {}).get("Code")
+                if code not in THROTTLING_CODES:
+                    raise
+                throttled += 1
+                self.bucket.pause(backoff_delay(throttled, base=1.0, cap=60.0))
+                failure = EntryFailure(code=str(code), message=str(error), sender_fault=False)
+                return {}, {index: failure for index in indexes}
+            return bulk_outcome(indexes, response)
 
-    <p style="color: #6b7280; font-size: 14px; margin-top: 32px;">
-        Thank you for using Video Processor!<br>
-        Best regards,<br>
-        <strong>Video Processor Team</strong>
-    </p>
-</body>
-</html>
-        """.strip()
+        sizes = [len(entry["ReplacementTemplateData"]) for entry in entries]
+        return await run_batched(
+            sizes,
+            send_entries,
+            max_attempts=max_attempts,
+            max_entries=MAX_BULK_DESTINATIONS,
+            max_bytes=MAX_BULK_BYTES,
+            concurrent=False,
+        )
 
-        return await self.send_email(to, subject, body_text, body_html)
+    async def send_bulk_job_completed(
+        self,
+        notifications: Sequence[JobCompletedNotification],
+        max_attempts: int = 3,
+    ) -> List[str]:
+        """Send job completed emails in bulk; returns message IDs in input order."""
+        destinations = [
+            (
+                notification.to,
+                {
+                    "video_filename": notification.video_filename,
+                    "frame_count": notification.frame_count,
+                    "download_url": notification.download_url,
+                },
+            )
+            for notification in notifications
+        ]
+        return await self.send_bulk_templated_email(
+            JOB_COMPLETED_TEMPLATE, destinations, max_attempts=max_attempts
+        )
+
+    async def send_job_completed_email(
+        self,
+        to: str,
+        video_filename: str,
+        frame_count: int,
+        download_url: str,
+    ) -> str:
+        """Send a job completed notification email."""
+        return await self.send_content(
+            to, job_completed_email(video_filename, frame_count, download_url)
+        )
 
     async def send_job_failed_email(
         self,
@@ -114,23 +261,49 @@ Video Processor Team
         error_message: str,
     ) -> str:
         """Send a job failed notification email."""
-        subject = f"❌ Video Processing Failed: {video_filename}"
+        return await self.send_content(to, job_failed_email(video_filename, error_message))
 
-        body_text = f"""
-Hello!
 
-Unfortunately, we encountered an error processing your video "{video_filename}".
+def job_completed_email(video_filename: str, frame_count: int, download_url: str) -> EmailContent:
+    """Build the job completed notification."""
+    return JOB_COMPLETED_TEMPLATE.render(
+        {"video_filename": video_filename, "frame_count": frame_count, "download_url": download_url}
+    )
 
-❌ Error Details:
-{error_message}
 
-Please try uploading your video again. If the problem persists,
-please contact our support team.
+def job_failed_email(video_filename: str, error_message: str) -> EmailContent:
+    """Build the job failed notification."""
+    return JOB_FAILED_TEMPLATE.render(
+        {"video_filename": video_filename, "error_message": error_message}
+    )
 
-We apologize for the inconvenience.
 
-Best regards,
-Video Processor Team
-        """.strip()
-
-        return await self.send_email(to, subject, body_text)
+def bulk_outcome(
+    indexes: List[int],
+    response: Dict[str, Any],
+) -> Tuple[Dict[int, Any], Dict[int, EntryFailure]]:
+    """
+    Split a SendBulkTemplatedEmail response into (message ids, failures) by
+    index. Recipients the response has no status for count as transient
+    failures, so they are retried instead of silently dropped.
+    """
+    succeeded: Dict[int, Any] = {}
+    failed: Dict[int, EntryFailure] = {}
+    statuses = response.get("Status", [])
+    for index in indexes[len(statuses):]:
+        failed[index] = EntryFailure(
+            code="MissingStatus",
+            message="No status returned for this destination",
+            sender_fault=False,
+        )
+    for index, status in zip(indexes, statuses):
+        code = str(status.get("Status", ""))
+        if code == "Success":
+            succeeded[index] = status.get("MessageId")
+        else:
+            failed[index] = EntryFailure(
+                code=code,
+                message=str(status.get("Error", "")),
+                sender_fault=code not in TRANSIENT_BULK_STATUSES,
+            )
+    return succeeded, failed
@@ -1,19 +1,52 @@
 """SNS Notification Service using boto3.
 
-Works with both LocalStack and real AWS SNS.
+Works with both LocalStack and real AWS SNS. Blocking boto3 calls run on the
+shared "sns" executor so they never block the event loop. Messages too large
+for SNS are offloaded to S3 as claim checks.
+
+Routing keys of a message (event_type, user_id, job_id, video_id) are copied
+into SNS message attributes, so subscription filter policies can drop
+irrelevant events at the broker instead of in every consumer.
 """
+import asyncio
 import json
 import os
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple, Union
 
 from video_processor_shared.aws import get_sns_client, get_sns_topic_arn
+from video_processor_shared.aws.batching import EntryFailure, batch_outcome, run_batched
+from video_processor_shared.aws.claim_check import ClaimCheckStore, default_claim_check_store
+from video_processor_shared.aws.executor import AsyncExecutor, get_executor
+from video_processor_shared.aws.serializers import Serializer, default_serializer
+from video_processor_shared.domain.events import DomainEvent
+
+ROUTING_ATTRIBUTES = ("event_type", "user_id", "job_id", "video_id")
+
+# Email subject of batch-published events, by event_type.
+EVENT_SUBJECTS = {
+    "job_completed": "Video Processing Completed",
+    "JobCompletedEvent": "Video Processing Completed",
+    "job_failed": "Video Processing Failed",
+    "JobFailedEvent": "Video Processing Failed",
+}
+
+Event = Union[DomainEvent, Mapping[str, Any]]
 
 
 class SNSService:
     """SNS notification service for publishing events."""
 
-    def __init__(self, topic_name: Optional[str] = None) -> None:
+    def __init__(
+        self,
+        topic_name: Optional[str] = None,
+        executor: Optional[AsyncExecutor] = None,
+        claim_checks: Optional[ClaimCheckStore] = None,
+        serializer: Optional[Serializer] = None,
+    ) -> None:
         self.client = get_sns_client()
+        self.executor = executor or get_executor("sns")
+        self.claim_checks = claim_checks or default_claim_check_store()
+        self.serializer = serializer or default_serializer()
         self.topic_name: str = topic_name or os.getenv("SNS_TOPIC_NAME") or "job-events"
         self.topic_arn = get_sns_topic_arn(self.topic_name)
 
@@ -21,28 +54,103 @@ class SNSService:
         self,
         message: Dict[str, Any],
         subject: Optional[str] = None,
+        attributes: Optional[Dict[str, str]] = None,
     ) -> str:
         """
         Publish a message to the SNS topic.
 
         Args:
-            message: Dictionary to send as JSON
+            message: Dictionary to send, encoded with the service serializer;
+                offloaded to S3 when larger than the claim-check threshold
             subject: Optional email subject (for email subscribers)
+            attributes: Extra string message attributes, added to the
+                routing keys promoted from the message
 
         Returns:
             Message ID
         """
-        publish_args = {
+        publish_args: Dict[str, Any] = {
             "TopicArn": self.topic_arn,
-            "Message": json.dumps(message),
+            **await self._message_args(message, attributes, subject),
         }
 
-        if subject:
-            publish_args["Subject"] = subject
-
-        response = self.client.publish(**publish_args)
+        response = await self.executor.run(self.client.publish, **publish_args)
         return str(response["MessageId"])
 
+    async def publish_batch(
+        self,
+        events: Sequence[Event],
+        max_attempts: int = 3,
+    ) -> List[str]:
+        """
+        Publish many events using PublishBatch.
+
+        Events are packed into batches of up to 10 entries and 256 KiB,
+        batches are sent concurrently, and entries that fail for a
+        transient reason are retried with backoff. Each entry gets the
+        EVENT_SUBJECTS subject of its event type, if there is one.
+
+        Args:
+            events: Domain events, or dictionaries to send as messages
+            max_attempts: Attempts per event, including the first
+
+        Returns:
+            Message IDs in the same order as events
+
+        Raises:
+            BatchOperationError: If some events could not be published; its
+                results hold the IDs of the ones that were
+        """
+        payloads = [event_payload(event) for event in events]
+        entries = await asyncio.gather(
+            *(
+                self._message_args(
+                    payload, subject=EVENT_SUBJECTS.get(str(payload.get("event_type")))
+                )
+                for payload in payloads
+            )
+        )
+
+        async def publish_entries(indexes: List[int]) -> Tuple[Dict[int, Any], Dict[int, EntryFailure]]:
+            response = await self.executor.run(
+                self.client.publish_batch,
+                TopicArn=self.topic_arn,
+                PublishBatchRequestEntries=[
+                    {"Id": str(index), **entries[index]} for index in indexes
+                ],
+            )
+            return batch_outcome(response, "MessageId")
+
+        sizes = [
+            len(entry["Message"].encode("utf-8"))
+            + len(json.dumps(entry.get("MessageAttributes", {})))
+            for entry in entries
+        ]
+        return await run_batched(sizes, publish_entries, max_attempts=max_attempts)
+
+    async def _message_args(
+        self,
+        message: Mapping[str, Any],
+        attributes: Optional[Dict[str, str]] = None,
+        subject: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        args: Dict[str, Any] = {
+            "Message": await self.claim_checks.offload(self.serializer.dumps(message)),
+        }
+        if subject:
+            args["Subject"] = subject
+        message_attributes = {
+            **self.serializer.message_attributes(),
+            **routing_attributes(message),
+            **{
+                name: {"DataType": "String", "StringValue": value}
+                for name, value in (attributes or {}).items()
+            },
+        }
+        if message_attributes:
+            args["MessageAttributes"] = message_attributes
+        return args
+
     async def publish_job_completed(
         self,
         job_id: str,
@@ -82,3 +190,19 @@ class SNSService:
             },
             subject="Video Processing Failed",
         )
+
+
+def routing_attributes(message: Mapping[str, Any]) -> Dict[str, Any]:
+    """Build SNS message attributes from the routing keys present in a message."""
+    return {
+        name: {"DataType": "String", "StringValue": str(message[name])}
+        for name in ROUTING_ATTRIBUTES
+        if message.get(name) not in (None, "")
+    }
+
+
+def event_payload(event: Event) -> Mapping[str, Any]:
+    """Get the message payload of a domain event or dictionary."""
+    if isinstance(event, DomainEvent):
+        return event.to_dict()
+    return event
@@ -0,0 +1,132 @@
+"""Buffered batch acknowledgement for SQS consumers.
+
+Deleting each processed message individually costs a full round trip per
+message. SQSAckBuffer collects receipt handles and deletes them with
+DeleteMessageBatch once 10 are pending or the oldest has waited
+max_latency seconds, whichever comes first.
+"""
+import asyncio
+import logging
+from types import TracebackType
+from typing import Callable, List, Optional, Set, Type
+
+from video_processor_shared.aws.batching import (
+    MAX_BATCH_ENTRIES,
+    BatchOperationError,
+    EntryFailure,
+)
+from video_processor_shared.aws.sqs_service import SQSService
+
+logger = logging.getLogger(__name__)
+
+FailureCallback = Callable[[str, EntryFailure], None]
+
+
+class SQSAckBuffer:
+    """
+    Collects receipt handles and deletes them in batches.
+
+    Usage:
+        async with SQSAckBuffer(sqs) as acks:
+            for message in await sqs.receive_messages(max_messages=10):
+                await handle(message)
+                await acks.ack(message["receipt_handle"])
+        # pending handles are flushed on exit
+    """
+
+    def __init__(
+        self,
+        service: SQSService,
+        max_batch: int = MAX_BATCH_ENTRIES,
+        max_latency: float = 0.5,
+        on_failure: Optional[FailureCallback] = None,
+    ) -> None:
+        """
+        Create an ack buffer.
+
+        Args:
+            service: SQSService of the queue the messages came from
+            max_batch: Pending handles that trigger an immediate flush (max 10)
+            max_latency: Seconds a handle may wait before a flush is forced
+            on_failure: Called with (receipt_handle, failure) for every
+                handle that could not be deleted
+        """
+        self.service = service
+        self.max_batch = min(max_batch, MAX_BATCH_ENTRIES)
+        self.max_latency = max_latency
+        self.on_failure = on_failure
+        self.acked = 0
+        self.failed = 0
+        self._pending: List[str] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._flushes: Set["asyncio.Task[None]"] = set()
+        self._closed = False
+
+    @property
+    def pending(self) -> int:
+        """Number of handles waiting to be flushed."""
+        return len(self._pending)
+
+    async def ack(self, receipt_handle: str) -> None:
+        """Queue a processed message for deletion."""
+        if self._closed:
+            raise RuntimeError("SQSAckBuffer is closed")
+        self._pending.append(receipt_handle)
+        if len(self._pending) >= self.max_batch:
+            self._start_flush()
+        elif self._timer is None:
+            loop = asyncio.get_running_loop()
+            self._timer = loop.call_later(self.max_latency, self._start_flush)
+
+    async def flush(self) -> None:
+        """Delete every pending handle and wait for in-flight flushes."""
+        self._start_flush()
+        if self._flushes:
+            await asyncio.gather(*list(self._flushes))
+
+    async def close(self) -> None:
+        """Flush pending handles and reject further acks."""
+        await self.flush()
+        self._closed = True
+
+    async def __aenter__(self) -> "SQSAckBuffer":
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        await self.close()
+
+    def _start_flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        handles, self._pending = self._pending, []
+        task = asyncio.ensure_future(self._delete(handles))
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def _delete(self, handles: List[str]) -> None:
+        try:
+            await self.service.delete_messages(handles)
+            self.acked += len(handles)
+        except BatchOperationError as error:
+            self.acked += len(handles) - len(error.failures)
+            for index, failure in error.failures.items():
+                self._report(handles[index], failure)
+        except Exception as error:
+            failure = EntryFailure(type(error).__name__, str(error))
+            for handle in handles:
+                self._report(handle, failure)
+
+    def _report(self, handle: str, failure: EntryFailure) -> None:
+        self.failed += 1
+        if self.on_failure is None:
+            logger.warning("Failed to delete SQS message %s: %s", handle, failure)
+            return
+        self.on_failure(handle, failure)
@@ -0,0 +1,433 @@
+"""Concurrent SQS consumer runtime.
+
+SQSConsumer runs a fixed number of pollers that long-poll the queue into a
+bounded prefetch buffer, and a fixed number of workers that take messages
+from the buffer and run the handler. The buffer size bounds how many
+received messages wait in memory (their visibility timeout is already
+running); the worker count bounds how many messages are processed at once.
+Handlers run as asyncio tasks, on a thread pool or on a process pool.
+Successful messages are deleted in batches through SQSAckBuffer; failed
+messages are left alone and reappear once their visibility timeout expires.
+With visibility_timeout set, messages being processed are kept invisible by
+a VisibilityHeartbeat, so long jobs are not redelivered to another worker.
+With an IdempotencyStore, redeliveries of messages (or events) that were
+already processed are deleted without running the handler.
+
+Receives request wait_time_seconds and batch_size unless an
+AdaptiveReceivePolicy is given, which tunes both from recent receives; only
+the attributes listed in attribute_names and message_attribute_names are
+fetched when those are set.
+
+In ordered mode (the default for FIFO queues) messages of one message group
+are handled one at a time in the order they were received, while different
+groups are handled in parallel. When a message fails, the rest of its group
+in this process is skipped so SQS redelivers them after it, in order.
+SIGTERM and SIGINT stop polling and drain the buffer before returning.
+"""
+import asyncio
+import logging
+import signal
+import time
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, List, Mapping, Optional, Sequence, Set
+
+from video_processor_shared.aws.batching import MAX_BATCH_ENTRIES, backoff_delay
+from video_processor_shared.aws.executor import get_executor
+from video_processor_shared.aws.idempotency import (
+    IdempotencyStore,
+    InMemoryIdempotencyStore,
+    idempotency_keys,
+)
+from video_processor_shared.aws.messages import QueueMessage
+from video_processor_shared.aws.sqs_ack_buffer import SQSAckBuffer
+from video_processor_shared.aws.sqs_heartbeat import MAX_VISIBILITY_EXTENSION, VisibilityHeartbeat
+from video_processor_shared.aws.sqs_receive_policy import AdaptiveReceivePolicy
+from video_processor_shared.aws.sqs_service import SQSService
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[Mapping[str, Any]], Any]
+
+WORKER_MODES = ("async", "thread", "process")
+
+_STOP: Any = object()
+
+
+class SQSConsumer:
+    """
+    Polls a queue and dispatches messages to a handler concurrently.
+
+    Usage:
+        async def handle(message):
+            await process_job(message["body"])
+
+        consumer = SQSConsumer(SQSService("job-queue"), handle, concurrency=8)
+        await consumer.run()  # returns after SIGTERM once in-flight work is done
+    """
+
+    def __init__(
+        self,
+        service: SQSService,
+        handler: Handler,
+        mode: str = "async",
+        concurrency: int = 10,
+        pollers: int = 1,
+        prefetch: Optional[int] = None,
+        batch_size: int = MAX_BATCH_ENTRIES,
+        wait_time_seconds: int = 20,
+        ack_latency: float = 0.5,
+        drain_timeout: Optional[float] = None,
+        visibility_timeout: Optional[int] = None,
+        max_visibility_extension: int = MAX_VISIBILITY_EXTENSION,
+        heartbeat_interval: Optional[float] = None,
+        idempotency: Optional[IdempotencyStore] = None,
+        ordered: Optional[bool] = None,
+        receive_policy: Optional[AdaptiveReceivePolicy] = None,
+        attribute_names: Optional[Sequence[str]] = None,
+        message_attribute_names: Optional[Sequence[str]] = None,
+    ) -> None:
+        """
+        Create a consumer.
+
+        Args:
+            service: SQSService of the queue to consume
+            handler: Called with each received message. A coroutine function
+                in "async" mode; a plain (and for "process", picklable)
+                function otherwise
+            mode: "async", "thread" or "process"
+            concurrency: Maximum messages processed at once
+            pollers: Concurrent ReceiveMessage loops
+            prefetch: Capacity of the buffer between pollers and workers
+                (default: 2 x concurrency)
+            batch_size: Messages requested per receive (1-10)
+            wait_time_seconds: Long polling wait time (0-20)
+            ack_latency: Maximum seconds a delete waits to be batched
+            drain_timeout: Seconds to wait for buffered and in-flight
+                messages on shutdown (None = wait until done)
+            visibility_timeout: Extend in-flight messages by this many
+                seconds with heartbeats (None = no heartbeats)
+            max_visibility_extension: Maximum seconds a message is kept
+                invisible by heartbeats
+            heartbeat_interval: Seconds between heartbeats (default: a
+                third of visibility_timeout)
+            idempotency: Store of processed message and event ids; when
+                set, duplicates are acknowledged without running the handler
+            ordered: Keep the order of messages within a message group
+                (default: True for FIFO queues)
+            receive_policy: Adapts batch size and wait time to the queue,
+                replacing batch_size and wait_time_seconds
+            attribute_names: System attributes the handler needs (default: all)
+            message_attribute_names: Message attributes the handler needs
+                (default: all)
+        """
+        if mode not in WORKER_MODES:
+            raise ValueError(f"Unknown consumer mode {mode!r}; expected one of {WORKER_MODES}")
+        self.service = service
+        self.handler = handler
+        self.mode = mode
+        self.concurrency = concurrency
+        self.pollers = pollers
+        self.prefetch = prefetch or 2 * concurrency
+        self.batch_size = min(batch_size, MAX_BATCH_ENTRIES)
+        self.wait_time_seconds = wait_time_seconds
+        self.ack_latency = ack_latency
+        self.drain_timeout = drain_timeout
+        self.visibility_timeout = visibility_timeout
+        self.max_visibility_extension = max_visibility_extension
+        self.heartbeat_interval = heartbeat_interval
+        self.idempotency = idempotency
+        self.ordered = getattr(service, "fifo", False) if ordered is None else ordered
+        self.receive_policy = receive_policy
+        self.attribute_names = attribute_names
+        self.message_attribute_names = message_attribute_names
+        self.received = 0
+        self.processed = 0
+        self.failed = 0
+        self.duplicates = 0
+        self.skipped = 0
+        self._stopping: Optional[asyncio.Event] = None
+        self._buffer: Optional["asyncio.Queue[Any]"] = None
+        self._pool: Optional[Executor] = None
+        self._heartbeat: Optional[VisibilityHeartbeat] = None
+        self._in_progress: Set[str] = set()
+        self._groups: Dict[str, Deque[Mapping[str, Any]]] = {}
+
+    @property
+    def buffered(self) -> int:
+        """Messages received but not yet picked up by a worker."""
+        return self._buffer.qsize() if self._buffer is not None else 0
+
+    def stop(self) -> None:
+        """Stop polling; run() returns once buffered messages are processed."""
+        if self._stopping is not None:
+            self._stopping.set()
+
+    async def run(self) -> None:
+        """Consume until stop() is called or SIGTERM/SIGINT is received."""
+        loop = asyncio.get_running_loop()
+        self._stopping = asyncio.Event()
+        self._buffer = asyncio.Queue(maxsize=self.prefetch)
+        self._pool = self._create_pool()
+        installed = self._install_signal_handlers(loop)
+        acks = SQSAckBuffer(self.service, max_latency=self.ack_latency)
+        if self.visibility_timeout is not None:
+            self._heartbeat = VisibilityHeartbeat(
+                self.service,
+                self.visibility_timeout,
+                interval=self.heartbeat_interval,
+                max_extension=self.max_visibility_extension,
+            )
+            self._heartbeat.start()
+        pollers = [asyncio.ensure_future(self._poll()) for _ in range(self.pollers)]
+        workers = [asyncio.ensure_future(self._work(acks)) for _ in range(self.concurrency)]
+        try:
+            await self._stopping.wait()
+        finally:
+            for poller in pollers:
+                # A receive that is still long polling is abandoned; the
+                # messages it returns become visible again after the timeout.
+                poller.cancel()
+            await asyncio.gather(*pollers, return_exceptions=True)
+            try:
+                await asyncio.wait_for(self._drain(workers), self.drain_timeout)
+            except asyncio.TimeoutError:
+                logger.warning("SQS consumer drain timed out with %d buffered", self.buffered)
+                for worker in workers:
+                    worker.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
+            await acks.close()
+            if self._heartbeat is not None:
+                await self._heartbeat.close()
+                self._heartbeat = None
+            for signum in installed:
+                loop.remove_signal_handler(signum)
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+    async def _drain(self, workers: List["asyncio.Task[None]"]) -> None:
+        assert self._buffer is not None
+        for _ in workers:
+            await self._buffer.put(_STOP)
+        await asyncio.gather(*workers)
+
+    async def _poll(self) -> None:
+        assert self._stopping is not None and self._buffer is not None
+        attribute_names = self.attribute_names
+        if self._heartbeat is not None and attribute_names is not None:
+            attribute_names = [*attribute_names, "ApproximateFirstReceiveTimestamp"]
+        attempt = 0
+        while not self._stopping.is_set():
+            max_messages, wait_time_seconds = self.batch_size, self.wait_time_seconds
+            if self.receive_policy is not None:
+                max_messages, wait_time_seconds = self.receive_policy.next_request()
+            try:
+                messages = await self.service.receive_messages(
+                    max_messages=max_messages,
+                    wait_time_seconds=wait_time_seconds,
+                    attribute_names=attribute_names,
+                    message_attribute_names=self.message_attribute_names,
+                )
+                attempt = 0
+            except Exception:
+                attempt += 1
+                logger.exception("SQS receive from %s failed", self.service.queue_name)
+                await asyncio.sleep(backoff_delay(attempt, base=0.5, cap=20.0))
+                continue
+            self.received += len(messages)
+            if self.receive_policy is not None:
+                self.receive_policy.record(len(messages))
+            if self._heartbeat is not None:
+                # Buffered messages are in flight as far as SQS is concerned:
+                # keep them invisible until a worker gets to them.
+                now = time.monotonic()
+                for message in messages:
+                    self._heartbeat.track(message["receipt_handle"], _received_at(message, now))
+            for index, message in enumerate(messages):
+                try:
+                    # Blocks while the buffer is full, which pauses this poller.
+                    await self._buffer.put(message)
+                except asyncio.CancelledError:
+                    # Shutdown: messages that never reached the buffer are left
+                    # to become visible again instead of being kept alive.
+                    for dropped in messages[index:]:
+                        self._release(dropped)
+                    raise
+
+    async def _work(self, acks: SQSAckBuffer) -> None:
+        assert self._buffer is not None
+        while True:
+            message = await self._buffer.get()
+            if message is _STOP:
+                return
+            group = _message_group(message) if self.ordered else None
+            if group is None:
+                await self._handle(message, acks)
+            else:
+                await self._handle_in_group(group, message, acks)
+
+    async def _handle_in_group(
+        self,
+        group: str,
+        message: Mapping[str, Any],
+        acks: SQSAckBuffer,
+    ) -> None:
+        pending = self._groups.get(group)
+        if pending is not None:
+            # Another worker is draining this group; it handles the message
+            # after the ones before it. SQS only hands out more messages of a
+            # group once the in-flight ones are deleted, so this stays short.
+            pending.append(message)
+            return
+        pending = self._groups[group] = deque([message])
+        try:
+            while pending:
+                if not await self._handle(pending[0], acks):
+                    break
+                pending.popleft()
+        finally:
+            del self._groups[group]
+        if pending:
+            # The head failed or is a duplicate still in progress elsewhere;
+            # the rest must not run ahead of it.
+            pending.popleft()
+            await self._return_to_queue(list(pending))
+
+    async def _return_to_queue(self, messages: List[Mapping[str, Any]]) -> None:
+        if not messages:
+            return
+        self.skipped += len(messages)
+        for message in messages:
+            self._release(message)
+        # Make them visible again right away so SQS redelivers the group in
+        # order once the failed message is retried, instead of holding the
+        # group until their visibility timeout runs out.
+        try:
+            await self.service.change_visibility_batch(
+                {message["receipt_handle"]: 0 for message in messages}
+            )
+        except Exception:
+            logger.warning(
+                "Could not return %d skipped messages to %s",
+                len(messages),
+                self.service.queue_name,
+                exc_info=True,
+            )
+
+    async def _handle(self, message: Mapping[str, Any], acks: SQSAckBuffer) -> bool:
+        claimed: List[str] = []
+        try:
+            if isinstance(message, QueueMessage):
+                # Resolve claim checks off the loop before anything reads the body.
+                await message.load_body()
+            if self.idempotency is not None:
+                keys = idempotency_keys(message)
+                if await self._seen(keys):
+                    self.duplicates += 1
+                    await self._ack(message, acks)
+                    return True
+                if self._in_progress.intersection(keys):
+                    # Another worker is handling the same message or event; this
+                    # copy is redelivered later and acknowledged as a duplicate.
+                    self.duplicates += 1
+                    self._release(message)
+                    return False
+                claimed = keys
+                self._in_progress.update(claimed)
+
+            await self._dispatch(message)
+            # Mark before the keys leave _in_progress, so a copy delivered
+            # while a slow store is still writing cannot slip through.
+            if self.idempotency is not None:
+                await self._mark(claimed)
+        except Exception:
+            self.failed += 1
+            logger.exception("Handler failed for SQS message %s", message["message_id"])
+            self._release(message)
+            return False
+        except BaseException:
+            self._release(message)
+            raise
+        finally:
+            self._in_progress.difference_update(claimed)
+
+        self.processed += 1
+        await self._ack(message, acks)
+        return True
+
+    async def _ack(self, message: Mapping[str, Any], acks: SQSAckBuffer) -> None:
+        self._release(message)
+        await acks.ack(message["receipt_handle"])
+
+    def _release(self, message: Mapping[str, Any]) -> None:
+        if self._heartbeat is not None:
+            self._heartbeat.untrack(message["receipt_handle"])
+
+    async def _seen(self, keys: List[str]) -> bool:
+        store = self.idempotency
+        assert store is not None
+        if isinstance(store, InMemoryIdempotencyStore):
+            return any(store.seen(key) for key in keys)
+        # Persistent stores block on disk I/O.
+        return await get_executor("idempotency").run(lambda: any(store.seen(key) for key in keys))
+
+    async def _mark(self, keys: List[str]) -> None:
+        store = self.idempotency
+        assert store is not None
+        if isinstance(store, InMemoryIdempotencyStore):
+            for key in keys:
+                store.mark(key)
+            return
+
+        def mark_all() -> None:
+            for key in keys:
+                store.mark(key)
+
+        await get_executor("idempotency").run(mark_all)
+
+    async def _dispatch(self, message: Mapping[str, Any]) -> Any:
+        if isinstance(message, QueueMessage) and self.mode == "process":
+            message = message.to_dict()
+        if self._pool is None:
+            return await self.handler(message)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._pool, self.handler, message)
+
+    def _create_pool(self) -> Optional[Executor]:
+        if self.mode == "thread":
+            return ThreadPoolExecutor(
+                max_workers=self.concurrency, thread_name_prefix="sqs-consumer"
+            )
+        if self.mode == "process":
+            return ProcessPoolExecutor(max_workers=self.concurrency)
+        return None
+
+    def _install_signal_handlers(self, loop: asyncio.AbstractEventLoop) -> List[int]:
+        installed: List[int] = []
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            try:
+                loop.add_signal_handler(signum, self.stop)
+            except (NotImplementedError, RuntimeError, ValueError):
+                # Windows, or a loop that is not running in the main thread.
+                continue
+            installed.append(signum)
+        return installed
+
+
+def _message_group(message: Mapping[str, Any]) -> Optional[str]:
+    if isinstance(message, QueueMessage):
+        return message.group_id
+    return None
+
+
+def _received_at(message: Mapping[str, Any], now: float) -> float:
+    # SQS caps the total visibility at 12 hours from the first receive, so
+    # redelivered messages start with less headroom than fresh ones.
+    first_receive = None
+    if isinstance(message, QueueMessage):
+        first_receive = message.attributes.get("ApproximateFirstReceiveTimestamp")
+    if not first_receive:
+        return now
+    age = time.time() - int(first_receive) / 1000
+    return now - max(age, 0.0)
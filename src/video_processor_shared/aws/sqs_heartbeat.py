@@ -0,0 +1,153 @@
+"""Visibility-timeout heartbeats for long-running SQS messages.
+
+A message whose processing outlasts the queue's visibility timeout becomes
+visible again and is picked up by a second worker. VisibilityHeartbeat keeps
+the messages it tracks invisible: every interval it pushes their visibility
+timeout forward with ChangeMessageVisibilityBatch, until the message is
+untracked or its total extension reaches max_extension (SQS itself caps a
+message at 12 hours from its first receive).
+"""
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from types import TracebackType
+from typing import AsyncIterator, Callable, Dict, Optional, Type
+
+from video_processor_shared.aws.batching import BatchOperationError
+from video_processor_shared.aws.sqs_service import SQSService
+
+logger = logging.getLogger(__name__)
+
+MAX_VISIBILITY_EXTENSION = 12 * 60 * 60
+
+
+class VisibilityHeartbeat:
+    """
+    Periodically extends the visibility timeout of in-flight messages.
+
+    Usage:
+        async with VisibilityHeartbeat(sqs, visibility_timeout=120) as heartbeat:
+            async with heartbeat.keep_alive(message["receipt_handle"]):
+                await process_video(message["body"])
+    """
+
+    def __init__(
+        self,
+        service: SQSService,
+        visibility_timeout: int = 60,
+        interval: Optional[float] = None,
+        max_extension: int = MAX_VISIBILITY_EXTENSION,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        """
+        Create a heartbeat manager.
+
+        Args:
+            service: SQSService of the queue the messages came from
+            visibility_timeout: Seconds each heartbeat keeps a message invisible
+            interval: Seconds between heartbeats (default: a third of
+                visibility_timeout, so one missed beat is tolerated)
+            max_extension: Maximum seconds a message is kept invisible in
+                total, counted from when it was received
+            clock: Time source, injectable for tests
+        """
+        self.service = service
+        self.visibility_timeout = visibility_timeout
+        self.interval = interval if interval is not None else visibility_timeout / 3
+        self.max_extension = min(max_extension, MAX_VISIBILITY_EXTENSION)
+        self.extended = 0
+        self.expired = 0
+        self._clock = clock
+        self._tracked: Dict[str, float] = {}
+        self._task: Optional["asyncio.Task[None]"] = None
+
+    @property
+    def tracked(self) -> int:
+        """Number of messages currently kept alive."""
+        return len(self._tracked)
+
+    def track(self, receipt_handle: str, received_at: Optional[float] = None) -> None:
+        """
+        Start extending a message's visibility timeout.
+
+        Args:
+            receipt_handle: Receipt handle of the message
+            received_at: Clock time the message was first received, which
+                max_extension is measured from (default: now)
+        """
+        self._tracked.setdefault(
+            receipt_handle, self._clock() if received_at is None else received_at
+        )
+
+    def untrack(self, receipt_handle: str) -> None:
+        """Stop extending a message, e.g. after it was processed."""
+        self._tracked.pop(receipt_handle, None)
+
+    @asynccontextmanager
+    async def keep_alive(self, receipt_handle: str) -> AsyncIterator[None]:
+        """Track a message for the duration of the block."""
+        self.track(receipt_handle)
+        try:
+            yield
+        finally:
+            self.untrack(receipt_handle)
+
+    def start(self) -> None:
+        """Start the background heartbeat task."""
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def close(self) -> None:
+        """Stop the background task; tracked messages are no longer extended."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def __aenter__(self) -> "VisibilityHeartbeat":
+        self.start()
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        await self.close()
+
+    async def beat(self) -> None:
+        """Extend every tracked message once."""
+        now = self._clock()
+        timeouts: Dict[str, int] = {}
+        for handle, received_at in list(self._tracked.items()):
+            remaining = int(self.max_extension - (now - received_at))
+            if remaining <= 0:
+                self.untrack(handle)
+                self.expired += 1
+                continue
+            timeouts[handle] = min(self.visibility_timeout, remaining)
+        if not timeouts:
+            return
+
+        try:
+            await self.service.change_visibility_batch(timeouts)
+        except BatchOperationError as error:
+            handles = list(timeouts)
+            for index, failure in error.failures.items():
+                if failure.sender_fault:
+                    # Deleted, expired or already visible again: nothing to extend.
+                    self.untrack(handles[index])
+                logger.warning("Visibility heartbeat failed for %s: %s", handles[index], failure)
+            self.extended += len(timeouts) - len(error.failures)
+            return
+        self.extended += len(timeouts)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.beat()
+            except Exception:
+                logger.exception("Visibility heartbeat for %s failed", self.service.queue_name)
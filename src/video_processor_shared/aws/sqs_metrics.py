@@ -0,0 +1,160 @@
+"""Cached SQS queue metrics for dashboards and autoscaling.
+
+QueueMetricsPoller fetches the visible, in-flight and delayed message counts
+of many queues on a fixed interval and serves the latest values from
+memory, so callers never hit the SQS control plane directly. From
+consecutive samples it tracks the net rate at which each queue's visible
+backlog grows or shrinks (smoothed with an exponentially weighted moving
+average) and derives a drain-time estimate and a backlog-per-worker signal.
+"""
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, replace
+from types import TracebackType
+from typing import TYPE_CHECKING, Callable, Dict, Optional, Sequence, Type
+
+if TYPE_CHECKING:
+    from video_processor_shared.aws.sqs_service import SQSService
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class QueueMetrics:
+    """
+    Message counts of a queue at a point in time.
+
+    Attributes:
+        queue_name: Queue the counts belong to.
+        visible: Messages available for retrieval.
+        in_flight: Messages received but not yet deleted.
+        delayed: Messages not yet visible because of a delay.
+        fetched_at: Poller clock time when the counts were fetched.
+        net_rate: Smoothed change of visible messages per second
+            (negative while the queue drains; None until two samples).
+    """
+
+    queue_name: str
+    visible: int
+    in_flight: int
+    delayed: int
+    fetched_at: float = 0.0
+    net_rate: Optional[float] = None
+
+    @property
+    def total(self) -> int:
+        return self.visible + self.in_flight + self.delayed
+
+    @property
+    def drain_seconds(self) -> Optional[float]:
+        """Estimated seconds until no messages are visible (None if not draining)."""
+        if self.visible == 0:
+            return 0.0
+        if self.net_rate is None or self.net_rate >= 0:
+            return None
+        return self.visible / -self.net_rate
+
+    def backlog_per_worker(self, workers: int) -> float:
+        """Visible messages per worker; compare against a per-worker target to scale."""
+        return self.visible / max(workers, 1)
+
+
+class QueueMetricsPoller:
+    """
+    Polls the metrics of several queues in the background.
+
+    Usage:
+        async with QueueMetricsPoller([SQSService("job-queue")], interval=30) as poller:
+            metrics = poller.get("job-queue")
+            if metrics and metrics.backlog_per_worker(workers) > 20:
+                scale_out()
+    """
+
+    def __init__(
+        self,
+        services: Sequence["SQSService"],
+        interval: float = 30.0,
+        smoothing: float = 0.3,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        """
+        Create a poller.
+
+        Args:
+            services: SQSService of every queue to watch
+            interval: Seconds between polls
+            smoothing: EWMA weight of the newest rate sample (0-1]
+            clock: Time source, injectable for tests
+        """
+        self.services = list(services)
+        self.interval = interval
+        self.smoothing = smoothing
+        self._clock = clock
+        self._metrics: Dict[str, QueueMetrics] = {}
+        self._task: Optional["asyncio.Task[None]"] = None
+
+    def get(self, queue_name: str) -> Optional[QueueMetrics]:
+        """Get the latest metrics of a queue, if it was polled yet."""
+        return self._metrics.get(queue_name)
+
+    def snapshot(self) -> Dict[str, QueueMetrics]:
+        """Get the latest metrics of every polled queue."""
+        return dict(self._metrics)
+
+    async def poll_once(self) -> Dict[str, QueueMetrics]:
+        """Fetch every queue's metrics now and update the cached values."""
+        results = await asyncio.gather(
+            *(service.get_queue_metrics() for service in self.services),
+            return_exceptions=True,
+        )
+        now = self._clock()
+        for service, result in zip(self.services, results):
+            if isinstance(result, BaseException):
+                # Keep serving the previous sample until the next poll.
+                logger.warning("Fetching metrics of %s failed: %s", service.queue_name, result)
+                continue
+            self._metrics[service.queue_name] = self._update(result, now)
+        return self.snapshot()
+
+    def start(self) -> None:
+        """Start polling in the background."""
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def __aenter__(self) -> "QueueMetricsPoller":
+        await self.poll_once()
+        self.start()
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        await self.close()
+
+    def _update(self, metrics: QueueMetrics, now: float) -> QueueMetrics:
+        previous = self._metrics.get(metrics.queue_name)
+        net_rate = None
+        if previous is not None and now > previous.fetched_at:
+            rate = (metrics.visible - previous.visible) / (now - previous.fetched_at)
+            if previous.net_rate is None:
+                net_rate = rate
+            else:
+                net_rate = self.smoothing * rate + (1 - self.smoothing) * previous.net_rate
+        elif previous is not None:
+            net_rate = previous.net_rate
+        return replace(metrics, fetched_at=now, net_rate=net_rate)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.poll_once()
@@ -0,0 +1,81 @@
+"""Adaptive long-polling for SQS receive loops.
+
+Every ReceiveMessage call is billed, whether or not it returns messages.
+AdaptiveReceivePolicy tunes each request from the outcome of recent ones:
+the batch size jumps to the maximum as soon as a receive comes back full
+(there is a backlog) and shrinks when receives come back short, and the
+long-poll wait grows with the share of recent receives that were empty, so
+an idle queue is polled with the longest wait while a busy one returns
+quickly.
+"""
+import threading
+from collections import deque
+from typing import Deque, Tuple
+
+from video_processor_shared.aws.batching import MAX_BATCH_ENTRIES
+
+MAX_WAIT_SECONDS = 20
+
+
+class AdaptiveReceivePolicy:
+    """
+    Chooses MaxNumberOfMessages and WaitTimeSeconds for each receive.
+
+    Usage:
+        policy = AdaptiveReceivePolicy()
+        while running:
+            max_messages, wait = policy.next_request()
+            messages = await sqs.receive_messages(max_messages, wait)
+            policy.record(len(messages))
+    """
+
+    def __init__(
+        self,
+        min_batch: int = 1,
+        max_batch: int = MAX_BATCH_ENTRIES,
+        min_wait: int = 1,
+        max_wait: int = MAX_WAIT_SECONDS,
+        window: int = 20,
+    ) -> None:
+        """
+        Create a policy.
+
+        Args:
+            min_batch: Smallest batch size requested
+            max_batch: Batch size requested under backlog (at most 10)
+            min_wait: Wait time when no recent receive was empty
+            max_wait: Wait time when every recent receive was empty (at most 20)
+            window: Number of recent receives the empty rate is computed over
+        """
+        self.min_batch = max(1, min_batch)
+        self.max_batch = min(max_batch, MAX_BATCH_ENTRIES)
+        self.min_wait = max(0, min_wait)
+        self.max_wait = min(max_wait, MAX_WAIT_SECONDS)
+        self._lock = threading.Lock()
+        self._batch = self.max_batch
+        self._outcomes: Deque[bool] = deque(maxlen=window)
+
+    @property
+    def empty_rate(self) -> float:
+        """Share of recent receives that returned no messages."""
+        with self._lock:
+            if not self._outcomes:
+                return 1.0
+            return sum(self._outcomes) / len(self._outcomes)
+
+    def next_request(self) -> Tuple[int, int]:
+        """Get (max_messages, wait_time_seconds) for the next receive."""
+        wait = self.min_wait + round((self.max_wait - self.min_wait) * self.empty_rate)
+        with self._lock:
+            return self._batch, wait
+
+    def record(self, received: int) -> None:
+        """Record how many messages the last receive returned."""
+        with self._lock:
+            self._outcomes.append(received == 0)
+            if received >= self._batch:
+                self._batch = self.max_batch
+            elif received == 0:
+                self._batch = max(self.min_batch, self._batch // 2)
+            else:
+                self._batch = max(self.min_batch, received)
@@ -1,88 +1,301 @@
 """SQS Queue Service using boto3.
 
-Works with both LocalStack and real AWS SQS.
+Works with both LocalStack and real AWS SQS. Blocking boto3 calls run on the
+shared "sqs" executor, so a 20 second long poll does not block the event loop.
+Bodies too large for SQS are offloaded to S3 as claim checks.
+
+Queues whose name ends in ".fifo" are FIFO queues: messages are grouped by
+their user_id, so each user's messages stay in order while different users
+are processed in parallel, and deduplicated by their event_id (or a hash of
+the body), so producer retries are not delivered twice.
 """
+import asyncio
+import hashlib
 import json
 import os
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 
 from video_processor_shared.aws import get_sqs_client, get_sqs_queue_url
+from video_processor_shared.aws.batching import EntryFailure, batch_outcome, run_batched
+from video_processor_shared.aws.claim_check import ClaimCheckStore, default_claim_check_store
+from video_processor_shared.aws.executor import AsyncExecutor, get_executor
+from video_processor_shared.aws.messages import QueueMessage
+from video_processor_shared.aws.serializers import (
+    CONTENT_TYPE_ATTRIBUTE,
+    Serializer,
+    default_serializer,
+)
+from video_processor_shared.aws.sqs_metrics import QueueMetrics
+
+# Message group of FIFO messages that carry no user_id.
+DEFAULT_MESSAGE_GROUP = "default"
 
 
 class SQSService:
     """SQS message queue service."""
 
-    def __init__(self, queue_name: Optional[str] = None) -> None:
+    def __init__(
+        self,
+        queue_name: Optional[str] = None,
+        executor: Optional[AsyncExecutor] = None,
+        claim_checks: Optional[ClaimCheckStore] = None,
+        serializer: Optional[Serializer] = None,
+    ) -> None:
         self.client = get_sqs_client()
+        self.executor = executor or get_executor("sqs")
+        self.claim_checks = claim_checks or default_claim_check_store()
+        self.serializer = serializer or default_serializer()
         self.queue_name: str = queue_name or os.getenv("SQS_QUEUE_NAME") or "job-queue"
+        self.fifo = self.queue_name.endswith(".fifo")
         self.queue_url = get_sqs_queue_url(self.queue_name)
 
     async def send_message(
         self,
         message: Dict[str, Any],
         delay_seconds: int = 0,
+        group_id: Optional[str] = None,
+        deduplication_id: Optional[str] = None,
     ) -> str:
         """
         Send a message to the queue.
 
         Args:
-            message: Dictionary to send as JSON
-            delay_seconds: Delay before message becomes visible (0-900)
+            message: Dictionary to send, encoded with the service serializer;
+                offloaded to S3 when larger than the claim-check threshold
+            delay_seconds: Delay before message becomes visible (0-900);
+                must be 0 for FIFO queues
+            group_id: FIFO message group (default: the message's user_id)
+            deduplication_id: FIFO deduplication id (default: the message's
+                event_id, or a hash of the body)
 
         Returns:
             Message ID
+
+        Raises:
+            ValueError: If delay_seconds is set for a FIFO queue
         """
-        response = self.client.send_message(
-            QueueUrl=self.queue_url,
-            MessageBody=json.dumps(message),
-            DelaySeconds=delay_seconds,
+        send_args = await self._message_args(message, delay_seconds, group_id, deduplication_id)
+        response = await self.executor.run(
+            self.client.send_message, QueueUrl=self.queue_url, **send_args
         )
         return str(response["MessageId"])
 
+    async def send_messages(
+        self,
+        messages: Sequence[Dict[str, Any]],
+        delay_seconds: int = 0,
+        max_attempts: int = 3,
+    ) -> List[str]:
+        """
+        Send many messages using SendMessageBatch.
+
+        Messages are packed into batches of up to 10 entries and 256 KiB,
+        batches are sent concurrently, and entries that fail for a
+        transient reason are retried with backoff. For FIFO queues batches
+        are sent one after another so each group keeps its order; a retried
+        entry may still land after later messages of its group.
+
+        Args:
+            messages: Dictionaries to send, encoded with the service serializer
+            delay_seconds: Delay before messages become visible (0-900)
+            max_attempts: Attempts per message, including the first
+
+        Returns:
+            Message IDs in the same order as messages
+
+        Raises:
+            BatchOperationError: If some messages could not be sent; its
+                results hold the IDs of the ones that were
+        """
+        entries = await asyncio.gather(
+            *(self._message_args(message, delay_seconds) for message in messages)
+        )
+
+        async def send_batch(indexes: List[int]) -> Tuple[Dict[int, Any], Dict[int, EntryFailure]]:
+            response = await self.executor.run(
+                self.client.send_message_batch,
+                QueueUrl=self.queue_url,
+                Entries=[{"Id": str(index), **entries[index]} for index in indexes],
+            )
+            return batch_outcome(response, "MessageId")
+
+        sizes = [
+            len(entry["MessageBody"].encode("utf-8"))
+            + len(json.dumps(entry.get("MessageAttributes", {})))
+            for entry in entries
+        ]
+        return await run_batched(
+            sizes, send_batch, max_attempts=max_attempts, concurrent=not self.fifo
+        )
+
+    async def _message_args(
+        self,
+        message: Dict[str, Any],
+        delay_seconds: int,
+        group_id: Optional[str] = None,
+        deduplication_id: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        text = self.serializer.dumps(message)
+        args: Dict[str, Any] = {"MessageBody": await self.claim_checks.offload(text)}
+        if self.fifo:
+            if delay_seconds:
+                raise ValueError("FIFO queues do not support per-message delays")
+            args["MessageGroupId"] = str(
+                group_id or message.get("user_id") or DEFAULT_MESSAGE_GROUP
+            )
+            args["MessageDeduplicationId"] = str(
+                deduplication_id
+                or message.get("event_id")
+                or hashlib.sha256(text.encode("utf-8")).hexdigest()
+            )
+        else:
+            args["DelaySeconds"] = delay_seconds
+        attributes = self.serializer.message_attributes()
+        if attributes:
+            args["MessageAttributes"] = attributes
+        return args
+
     async def receive_messages(
         self,
         max_messages: int = 1,
         wait_time_seconds: int = 20,
-    ) -> List[Dict[str, Any]]:
+        attribute_names: Optional[Sequence[str]] = None,
+        message_attribute_names: Optional[Sequence[str]] = None,
+    ) -> List[QueueMessage]:
         """
         Receive messages from the queue.
 
         Args:
             max_messages: Maximum number of messages to receive (1-10)
             wait_time_seconds: Long polling wait time (0-20)
+            attribute_names: System attributes to return (default: all).
+                MessageGroupId is always requested from FIFO queues
+            message_attribute_names: Message attributes to return (default:
+                all). The content_type attribute is always requested so
+                bodies decode with the right serializer
 
         Returns:
-            List of messages with body and receipt_handle
+            List of messages with message_id, body and receipt_handle.
+            Bodies are decoded, and claim checks resolved, on first access
         """
-        response = self.client.receive_message(
+        response = await self.executor.run(
+            self.client.receive_message,
             QueueUrl=self.queue_url,
             MaxNumberOfMessages=max_messages,
             WaitTimeSeconds=wait_time_seconds,
-            AttributeNames=["All"],
-            MessageAttributeNames=["All"],
+            AttributeNames=_with_required(
+                attribute_names, ["MessageGroupId"] if self.fifo else []
+            ),
+            MessageAttributeNames=_with_required(
+                message_attribute_names, [CONTENT_TYPE_ATTRIBUTE]
+            ),
         )
 
-        messages = []
-        for msg in response.get("Messages", []):
-            messages.append({
-                "message_id": msg["MessageId"],
-                "body": json.loads(msg["Body"]),
-                "receipt_handle": msg["ReceiptHandle"],
-            })
-
-        return messages
+        return [
+            QueueMessage.from_response(msg, self.claim_checks)
+            for msg in response.get("Messages", [])
+        ]
 
     async def delete_message(self, receipt_handle: str) -> None:
         """Delete a message from the queue after processing."""
-        self.client.delete_message(
+        await self.executor.run(
+            self.client.delete_message,
             QueueUrl=self.queue_url,
             ReceiptHandle=receipt_handle,
         )
 
+    async def delete_messages(self, receipt_handles: Sequence[str], max_attempts: int = 3) -> None:
+        """
+        Delete many messages using DeleteMessageBatch (10 per request).
+
+        Raises:
+            BatchOperationError: If some messages could not be deleted
+        """
+        async def delete_batch(indexes: List[int]) -> Tuple[Dict[int, Any], Dict[int, EntryFailure]]:
+            response = await self.executor.run(
+                self.client.delete_message_batch,
+                QueueUrl=self.queue_url,
+                Entries=[
+                    {"Id": str(index), "ReceiptHandle": receipt_handles[index]}
+                    for index in indexes
+                ],
+            )
+            return batch_outcome(response, "Id")
+
+        sizes = [len(handle) for handle in receipt_handles]
+        await run_batched(sizes, delete_batch, max_attempts=max_attempts)
+
+    async def change_visibility_batch(
+        self,
+        timeouts: Dict[str, int],
+        max_attempts: int = 3,
+    ) -> None:
+        """
+        Change the visibility timeout of many messages using
+        ChangeMessageVisibilityBatch (10 per request).
+
+        Args:
+            timeouts: New visibility timeout in seconds, by receipt handle
+            max_attempts: Attempts per message, including the first
+
+        Raises:
+            BatchOperationError: If some timeouts could not be changed;
+                failures are indexed by position in timeouts
+        """
+        handles = list(timeouts)
+
+        async def change_batch(indexes: List[int]) -> Tuple[Dict[int, Any], Dict[int, EntryFailure]]:
+            response = await self.executor.run(
+                self.client.change_message_visibility_batch,
+                QueueUrl=self.queue_url,
+                Entries=[
+                    {
+                        "Id": str(index),
+                        "ReceiptHandle": handles[index],
+                        "VisibilityTimeout": timeouts[handles[index]],
+                    }
+                    for index in indexes
+                ],
+            )
+            return batch_outcome(response, "Id")
+
+        sizes = [len(handle) for handle in handles]
+        await run_batched(sizes, change_batch, max_attempts=max_attempts)
+
     async def get_queue_size(self) -> int:
         """Get approximate number of messages in queue."""
-        response = self.client.get_queue_attributes(
+        response = await self.executor.run(
+            self.client.get_queue_attributes,
             QueueUrl=self.queue_url,
             AttributeNames=["ApproximateNumberOfMessages"],
         )
         return int(response["Attributes"]["ApproximateNumberOfMessages"])
+
+    async def get_queue_metrics(self) -> QueueMetrics:
+        """
+        Get visible, in-flight and delayed message counts in one request.
+
+        For frequent reads, use a QueueMetricsPoller instead.
+        """
+        response = await self.executor.run(
+            self.client.get_queue_attributes,
+            QueueUrl=self.queue_url,
+            AttributeNames=[
+                "ApproximateNumberOfMessages",
+                "ApproximateNumberOfMessagesNotVisible",
+                "ApproximateNumberOfMessagesDelayed",
+            ],
+        )
+        attributes = response["Attributes"]
+        return QueueMetrics(
+            queue_name=self.queue_name,
+            visible=int(attributes.get("ApproximateNumberOfMessages", 0)),
+            in_flight=int(attributes.get("ApproximateNumberOfMessagesNotVisible", 0)),
+            delayed=int(attributes.get("ApproximateNumberOfMessagesDelayed", 0)),
+        )
+
+
+def _with_required(names: Optional[Sequence[str]], required: List[str]) -> List[str]:
+    if names is None or "All" in names:
+        return ["All"]
+    return list(names) + [name for name in required if name not in names]
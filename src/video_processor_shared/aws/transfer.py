@@ -0,0 +1,90 @@
+"""S3 multipart transfer profiles.
+
+boto3's default TransferConfig uses 8 MiB parts and 10 threads for every
+object. TransferProfile makes those knobs configurable per service and per
+call, and sizes parts from the known object size so large uploads stay
+within S3's 10,000 part limit while small ones still spread across workers.
+"""
+import math
+import os
+from dataclasses import dataclass, replace
+from typing import Optional
+
+from boto3.s3.transfer import TransferConfig  # type: ignore[import-untyped]
+
+MIB = 1024 * 1024
+
+# S3 multipart limits
+MIN_PART_SIZE = 5 * MIB
+MAX_PART_SIZE = 5 * 1024 * MIB
+MAX_PARTS = 10_000
+
+
+@dataclass(frozen=True)
+class TransferProfile:
+    """
+    Tuning for S3 multipart transfers.
+
+    Attributes:
+        part_size: Preferred multipart part size in bytes.
+        max_concurrency: Maximum parts transferred in parallel.
+        threshold: Objects at least this large use multipart transfers.
+        memory_budget: Upper bound in bytes for parts buffered in memory
+            (part_size * concurrency). None means unbounded.
+    """
+
+    part_size: int = 8 * MIB
+    max_concurrency: int = 10
+    threshold: int = 8 * MIB
+    memory_budget: Optional[int] = None
+
+    @classmethod
+    def from_env(cls) -> "TransferProfile":
+        """Build a profile from S3_TRANSFER_* environment variables (sizes in MiB)."""
+        memory_budget = os.getenv("S3_TRANSFER_MEMORY_BUDGET_MB")
+        return cls(
+            part_size=int(os.getenv("S3_TRANSFER_PART_SIZE_MB", "8")) * MIB,
+            max_concurrency=int(os.getenv("S3_TRANSFER_CONCURRENCY", "10")),
+            threshold=int(os.getenv("S3_TRANSFER_THRESHOLD_MB", "8")) * MIB,
+            memory_budget=int(memory_budget) * MIB if memory_budget else None,
+        )
+
+    @property
+    def effective_concurrency(self) -> int:
+        """Concurrency after applying the memory budget (at least 1)."""
+        if self.memory_budget is None:
+            return self.max_concurrency
+        return max(1, min(self.max_concurrency, self.memory_budget // self.part_size))
+
+    def for_size(self, file_size: Optional[int]) -> "TransferProfile":
+        """
+        Get a profile with the part size adapted to an object size.
+
+        Parts grow when the object would otherwise need more than 10,000
+        parts, and shrink (down to the 5 MiB S3 minimum) when the object is
+        too small to give every worker a part.
+
+        Args:
+            file_size: Object size in bytes, if known
+
+        Returns:
+            A new profile; self when the size is unknown
+        """
+        if not file_size or file_size < self.threshold:
+            return self
+
+        part_size = max(self.part_size, math.ceil(file_size / MAX_PARTS))
+        if file_size < part_size * self.max_concurrency:
+            part_size = max(MIN_PART_SIZE, math.ceil(file_size / self.max_concurrency))
+
+        part_size = min(MAX_PART_SIZE, math.ceil(part_size / MIB) * MIB)
+        return replace(self, part_size=part_size)
+
+    def to_transfer_config(self) -> TransferConfig:
+        """Build the boto3 TransferConfig for this profile."""
+        return TransferConfig(
+            multipart_threshold=self.threshold,
+            multipart_chunksize=self.part_size,
+            max_concurrency=self.effective_concurrency,
+            use_threads=True,
+        )
@@ -0,0 +1,221 @@
+"""Size-bounded local disk cache for downloaded source videos.
+
+Retried and re-run jobs download the same source video again. The cache
+keeps recent downloads on local disk keyed by S3 key and ETag, so a changed
+object is never served stale. Files are written atomically (download to a
+temporary file, then rename) and delivered to the caller's destination by
+reflink, hard link or copy, in that order of preference. The least recently
+used files are evicted once the cache exceeds its byte budget. Hard-linked
+destinations share the cached file, so callers must treat them as read-only.
+"""
+import hashlib
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, List, Optional
+from uuid import uuid4
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None  # type: ignore[assignment]
+
+# ioctl request for copy-on-write clones on Linux (btrfs, xfs, ...)
+FICLONE = 0x40049409
+
+# Concurrent fetches of one object are serialized by one of these locks.
+KEY_LOCK_STRIPES = 64
+
+# Temporary files of unknown owners older than this are treated as abandoned.
+STALE_TEMP_SECONDS = 6 * 60 * 60
+
+Loader = Callable[[str], None]
+
+
+@dataclass(frozen=True)
+class VideoCacheStats:
+    """Counters for a LocalVideoCache."""
+
+    hits: int
+    misses: int
+    evictions: int
+    entries: int
+    size_bytes: int
+
+
+class LocalVideoCache:
+    """Read-through LRU cache of S3 objects on local disk."""
+
+    def __init__(self, directory: str, max_bytes: int) -> None:
+        """
+        Open a cache directory, indexing files left by previous runs.
+
+        Args:
+            directory: Cache directory (created if missing)
+            max_bytes: Disk budget; least recently used files are evicted beyond it
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._key_locks: List[threading.Lock] = [
+            threading.Lock() for _ in range(KEY_LOCK_STRIPES)
+        ]
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._size = 0
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    @property
+    def stats(self) -> VideoCacheStats:
+        with self._lock:
+            return VideoCacheStats(
+                self.hits, self.misses, self.evictions, len(self._entries), self._size
+            )
+
+    def fetch(self, key: str, etag: str, destination: str, loader: Loader) -> bool:
+        """
+        Place the object at destination, downloading it only on a miss.
+
+        Concurrent fetches of the same object wait for a single download.
+
+        Args:
+            key: S3 object key
+            etag: Current ETag of the object
+            destination: Local path to deliver the file to
+            loader: Called with a temporary path to download the object into
+
+        Returns:
+            True on a cache hit, False when the object was downloaded
+        """
+        name = hashlib.sha256(f"{key}\0{etag}".encode()).hexdigest()
+        with self._key_lock(name):
+            if self._deliver_cached(name, destination):
+                return True
+
+            with self._lock:
+                self.misses += 1
+            temporary = os.path.join(
+                self.directory, f".{name}.{os.getpid()}.{uuid4().hex}.tmp"
+            )
+            try:
+                loader(temporary)
+                size = os.path.getsize(temporary)
+                if size > self.max_bytes:
+                    shutil.move(temporary, destination)
+                    return False
+                path = self._path(name)
+                os.replace(temporary, path)
+            finally:
+                if os.path.exists(temporary):
+                    os.remove(temporary)
+
+            # Deliver before indexing: an unindexed file cannot be evicted by
+            # a concurrent fetch of another object.
+            _deliver(path, destination)
+            self._add_entry(name, size)
+            return False
+
+    def _deliver_cached(self, name: str, destination: str) -> bool:
+        with self._lock:
+            if name not in self._entries:
+                return False
+            self._entries.move_to_end(name)
+        path = self._path(name)
+        try:
+            os.utime(path)
+            _deliver(path, destination)
+        except FileNotFoundError:
+            # Evicted or removed externally between lookup and delivery.
+            self._remove_entry(name)
+            return False
+        with self._lock:
+            self.hits += 1
+        return True
+
+    def _add_entry(self, name: str, size: int) -> None:
+        evicted = []
+        with self._lock:
+            self._size += size - self._entries.pop(name, 0)
+            self._entries[name] = size
+            while self._size > self.max_bytes and len(self._entries) > 1:
+                oldest, oldest_size = self._entries.popitem(last=False)
+                self._size -= oldest_size
+                self.evictions += 1
+                evicted.append(oldest)
+        for oldest in evicted:
+            _remove_quietly(self._path(oldest))
+
+    def _remove_entry(self, name: str) -> None:
+        with self._lock:
+            self._size -= self._entries.pop(name, 0)
+
+    def _key_lock(self, name: str) -> threading.Lock:
+        return self._key_locks[int(name[:8], 16) % KEY_LOCK_STRIPES]
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _load_index(self) -> None:
+        files = []
+        for entry in os.scandir(self.directory):
+            if not entry.is_file():
+                continue
+            stat = entry.stat()
+            if entry.name.startswith("."):
+                # Temporary file; it may belong to a download still running in
+                # another process sharing the directory.
+                if _is_abandoned(entry.name, stat.st_mtime):
+                    _remove_quietly(entry.path)
+                continue
+            files.append((stat.st_mtime, entry.name, stat.st_size))
+        for _, name, size in sorted(files):
+            self._entries[name] = size
+            self._size += size
+
+
+def _deliver(source: str, destination: str) -> None:
+    _remove_quietly(destination)
+    if fcntl is not None:
+        try:
+            with open(source, "rb") as src, open(destination, "wb") as dst:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+            return
+        except OSError:
+            _remove_quietly(destination)
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copyfile(source, destination)
+
+
+def _is_abandoned(temporary_name: str, modified_at: float) -> bool:
+    owner = _temporary_owner(temporary_name)
+    if owner is not None and owner != os.getpid():
+        try:
+            os.kill(owner, 0)
+        except ProcessLookupError:
+            return True
+        except PermissionError:
+            pass
+    return time.time() - modified_at > STALE_TEMP_SECONDS
+
+
+def _temporary_owner(temporary_name: str) -> Optional[int]:
+    # Temporary files are named .<name>.<pid>.<random>.tmp
+    parts = temporary_name.split(".")
+    if len(parts) == 5 and parts[2].isdigit():
+        return int(parts[2])
+    return None
+
+
+def _remove_quietly(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
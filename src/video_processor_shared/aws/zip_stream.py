@@ -0,0 +1,239 @@
+"""Streaming ZIP-to-S3 writer.
+
+Frames are added one at a time and written as ZIP entries into an in-memory
+buffer. Every time the buffer reaches the part size it is handed to a small
+thread pool as a multipart upload part, so compression, frame extraction and
+network I/O overlap and no temporary ZIP file is needed. A bounded ring of
+buffered parts applies backpressure when the network is slower than the
+producer.
+"""
+import os
+import threading
+import zipfile
+from concurrent.futures import Future, ThreadPoolExecutor
+from types import TracebackType
+from typing import Any, Dict, List, Optional, Type, Union
+
+from video_processor_shared.aws.transfer import MIB, MIN_PART_SIZE
+
+FrameData = Union[bytes, str, "os.PathLike[str]"]
+
+# Formats that are already compressed; deflating them only burns CPU.
+STORED_EXTENSIONS = frozenset({".jpg", ".jpeg", ".png", ".webp", ".gif", ".mp4", ".zip"})
+
+
+class _MultipartSink:
+    """Write-only, non-seekable file object that turns writes into multipart parts."""
+
+    def __init__(
+        self,
+        client: Any,
+        bucket: str,
+        key: str,
+        part_size: int,
+        max_concurrency: int,
+        max_buffered_parts: int,
+        content_type: str,
+    ) -> None:
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.part_size = max(part_size, MIN_PART_SIZE)
+        self.content_type = content_type
+        self.upload_id: Optional[str] = None
+        self._buffer = bytearray()
+        self._position = 0
+        self._pool = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="s3-zip")
+        self._slots = threading.BoundedSemaphore(max_buffered_parts)
+        self._futures: List["Future[Dict[str, Any]]"] = []
+        self._aborted = False
+
+    def write(self, data: bytes) -> int:
+        if self._aborted:
+            return len(data)
+        self._raise_failed_part()
+        self._buffer += data
+        self._position += len(data)
+        while len(self._buffer) >= self.part_size:
+            chunk = bytes(self._buffer[:self.part_size])
+            del self._buffer[:self.part_size]
+            self._submit(chunk)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self) -> None:
+        pass
+
+    def complete(self) -> None:
+        """Upload the remaining bytes and complete the object."""
+        if self.upload_id is None:
+            self.client.put_object(
+                Bucket=self.bucket,
+                Key=self.key,
+                Body=bytes(self._buffer),
+                ContentType=self.content_type,
+            )
+            self._pool.shutdown()
+            return
+
+        if self._buffer:
+            self._submit(bytes(self._buffer))
+            self._buffer.clear()
+        parts = [future.result() for future in self._futures]
+        self._pool.shutdown()
+        self.client.complete_multipart_upload(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self.upload_id,
+            MultipartUpload={"Parts": parts},
+        )
+
+    def abort(self) -> None:
+        """Stop uploading and discard the parts already sent."""
+        self._aborted = True
+        self._pool.shutdown(wait=True, cancel_futures=True)
+        if self.upload_id is not None:
+            self.client.abort_multipart_upload(
+                Bucket=self.bucket,
+                Key=self.key,
+                UploadId=self.upload_id,
+            )
+
+    def _submit(self, chunk: bytes) -> None:
+        if self.upload_id is None:
+            response = self.client.create_multipart_upload(
+                Bucket=self.bucket,
+                Key=self.key,
+                ContentType=self.content_type,
+            )
+            self.upload_id = response["UploadId"]
+
+        # Blocks when the ring of buffered parts is full.
+        self._slots.acquire()
+        part_number = len(self._futures) + 1
+        future = self._pool.submit(self._upload_part, part_number, chunk)
+        future.add_done_callback(lambda _: self._slots.release())
+        self._futures.append(future)
+
+    def _upload_part(self, part_number: int, chunk: bytes) -> Dict[str, Any]:
+        response = self.client.upload_part(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self.upload_id,
+            PartNumber=part_number,
+            Body=chunk,
+        )
+        return {"PartNumber": part_number, "ETag": response["ETag"]}
+
+    def _raise_failed_part(self) -> None:
+        for future in self._futures:
+            if future.done() and future.exception() is not None:
+                raise future.exception()  # type: ignore[misc]
+
+
+class FramesZipWriter:
+    """
+    Incrementally build a ZIP archive of frames directly in S3.
+
+    Usage:
+        with storage.open_frames_zip_writer(job_id) as writer:
+            for index, jpeg in enumerate(extract_frames(video)):
+                writer.add_frame(f"frame_{index:05d}.jpg", jpeg)
+        key = writer.key
+
+    Leaving the with block because of an exception aborts the multipart
+    upload instead of completing it.
+    """
+
+    def __init__(
+        self,
+        client: Any,
+        bucket: str,
+        key: str,
+        part_size: int = 8 * MIB,
+        max_concurrency: int = 4,
+        max_buffered_parts: Optional[int] = None,
+        compression: int = zipfile.ZIP_DEFLATED,
+    ) -> None:
+        """
+        Create a writer.
+
+        Args:
+            client: boto3 S3 client
+            bucket: Destination bucket
+            key: Destination object key
+            part_size: Multipart part size in bytes (at least 5 MiB)
+            max_concurrency: Parts uploaded in parallel
+            max_buffered_parts: Parts held in memory before add_frame blocks
+                (default: 2 * max_concurrency)
+            compression: Compression for entries that are not already compressed
+        """
+        self.key = key
+        self.compression = compression
+        self.frame_count = 0
+        self._sink = _MultipartSink(
+            client,
+            bucket,
+            key,
+            part_size,
+            max_concurrency,
+            max_buffered_parts or 2 * max_concurrency,
+            "application/zip",
+        )
+        self._zip = zipfile.ZipFile(self._sink, mode="w")  # type: ignore[call-overload]
+        self._closed = False
+
+    def add_frame(self, name: str, data: FrameData) -> None:
+        """
+        Add a frame to the archive.
+
+        Args:
+            name: Entry name inside the ZIP
+            data: Frame bytes, or a path to a frame file on disk
+        """
+        compress_type = self._compress_type(name)
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            self._zip.writestr(name, bytes(data), compress_type=compress_type)
+        else:
+            self._zip.write(data, arcname=name, compress_type=compress_type)
+        self.frame_count += 1
+
+    def close(self) -> str:
+        """Finish the archive, complete the upload and return the S3 key."""
+        if not self._closed:
+            self._closed = True
+            try:
+                self._zip.close()
+                self._sink.complete()
+            except BaseException:
+                self._sink.abort()
+                raise
+        return self.key
+
+    def abort(self) -> None:
+        """Discard the archive and any uploaded parts."""
+        if not self._closed:
+            self._closed = True
+            self._sink.abort()
+            # Writes are discarded from here on; this only releases the ZipFile.
+            self._zip.close()
+
+    def __enter__(self) -> "FramesZipWriter":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def _compress_type(self, name: str) -> int:
+        extension = os.path.splitext(name)[1].lower()
+        return zipfile.ZIP_STORED if extension in STORED_EXTENSIONS else self.compression
@@ -0,0 +1,13 @@
+"""Shared pytest fixtures."""
+
+import pytest
+
+from video_processor_shared.aws import reset_clients, s3_storage
+
+
+@pytest.fixture(autouse=True)
+def _isolated_aws_clients():
+    reset_clients()
+    s3_storage._presigned_urls.clear()
+    yield
+    reset_clients()
@@ -0,0 +1,716 @@
+"""Unit tests for S3 transfer tuning and storage extensions."""
+
+import asyncio
+import threading
+from io import BytesIO
+from types import SimpleNamespace
+from unittest.mock import Mock
+
+from video_processor_shared.aws.s3_storage import S3StorageService
+from video_processor_shared.aws.transfer import MIB, MIN_PART_SIZE, TransferProfile
+from video_processor_shared.dto import VideoUploadDTO
+
+
+def make_service(monkeypatch, client=None, **kwargs):
+    client = client or Mock()
+    monkeypatch.setattr("video_processor_shared.aws.s3_storage.get_s3_client", lambda: client)
+    return S3StorageService(input_bucket="in-bucket", output_bucket="out-bucket", **kwargs), client
+
+
+def test_transfer_profile_sizes_parts_from_file_size():
+    profile = TransferProfile(part_size=8 * MIB, max_concurrency=10, threshold=8 * MIB)
+
+    assert profile.for_size(None) is profile
+    assert profile.for_size(1 * MIB) is profile
+    # Small multipart objects are spread across workers, never below the S3 minimum.
+    assert profile.for_size(20 * MIB).part_size == MIN_PART_SIZE
+    assert profile.for_size(60 * MIB).part_size == 6 * MIB
+    assert profile.for_size(500 * MIB).part_size == 8 * MIB
+    # Huge objects grow parts to stay within 10,000 parts.
+    assert profile.for_size(200_000 * MIB).part_size == 20 * MIB
+
+
+def test_transfer_profile_memory_budget_and_env(monkeypatch):
+    profile = TransferProfile(part_size=16 * MIB, max_concurrency=20, memory_budget=64 * MIB)
+    config = profile.to_transfer_config()
+    assert config.max_concurrency == 4
+    assert config.multipart_chunksize == 16 * MIB
+    assert TransferProfile(part_size=16 * MIB, memory_budget=MIB).effective_concurrency == 1
+
+    monkeypatch.setenv("S3_TRANSFER_PART_SIZE_MB", "32")
+    monkeypatch.setenv("S3_TRANSFER_CONCURRENCY", "24")
+    monkeypatch.setenv("S3_TRANSFER_MEMORY_BUDGET_MB", "512")
+    env_profile = TransferProfile.from_env()
+    assert env_profile.part_size == 32 * MIB
+    assert env_profile.effective_concurrency == 16
+
+
+def test_upload_video_uses_call_profile_and_content_type(monkeypatch):
+    service, client = make_service(
+        monkeypatch, transfer_profile=TransferProfile(max_concurrency=4)
+    )
+    upload = VideoUploadDTO(filename="clip.mov", content_type="video/quicktime", file_size=400 * MIB)
+
+    asyncio.run(service.upload_video(BytesIO(b"x"), upload.filename, "u1", file_size=upload.file_size))
+    kwargs = client.upload_fileobj.call_args.kwargs
+    assert kwargs["ExtraArgs"] == {"ContentType": "video/quicktime"}
+    assert kwargs["Config"].max_concurrency == 4
+    assert kwargs["Config"].multipart_chunksize == 8 * MIB
+
+    asyncio.run(
+        service.upload_video(
+            BytesIO(b"x"),
+            "clip.bin",
+            "u1",
+            transfer_profile=TransferProfile(max_concurrency=32),
+        )
+    )
+    kwargs = client.upload_fileobj.call_args.kwargs
+    assert kwargs["ExtraArgs"] == {"ContentType": "application/octet-stream"}
+    assert kwargs["Config"].max_concurrency == 32
+
+
+def test_upload_frames_zip_sizes_parts_from_local_file(monkeypatch, tmp_path):
+    service, client = make_service(monkeypatch)
+    archive = tmp_path / "frames.zip"
+    archive.write_bytes(b"\0" * 1024)
+
+    asyncio.run(service.upload_frames_zip(str(archive), "job-1"))
+
+    args = client.upload_file.call_args
+    assert args.args == (str(archive), "out-bucket", "frames/job-1/frames.zip")
+    assert args.kwargs["ExtraArgs"] == {"ContentType": "application/zip"}
+
+
+class FakeRangeClient:
+    """S3 client double serving ranged GETs from an in-memory object."""
+
+    def __init__(self, data, fail_from=None, gate=None):
+        self.data = data
+        self.fail_from = fail_from
+        self.gate = gate
+        self.ranges = []
+
+    def head_object(self, Bucket, Key):  # noqa: N803
+        return {"ContentLength": len(self.data), "ETag": '"etag-1"'}
+
+    def get_object(self, Bucket, Key, Range, IfMatch=None):  # noqa: N803
+        assert IfMatch == '"etag-1"'
+        start, end = (int(part) for part in Range.split("=")[1].split("-"))
+        self.ranges.append(start)
+        if self.gate is not None:
+            self.gate.wait(5)
+        if self.fail_from is not None and start >= self.fail_from:
+            raise IOError("connection reset")
+        return {"Body": BytesIO(self.data[start:end + 1])}
+
+
+def test_ranged_download_writes_parts_in_place_and_reports_progress(monkeypatch, tmp_path):
+    data = bytes(range(256)) * 4096  # 1 MiB
+    client = FakeRangeClient(data)
+    service, _ = make_service(
+        monkeypatch,
+        client=client,
+        transfer_profile=TransferProfile(part_size=256 * 1024, max_concurrency=3),
+    )
+    progress = []
+    destination = tmp_path / "video.mp4"
+
+    async def scenario():
+        download = await service.start_video_download(
+            "videos/u1/v.mp4",
+            str(destination),
+            prefix_bytes=1000,
+            progress_callback=lambda done, total: progress.append((done, total)),
+        )
+        assert await download.wait_for_prefix() == 1000
+        return download, await download.wait()
+
+    download, path = asyncio.run(scenario())
+
+    assert path == str(destination)
+    assert destination.read_bytes() == data
+    assert sorted(client.ranges) == [0, 262144, 524288, 786432]
+    assert progress[-1] == (len(data), len(data))
+    assert download.bytes_downloaded == len(data)
+
+
+def test_ranged_download_with_mmap_and_empty_object(tmp_path):
+    from video_processor_shared.aws.ranged_download import RangedDownloader
+
+    data = b"frame-data" * 10_000
+    path = RangedDownloader(FakeRangeClient(data), part_size=30_000, use_mmap=True).download(
+        "b", "k", str(tmp_path / "a.bin")
+    )
+    assert open(path, "rb").read() == data
+
+    empty = RangedDownloader(FakeRangeClient(b"")).start("b", "k", str(tmp_path / "e.bin"), 10)
+    assert empty.prefix(timeout=1) == 0
+    assert empty.done
+
+
+def test_ranged_download_failure_and_cancellation(tmp_path):
+    import pytest
+
+    from video_processor_shared.aws.ranged_download import (
+        DownloadCancelledError,
+        RangedDownloader,
+    )
+
+    data = b"x" * 100_000
+    failing = RangedDownloader(FakeRangeClient(data, fail_from=50_000), part_size=10_000)
+    download = failing.start("b", "k", str(tmp_path / "f.bin"), prefix_bytes=len(data))
+    with pytest.raises(IOError):
+        download.result(timeout=5)
+    with pytest.raises(IOError):
+        download.prefix(timeout=5)
+
+    gate = threading.Event()
+    client = FakeRangeClient(data, gate=gate)
+    cancelled = RangedDownloader(client, part_size=1_000, max_concurrency=1)
+    download = cancelled.start("b", "k", str(tmp_path / "c.bin"))
+    download.cancel()
+    gate.set()
+    with pytest.raises(DownloadCancelledError):
+        download.result(timeout=5)
+    assert download.cancelled
+    assert len(client.ranges) == 1
+
+
+class FakeMultipartClient:
+    """S3 client double recording multipart uploads in memory."""
+
+    def __init__(self, fail_part=None):
+        self.fail_part = fail_part
+        self.parts = {}
+        self.objects = {}
+        self.aborted = []
+        self.lock = threading.Lock()
+
+    def create_multipart_upload(self, Bucket, Key, ContentType):  # noqa: N803
+        assert ContentType == "application/zip"
+        return {"UploadId": "up-1"}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):  # noqa: N803
+        if PartNumber == self.fail_part:
+            raise IOError("part failed")
+        with self.lock:
+            self.parts[PartNumber] = Body
+        return {"ETag": f"etag-{PartNumber}"}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):  # noqa: N803
+        numbers = [part["PartNumber"] for part in MultipartUpload["Parts"]]
+        assert numbers == sorted(self.parts)
+        self.objects[Key] = b"".join(self.parts[number] for number in numbers)
+
+    def put_object(self, Bucket, Key, Body, ContentType):  # noqa: N803
+        self.objects[Key] = Body.read() if hasattr(Body, "read") else Body
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):  # noqa: N803
+        self.aborted.append(UploadId)
+
+
+def test_upload_frames_streams_zip_as_multipart_parts(monkeypatch, tmp_path):
+    import os
+    import zipfile
+
+    client = FakeMultipartClient()
+    service, _ = make_service(
+        monkeypatch, client=client, transfer_profile=TransferProfile(max_concurrency=2)
+    )
+    frame_file = tmp_path / "frame_00002.png"
+    frame_file.write_bytes(b"png-bytes")
+    frames = [
+        ("frame_00000.jpg", os.urandom(6 * MIB)),
+        ("frame_00001.jpg", os.urandom(5 * MIB)),
+        ("frame_00002.png", str(frame_file)),
+        ("manifest.json", b'{"frames": 3}' * 1000),
+    ]
+
+    key = asyncio.run(service.upload_frames(frames, "job-9"))
+
+    assert key == "frames/job-9/frames.zip"
+    assert len(client.parts) == 2
+    archive = zipfile.ZipFile(BytesIO(client.objects[key]))
+    assert archive.namelist() == [name for name, _ in frames]
+    assert archive.read("frame_00001.jpg") == frames[1][1]
+    assert archive.read("frame_00002.png") == b"png-bytes"
+    assert archive.getinfo("frame_00000.jpg").compress_type == zipfile.ZIP_STORED
+    assert archive.getinfo("manifest.json").compress_type == zipfile.ZIP_DEFLATED
+
+
+def test_small_frames_zip_uses_single_put_and_failures_abort(monkeypatch):
+    import os
+    import zipfile
+
+    import pytest
+
+    client = FakeMultipartClient()
+    service, _ = make_service(monkeypatch, client=client)
+    with service.open_frames_zip_writer("job-1") as writer:
+        writer.add_frame("frame.jpg", b"tiny")
+    assert zipfile.ZipFile(BytesIO(client.objects["frames/job-1/frames.zip"])).read("frame.jpg") == b"tiny"
+    assert writer.close() == "frames/job-1/frames.zip"
+
+    failing = FakeMultipartClient(fail_part=1)
+    service, _ = make_service(monkeypatch, client=failing)
+    with pytest.raises(IOError):
+        with service.open_frames_zip_writer("job-2") as writer:
+            writer.add_frame("a.jpg", os.urandom(9 * MIB))
+    assert failing.aborted == ["up-1"]
+
+    with pytest.raises(RuntimeError):
+        with service.open_frames_zip_writer("job-3") as writer:
+            raise RuntimeError("extraction failed")
+    writer.abort()
+    assert "frames/job-3/frames.zip" not in failing.objects
+
+
+def test_presigned_urls_are_reused_while_lifetime_remains(monkeypatch):
+    from video_processor_shared.aws.cache import LRUCache
+
+    now = [1000.0]
+    cache = LRUCache(max_entries=2, clock=lambda: now[0])
+    client = Mock()
+    client.generate_presigned_url.side_effect = lambda *args, **kwargs: f"url-{client.generate_presigned_url.call_count}"
+    service, _ = make_service(
+        monkeypatch, client=client, presign_cache=cache, presign_min_remaining=300
+    )
+
+    first = service.get_download_url("frames/j1/frames.zip", expires_in=3600)
+    assert service.get_download_url("frames/j1/frames.zip", expires_in=3600) == first
+    assert service.get_download_url("frames/j1/frames.zip", expires_in=600) != first
+
+    now[0] += 3301
+    assert service.get_download_url("frames/j1/frames.zip", expires_in=3600) != first
+
+    # Lifetimes shorter than the minimum are never cached.
+    short = service.get_download_url("frames/j2/frames.zip", expires_in=60)
+    assert service.get_download_url("frames/j2/frames.zip", expires_in=60) != short
+
+
+def test_presigned_urls_follow_client_credentials(monkeypatch):
+    import time as time_module
+    from datetime import datetime, timezone
+
+    from video_processor_shared.aws.cache import LRUCache
+
+    now = [time_module.time()]
+    cache = LRUCache(clock=lambda: now[0])
+    client = Mock()
+    client.meta.endpoint_url = "https://s3"
+    client.generate_presigned_url.side_effect = lambda *args, **kwargs: f"url-{client.generate_presigned_url.call_count}"
+    credentials = SimpleNamespace(
+        access_key="ASIA1",
+        _expiry_time=datetime.fromtimestamp(now[0] + 900, tz=timezone.utc),
+    )
+    client._get_credentials.side_effect = lambda: credentials
+    service, _ = make_service(
+        monkeypatch, client=client, presign_cache=cache, presign_min_remaining=300
+    )
+
+    first = service.get_download_url("frames/j1/frames.zip", expires_in=3600)
+    assert service.get_download_url("frames/j1/frames.zip", expires_in=3600) == first
+    # Capped at the credential expiry (900s) minus the minimum remaining lifetime.
+    now[0] += 601
+    assert service.get_download_url("frames/j1/frames.zip", expires_in=3600) != first
+
+    credentials = SimpleNamespace(access_key="ASIA2", _expiry_time=None)
+    rotated = service.get_download_url("frames/j1/frames.zip", expires_in=3600)
+    assert rotated != first
+    assert service.get_download_url("frames/j1/frames.zip", expires_in=3600) == rotated
+
+
+def test_get_download_urls_signs_many_keys(monkeypatch):
+    from video_processor_shared.aws.cache import LRUCache
+
+    client = Mock()
+    client.generate_presigned_url.side_effect = lambda op, Params, ExpiresIn: f"signed:{Params['Key']}"  # noqa: N803
+    service, _ = make_service(monkeypatch, client=client, presign_cache=LRUCache())
+
+    urls = service.get_download_urls(["a", "b", "a"])
+
+    assert urls == {"a": "signed:a", "b": "signed:b"}
+    assert client.generate_presigned_url.call_count == 2
+
+
+def test_lru_cache_eviction_and_pop():
+    from video_processor_shared.aws.cache import LRUCache
+
+    cache = LRUCache(max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert "b" not in cache
+    assert len(cache) == 2
+    assert cache.pop("a") == 1
+    assert cache.pop("a") is None
+    cache.clear()
+    assert cache.get("c", 0) == 0
+
+
+def test_delete_videos_batches_keys_and_reports_partial_failures(monkeypatch):
+    client = Mock()
+
+    def delete_objects(Bucket, Delete):  # noqa: N803
+        keys = [item["Key"] for item in Delete["Objects"]]
+        assert len(keys) <= 1000 and Delete["Quiet"] is True
+        errors = [{"Key": key, "Code": "AccessDenied", "Message": "denied"} for key in keys if key == "k-1500"]
+        return {"Errors": errors}
+
+    client.delete_objects.side_effect = delete_objects
+    service, _ = make_service(monkeypatch, client=client)
+
+    result = asyncio.run(service.delete_videos(f"k-{index}" for index in range(2500)))
+
+    assert client.delete_objects.call_count == 3
+    assert len(result.deleted) == 2499
+    assert result.errors == {"k-1500": "AccessDenied: denied"}
+    assert not result.ok
+    assert asyncio.run(service.delete_videos([])).ok
+
+
+def test_delete_user_data_lists_and_deletes_video_and_frame_prefixes(monkeypatch):
+    client = Mock()
+    listings = {
+        ("in-bucket", "videos/u1/", None): {
+            "Contents": [{"Key": "videos/u1/a/v.mp4"}],
+            "IsTruncated": True,
+            "NextContinuationToken": "t1",
+        },
+        ("in-bucket", "videos/u1/", "t1"): {"Contents": [{"Key": "videos/u1/b/v.mp4"}]},
+        ("out-bucket", "frames/j1/", None): {"Contents": [{"Key": "frames/j1/frames.zip"}]},
+        ("out-bucket", "frames/j2/", None): {},
+    }
+    client.list_objects_v2.side_effect = lambda Bucket, Prefix, ContinuationToken=None: listings[  # noqa: N803
+        (Bucket, Prefix, ContinuationToken)
+    ]
+    client.delete_objects.return_value = {}
+    service, _ = make_service(monkeypatch, client=client)
+
+    result = asyncio.run(service.delete_user_data("u1", job_ids=["j1", "j2"]))
+
+    assert sorted(result.deleted) == ["frames/j1/frames.zip", "videos/u1/a/v.mp4", "videos/u1/b/v.mp4"]
+    assert result.ok
+    buckets = sorted(call.kwargs["Bucket"] for call in client.delete_objects.call_args_list)
+    assert buckets == ["in-bucket", "in-bucket", "out-bucket"]
+
+
+class NonSeekableStream:
+    def __init__(self, data):
+        self._buffer = BytesIO(data)
+
+    def read(self, size=-1):
+        return self._buffer.read(size)
+
+
+def drain_upload(fileobj, bucket, key, ExtraArgs, Config):  # noqa: N803
+    while fileobj.read(1024):
+        pass
+
+
+def test_upload_video_deduplicated_skips_identical_seekable_content(monkeypatch):
+    from video_processor_shared.aws.checksum_index import InMemoryChecksumIndex
+
+    client = Mock()
+    client.upload_fileobj.side_effect = drain_upload
+    service, _ = make_service(monkeypatch, client=client, checksum_index=InMemoryChecksumIndex())
+
+    first = asyncio.run(service.upload_video_deduplicated(BytesIO(b"video"), "a.mp4", "u1"))
+    second = asyncio.run(service.upload_video_deduplicated(BytesIO(b"video"), "b.mp4", "u1"))
+    other_user = asyncio.run(service.upload_video_deduplicated(BytesIO(b"video"), "a.mp4", "u2"))
+
+    assert first.deduplicated is False
+    assert second == type(first)(first.key, first.checksum, deduplicated=True)
+    assert other_user.deduplicated is False
+    assert client.upload_fileobj.call_count == 2
+    client.head_object.assert_called_once_with(Bucket="in-bucket", Key=first.key)
+
+
+def test_upload_video_deduplicated_hashes_streams_and_reuploads_missing(monkeypatch, tmp_path):
+    from botocore.exceptions import ClientError
+
+    from video_processor_shared.aws.checksum_index import SQLiteChecksumIndex
+
+    index = SQLiteChecksumIndex(str(tmp_path / "index.db"))
+    client = Mock()
+    client.upload_fileobj.side_effect = drain_upload
+    service, _ = make_service(monkeypatch, client=client, checksum_index=index)
+
+    first = asyncio.run(service.upload_video_deduplicated(NonSeekableStream(b"clip"), "a.mp4", "u1"))
+    second = asyncio.run(service.upload_video_deduplicated(NonSeekableStream(b"clip"), "a.mp4", "u1"))
+    assert second.deduplicated and second.key == first.key
+    deleted_key = client.delete_object.call_args.kwargs["Key"]
+    assert deleted_key != first.key
+
+    # A fresh index instance reads the persisted entry; the object is gone, so it uploads again.
+    reopened = SQLiteChecksumIndex(str(tmp_path / "index.db"), cache_size=1)
+    assert reopened.get(f"u1:{first.checksum}") == first.key
+    client.head_object.side_effect = ClientError({"Error": {"Code": "404"}}, "HeadObject")
+    service.checksum_index = reopened
+    third = asyncio.run(service.upload_video_deduplicated(BytesIO(b"clip"), "a.mp4", "u1"))
+    assert third.deduplicated is False
+    assert reopened.get(f"u1:{first.checksum}") == third.key
+    index.close()
+    reopened.close()
+
+    client.head_object.side_effect = ClientError({"Error": {"Code": "403"}}, "HeadObject")
+    import pytest
+    with pytest.raises(ClientError):
+        asyncio.run(service.upload_video_deduplicated(BytesIO(b"clip"), "a.mp4", "u1"))
+
+
+def test_default_checksum_index_uses_sqlite_when_configured(monkeypatch, tmp_path):
+    from video_processor_shared.aws import checksum_index
+
+    monkeypatch.setattr(checksum_index, "_default_index", None)
+    monkeypatch.setenv("S3_CHECKSUM_INDEX_PATH", str(tmp_path / "idx.db"))
+    index = checksum_index.default_checksum_index()
+    assert isinstance(index, checksum_index.SQLiteChecksumIndex)
+    assert checksum_index.default_checksum_index() is index
+    index.close()
+
+
+def test_download_video_reads_through_local_cache(monkeypatch, tmp_path):
+    from video_processor_shared.aws.video_cache import LocalVideoCache
+
+    cache = LocalVideoCache(str(tmp_path / "cache"), max_bytes=6)
+    client = Mock()
+    etags = {"a.mp4": '"e1"', "b.mp4": '"e2"'}
+    client.head_object.side_effect = lambda Bucket, Key: {"ETag": etags[Key]}  # noqa: N803
+    client.download_file.side_effect = lambda bucket, key, path: open(path, "wb").write(key.encode()[:5])
+    service, _ = make_service(monkeypatch, client=client, video_cache=cache)
+
+    asyncio.run(service.download_video("a.mp4", str(tmp_path / "first.mp4")))
+    asyncio.run(service.download_video("a.mp4", str(tmp_path / "second.mp4")))
+    assert (tmp_path / "second.mp4").read_bytes() == b"a.mp4"
+    assert client.download_file.call_count == 1
+
+    # A new ETag is a different cache entry; the budget evicts the older file.
+    etags["a.mp4"] = '"e3"'
+    asyncio.run(service.download_video("a.mp4", str(tmp_path / "third.mp4")))
+    asyncio.run(service.download_video("b.mp4", str(tmp_path / "fourth.mp4")))
+    stats = cache.stats
+    assert (stats.hits, stats.misses, stats.evictions) == (1, 3, 2)
+    assert stats.entries == 1 and stats.size_bytes == 5
+
+    reopened = LocalVideoCache(str(tmp_path / "cache"), max_bytes=6)
+    assert reopened.stats.entries == 1
+
+
+def test_download_video_pins_cached_downloads_to_the_headed_object(monkeypatch, tmp_path):
+    import boto3
+    import pytest
+    from botocore.response import StreamingBody
+    from botocore.stub import Stubber
+
+    from video_processor_shared.aws.video_cache import LocalVideoCache
+
+    # A real client, so boto3 validates what download_file is given.
+    client = boto3.client(
+        "s3", region_name="us-east-1", aws_access_key_id="test", aws_secret_access_key="test"
+    )
+    stubber = Stubber(client)
+    cache = LocalVideoCache(str(tmp_path / "cache"), max_bytes=100)
+    service, _ = make_service(monkeypatch, client=client, video_cache=cache)
+
+    def expect_download(key, body, **extra):
+        params = {"Bucket": "in-bucket", "Key": key, **extra}
+        stubber.add_response("head_object", {"ETag": '"e1"', "ContentLength": len(body)}, params)
+        stream = StreamingBody(BytesIO(body), len(body))
+        stubber.add_response(
+            "get_object", {"ETag": '"e1"', "ContentLength": len(body), "Body": stream}, params
+        )
+
+    # Versioned bucket: the download fetches the version the HEAD saw.
+    stubber.add_response(
+        "head_object", {"ETag": '"e1"', "VersionId": "v1"}, {"Bucket": "in-bucket", "Key": "a.mp4"}
+    )
+    expect_download("a.mp4", b"video", VersionId="v1")
+    # Unversioned bucket: the object changed mid-download, so nothing is cached.
+    stubber.add_response("head_object", {"ETag": '"e1"'}, {"Bucket": "in-bucket", "Key": "b.mp4"})
+    expect_download("b.mp4", b"other")
+    stubber.add_response("head_object", {"ETag": '"e2"'}, {"Bucket": "in-bucket", "Key": "b.mp4"})
+
+    with stubber:
+        asyncio.run(service.download_video("a.mp4", str(tmp_path / "a.mp4")))
+        with pytest.raises(RuntimeError):
+            asyncio.run(service.download_video("b.mp4", str(tmp_path / "b.mp4")))
+        stubber.assert_no_pending_responses()
+
+    assert (tmp_path / "a.mp4").read_bytes() == b"video"
+    assert not (tmp_path / "b.mp4").exists()
+    assert cache.stats.entries == 1
+
+
+def test_local_video_cache_skips_oversized_objects_and_recovers_missing_files(tmp_path):
+    import os
+
+    from video_processor_shared.aws.video_cache import LocalVideoCache
+
+    directory = tmp_path / "cache"
+    directory.mkdir()
+    (directory / ".leftover.tmp").write_bytes(b"partial")
+    os.utime(directory / ".leftover.tmp", (0, 0))
+    # In-progress download of another live process sharing the directory.
+    (directory / f".abc.{os.getppid()}.123.tmp").write_bytes(b"partial")
+    (directory / ".abc.999999999.123.tmp").write_bytes(b"partial")
+    cache = LocalVideoCache(str(directory), max_bytes=4)
+    assert sorted(os.listdir(directory)) == [f".abc.{os.getppid()}.123.tmp"]
+    os.remove(directory / f".abc.{os.getppid()}.123.tmp")
+
+    def loader(path):
+        with open(path, "wb") as handle:
+            handle.write(b"too-large")
+
+    assert cache.fetch("k", "e", str(tmp_path / "big.mp4"), loader) is False
+    assert (tmp_path / "big.mp4").read_bytes() == b"too-large"
+    assert cache.stats.entries == 0
+
+    def small(path):
+        with open(path, "wb") as handle:
+            handle.write(b"ok")
+
+    cache.fetch("s", "e", str(tmp_path / "s1.mp4"), small)
+    for name in os.listdir(directory):
+        os.remove(directory / name)
+    assert cache.fetch("s", "e", str(tmp_path / "s2.mp4"), small) is False
+    assert (tmp_path / "s2.mp4").read_bytes() == b"ok"
+
+
+def test_default_video_cache_from_environment(monkeypatch, tmp_path):
+    from video_processor_shared.aws import s3_storage
+
+    monkeypatch.setattr(s3_storage, "_default_video_cache", None)
+    monkeypatch.delenv("S3_VIDEO_CACHE_DIR", raising=False)
+    assert s3_storage.default_video_cache() is None
+
+    monkeypatch.setenv("S3_VIDEO_CACHE_DIR", str(tmp_path))
+    monkeypatch.setenv("S3_VIDEO_CACHE_MAX_MB", "1")
+    cache = s3_storage.default_video_cache()
+    assert cache.max_bytes == 1024 * 1024
+    assert s3_storage.default_video_cache() is cache
+
+
+class FakeResumableClient(FakeMultipartClient):
+    """Multipart client double that also answers ListParts and ListMultipartUploads."""
+
+    def __init__(self, fail_part=None):
+        super().__init__(fail_part=fail_part)
+        self.uploaded = []
+        self.uploads = []
+
+    def create_multipart_upload(self, Bucket, Key, ContentType):  # noqa: N803
+        self.uploads.append(Key)
+        return {"UploadId": f"up-{len(self.uploads)}"}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):  # noqa: N803
+        response = super().upload_part(Bucket, Key, UploadId, PartNumber, Body)
+        self.uploaded.append(PartNumber)
+        return response
+
+    def list_parts(self, Bucket, Key, UploadId, PartNumberMarker=0):  # noqa: N803
+        numbers = sorted(number for number in self.parts if number > PartNumberMarker)
+        return {
+            "Parts": [{"PartNumber": number, "ETag": f"etag-{number}"} for number in numbers[:1]],
+            "IsTruncated": len(numbers) > 1,
+            "NextPartNumberMarker": numbers[0] if numbers else 0,
+        }
+
+
+def test_resumable_video_upload_continues_from_checkpoint(monkeypatch, tmp_path):
+    import os
+
+    import pytest
+
+    source = tmp_path / "movie.mp4"
+    data = os.urandom(12 * MIB)
+    source.write_bytes(data)
+    client = FakeResumableClient(fail_part=3)
+    service, _ = make_service(
+        monkeypatch,
+        client=client,
+        transfer_profile=TransferProfile(part_size=5 * MIB, max_concurrency=1),
+        checkpoint_dir=str(tmp_path / "checkpoints"),
+    )
+
+    with pytest.raises(IOError):
+        asyncio.run(service.upload_video_resumable(str(source), "movie.mp4", "u1"))
+    assert len(os.listdir(tmp_path / "checkpoints")) == 1
+
+    client.fail_part = None
+    key = asyncio.run(service.upload_video_resumable(str(source), "movie.mp4", "u1"))
+
+    assert key == client.uploads[0] and len(client.uploads) == 1
+    assert client.uploaded == [1, 2, 3]
+    assert client.objects[key] == data
+    assert os.listdir(tmp_path / "checkpoints") == []
+
+
+def test_resumable_upload_restarts_when_source_changed_or_upload_gone(monkeypatch, tmp_path):
+    import os
+
+    import pytest
+    from botocore.exceptions import ClientError
+
+    source = tmp_path / "frames.zip"
+    source.write_bytes(os.urandom(11 * MIB))
+    client = FakeResumableClient(fail_part=2)
+    service, _ = make_service(
+        monkeypatch,
+        client=client,
+        transfer_profile=TransferProfile(part_size=5 * MIB, max_concurrency=1),
+        checkpoint_dir=str(tmp_path / "checkpoints"),
+    )
+    with pytest.raises(IOError):
+        asyncio.run(service.upload_frames_zip(str(source), "job-1", resumable=True))
+
+    # The file changed: the old upload is aborted and a new one started.
+    source.write_bytes(os.urandom(11 * MIB))
+    with pytest.raises(IOError):
+        asyncio.run(service.upload_frames_zip(str(source), "job-1", resumable=True))
+    assert client.aborted == ["up-1"]
+
+    # The upload vanished on the S3 side (e.g. swept): start over.
+    client.fail_part = None
+    client.list_parts = Mock(side_effect=ClientError({"Error": {"Code": "NoSuchUpload"}}, "ListParts"))
+    key = asyncio.run(service.upload_frames_zip(str(source), "job-1", resumable=True))
+    assert key == "frames/job-1/frames.zip"
+    assert len(client.uploads) == 3
+
+    small = tmp_path / "small.zip"
+    small.write_bytes(b"zip")
+    asyncio.run(service.upload_frames_zip(str(small), "job-2", resumable=True))
+    assert client.objects["frames/job-2/frames.zip"] == b"zip"
+
+
+def test_abort_stale_uploads_sweeps_both_buckets(monkeypatch):
+    from datetime import UTC, datetime, timedelta
+
+    now = datetime.now(UTC)
+    client = Mock()
+    pages = {
+        ("in-bucket", None): {
+            "Uploads": [
+                {"Key": "videos/a", "UploadId": "old-1", "Initiated": now - timedelta(days=3)},
+                {"Key": "videos/b", "UploadId": "new-1", "Initiated": now},
+            ],
+            "IsTruncated": True,
+            "NextKeyMarker": "videos/b",
+            "NextUploadIdMarker": "new-1",
+        },
+        ("in-bucket", "videos/b"): {
+            "Uploads": [{"Key": "videos/c", "UploadId": "old-2", "Initiated": now - timedelta(days=2)}],
+        },
+        ("out-bucket", None): {},
+    }
+    client.list_multipart_uploads.side_effect = lambda Bucket, Prefix, KeyMarker=None, UploadIdMarker=None: pages[  # noqa: N803
+        (Bucket, KeyMarker)
+    ]
+    service, _ = make_service(monkeypatch, client=client)
+
+    aborted = asyncio.run(service.abort_stale_uploads(timedelta(days=1)))
+
+    assert aborted == ["old-1", "old-2"]
+    assert client.abort_multipart_upload.call_count == 2
@@ -0,0 +1,1517 @@
+"""Unit tests for SQS batching, acknowledgement and consumer helpers."""
+
+import asyncio
+import io
+import json
+from unittest.mock import Mock
+
+import pytest
+
+from video_processor_shared.aws.batching import (
+    BatchOperationError,
+    EntryFailure,
+    backoff_delay,
+    pack_batches,
+    run_batched,
+)
+from video_processor_shared.aws.sqs_service import SQSService
+
+
+def make_service(monkeypatch, client=None, queue_name="jobs", **kwargs):
+    client = client or Mock()
+    monkeypatch.setattr("video_processor_shared.aws.sqs_service.get_sqs_client", lambda: client)
+    monkeypatch.setattr(
+        "video_processor_shared.aws.sqs_service.get_sqs_queue_url",
+        lambda name: f"https://queue/{name}",
+    )
+    return SQSService(queue_name=queue_name, **kwargs), client
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr("video_processor_shared.aws.batching.backoff_delay", lambda *args, **kwargs: 0)
+
+
+def test_pack_batches_respects_entry_and_byte_limits():
+    assert pack_batches([1] * 25) == [list(range(10)), list(range(10, 20)), list(range(20, 25))]
+    assert pack_batches([100, 100, 100], max_bytes=250) == [[0, 1], [2]]
+    with pytest.raises(ValueError):
+        pack_batches([300], max_bytes=250)
+    assert 0 <= backoff_delay(3, base=0.1, cap=0.5) <= 0.5
+
+
+def test_run_batched_retries_only_transient_failures():
+    calls = []
+
+    async def send(indexes):
+        calls.append(indexes)
+        succeeded = {index: f"r{index}" for index in indexes if index != 1 or len(calls) > 1}
+        failed = {} if len(calls) > 1 else {1: EntryFailure("InternalError")}
+        if 2 in indexes:
+            succeeded.pop(2)
+            failed[2] = EntryFailure("InvalidParameterValue", "bad", sender_fault=True)
+        return succeeded, failed
+
+    with pytest.raises(BatchOperationError) as error:
+        asyncio.run(run_batched([1, 1, 1], send))
+
+    assert calls == [[0, 1, 2], [1]]
+    assert error.value.results == ["r0", "r1", None]
+    assert list(error.value.failures) == [2]
+    assert str(error.value.failures[2]) == "InvalidParameterValue: bad"
+
+
+@pytest.mark.parametrize("concurrent", [True, False])
+def test_run_batched_keeps_partial_results_when_a_request_raises(concurrent):
+    calls = []
+
+    async def send(indexes):
+        calls.append(indexes)
+        if indexes[0] == 10:
+            raise ConnectionError("reset by peer")
+        return {index: f"r{index}" for index in indexes}, {}
+
+    with pytest.raises(BatchOperationError) as error:
+        asyncio.run(run_batched([1] * 12, send, max_attempts=2, concurrent=concurrent))
+
+    assert calls == [list(range(10)), [10, 11], [10, 11]]
+    assert error.value.results == [f"r{index}" for index in range(10)] + [None, None]
+    assert str(error.value.failures[11]) == "ConnectionError: reset by peer"
+    assert not error.value.failures[11].sender_fault
+
+
+def test_send_messages_returns_ids_in_input_order(monkeypatch):
+    client = Mock()
+    attempts = {"count": 0}
+
+    def send_message_batch(QueueUrl, Entries):  # noqa: N803
+        attempts["count"] += 1
+        ids = [entry["Id"] for entry in Entries]
+        failed = [{"Id": "3", "Code": "ServiceUnavailable", "SenderFault": False}] if attempts["count"] == 1 else []
+        successful = [{"Id": id_, "MessageId": f"m-{id_}"} for id_ in ids if not (id_ == "3" and failed)]
+        return {"Successful": list(reversed(successful)), "Failed": failed}
+
+    client.send_message_batch.side_effect = send_message_batch
+    service, _ = make_service(monkeypatch, client=client)
+
+    ids = asyncio.run(service.send_messages([{"n": index} for index in range(12)], delay_seconds=2))
+
+    assert ids == [f"m-{index}" for index in range(12)]
+    first_call = client.send_message_batch.call_args_list[0].kwargs
+    assert first_call["QueueUrl"] == "https://queue/jobs"
+    assert json.loads(first_call["Entries"][0]["MessageBody"]) == {"n": 0}
+    assert first_call["Entries"][0]["DelaySeconds"] == 2
+    assert client.send_message_batch.call_count == 3
+
+
+def test_ack_buffer_flushes_full_batches_and_on_close(monkeypatch):
+    from video_processor_shared.aws.sqs_ack_buffer import SQSAckBuffer
+
+    client = Mock()
+    client.delete_message_batch.side_effect = lambda QueueUrl, Entries: {  # noqa: N803
+        "Successful": [{"Id": entry["Id"]} for entry in Entries]
+    }
+    service, _ = make_service(monkeypatch, client=client)
+
+    async def scenario():
+        async with SQSAckBuffer(service, max_latency=60) as acks:
+            for index in range(12):
+                await acks.ack(f"rh-{index}")
+            await asyncio.sleep(0)
+            assert acks.pending == 2
+        return acks
+
+    acks = asyncio.run(scenario())
+
+    batches = [call.kwargs["Entries"] for call in client.delete_message_batch.call_args_list]
+    assert [len(batch) for batch in batches] == [10, 2]
+    assert batches[1][1]["ReceiptHandle"] == "rh-11"
+    assert acks.acked == 12
+    with pytest.raises(RuntimeError):
+        asyncio.run(acks.ack("late"))
+
+
+def test_ack_buffer_timer_and_failure_callbacks(monkeypatch):
+    from video_processor_shared.aws.sqs_ack_buffer import SQSAckBuffer
+
+    client = Mock()
+    client.delete_message_batch.return_value = {
+        "Successful": [{"Id": "0"}],
+        "Failed": [{"Id": "1", "Code": "ReceiptHandleIsInvalid", "SenderFault": True}],
+    }
+    service, _ = make_service(monkeypatch, client=client)
+    failures = []
+
+    async def scenario():
+        acks = SQSAckBuffer(service, max_latency=0.01, on_failure=lambda h, f: failures.append((h, f.code)))
+        await acks.ack("good")
+        await acks.ack("stale")
+        await asyncio.sleep(0.05)
+        assert client.delete_message_batch.call_count == 1
+
+        client.delete_message_batch.side_effect = ConnectionError("down")
+        await acks.ack("lost")
+        await acks.close()
+        return acks
+
+    acks = asyncio.run(scenario())
+
+    assert failures == [("stale", "ReceiptHandleIsInvalid"), ("lost", "ConnectionError")]
+    assert (acks.acked, acks.failed) == (1, 2)
+
+
+def test_ack_buffer_logs_failures_without_callback(monkeypatch, caplog):
+    from video_processor_shared.aws.sqs_ack_buffer import SQSAckBuffer
+
+    client = Mock()
+    client.delete_message_batch.side_effect = ConnectionError("down")
+    service, _ = make_service(monkeypatch, client=client)
+
+    async def scenario():
+        acks = SQSAckBuffer(service)
+        await acks.ack("rh")
+        await acks.flush()
+
+    asyncio.run(scenario())
+    assert "Failed to delete SQS message rh" in caplog.text
+
+
+class FakeQueue:
+    """In-memory stand-in for SQSService used by consumer tests."""
+
+    queue_name = "jobs"
+    fifo = False
+
+    def __init__(self, count):
+        self.messages = [
+            {"message_id": f"m-{index}", "body": {"n": index}, "receipt_handle": f"rh-{index}"}
+            for index in range(count)
+        ]
+        self.deleted = []
+        self.receive_calls = []
+        self.visibility = []
+
+    async def receive_messages(self, max_messages=1, wait_time_seconds=20, **kwargs):
+        self.receive_calls.append((max_messages, wait_time_seconds, kwargs))
+        batch, self.messages = self.messages[:max_messages], self.messages[max_messages:]
+        if not batch:
+            await asyncio.sleep(0.01)
+        return batch
+
+    async def delete_messages(self, receipt_handles):
+        self.deleted.extend(receipt_handles)
+
+    async def change_visibility_batch(self, timeouts):
+        self.visibility.append(dict(timeouts))
+
+
+def double_body(message):
+    return message["body"]["n"] * 2
+
+
+def run_until(consumer, condition, timeout=5.0):
+    async def scenario():
+        async def watch():
+            while not condition():
+                await asyncio.sleep(0.005)
+            consumer.stop()
+
+        await asyncio.wait_for(asyncio.gather(consumer.run(), watch()), timeout)
+
+    asyncio.run(scenario())
+
+
+def test_consumer_processes_concurrently_and_acks_successes():
+    from video_processor_shared.aws.sqs_consumer import SQSConsumer
+
+    queue = FakeQueue(25)
+    active, peak = 0, 0
+
+    async def handler(message):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+        if message["body"]["n"] == 3:
+            raise ValueError("boom")
+
+    consumer = SQSConsumer(queue, handler, concurrency=4, prefetch=6, ack_latency=0.01)
+    run_until(consumer, lambda: consumer.processed + consumer.failed == 25)
+
+    assert peak == 4
+    assert (consumer.received, consumer.processed, consumer.failed) == (25, 24, 1)
+    assert sorted(queue.deleted) == sorted(f"rh-{n}" for n in range(25) if n != 3)
+
+
+@pytest.mark.parametrize("mode", ["thread", "process"])
+def test_consumer_runs_plain_handlers_on_pools(mode):
+    from video_processor_shared.aws.sqs_consumer import SQSConsumer
+
+    queue = FakeQueue(5)
+    consumer = SQSConsumer(queue, double_body, mode=mode, concurrency=2)
+    run_until(consumer, lambda: consumer.processed == 5)
+
+    assert len(queue.deleted) == 5
+
+
+def test_consumer_drains_buffer_on_sigterm():
+    import os
+    import signal
+
+    from video_processor_shared.aws.sqs_consumer import SQSConsumer
+
+    queue = FakeQueue(6)
+    handled = []
+
+    async def handler(message):
+        await asyncio.sleep(0.02)
+        handled.append(message["message_id"])
+
+    consumer = SQSConsumer(queue, handler, concurrency=1, prefetch=10)
+
+    async def scenario():
+        async def terminate():
+            while consumer.received < 6:
+                await asyncio.sleep(0.005)
+            os.kill(os.getpid(), signal.SIGTERM)
+
+        await asyncio.wait_for(asyncio.gather(consumer.run(), terminate()), 5)
+
+    asyncio.run(scenario())
+
+    assert len(handled) == 6
+    assert len(queue.deleted) == 6
+
+
+def test_consumer_retries_failed_receives_and_times_out_drain(monkeypatch):
+    from video_processor_shared.aws.sqs_consumer import SQSConsumer
+
+    monkeypatch.setattr(
+        "video_processor_shared.aws.sqs_consumer.backoff_delay", lambda *args, **kwargs: 0
+    )
+    queue = FakeQueue(2)
+    original = queue.receive_messages
+    calls = []
+
+    async def flaky_receive(**kwargs):
+        calls.append(kwargs)
+        if len(calls) == 1:
+            raise ConnectionError("down")
+        return await original(**kwargs)
+
+    queue.receive_messages = flaky_receive
+    release = asyncio.Event()
+
+    async def handler(message):
+        await release.wait()
+
+    consumer = SQSConsumer(queue, handler, concurrency=1, drain_timeout=0.05)
+    run_until(consumer, lambda: consumer.received == 2)
+
+    assert consumer.processed == 0
+    assert queue.deleted == []
+    with pytest.raises(ValueError):
+        SQSConsumer(queue, handler, mode="fibers")
+
+
+def test_heartbeat_extends_tracked_messages_until_max_extension(monkeypatch):
+    from video_processor_shared.aws.sqs_heartbeat import VisibilityHeartbeat
+
+    client = Mock()
+    client.change_message_visibility_batch.side_effect = lambda QueueUrl, Entries: {  # noqa: N803
+        "Successful": [{"Id": entry["Id"]} for entry in Entries if entry["ReceiptHandle"] != "gone"],
+        "Failed": [
+            {"Id": entry["Id"], "Code": "ReceiptHandleIsInvalid", "SenderFault": True}
+            for entry in Entries
+            if entry["ReceiptHandle"] == "gone"
+        ],
+    }
+    service, _ = make_service(monkeypatch, client=client)
+    now = [0.0]
+    heartbeat = VisibilityHeartbeat(service, visibility_timeout=60, max_extension=100, clock=lambda: now[0])
+
+    async def scenario():
+        heartbeat.track("rh-1")
+        heartbeat.track("gone")
+        await heartbeat.beat()
+        now[0] = 70.0
+        await heartbeat.beat()
+        now[0] = 100.0
+        await heartbeat.beat()
+
+    asyncio.run(scenario())
+
+    entries = [call.kwargs["Entries"] for call in client.change_message_visibility_batch.call_args_list]
+    assert [(e["ReceiptHandle"], e["VisibilityTimeout"]) for e in entries[0]] == [("rh-1", 60), ("gone", 60)]
+    assert [(e["ReceiptHandle"], e["VisibilityTimeout"]) for e in entries[1]] == [("rh-1", 30)]
+    assert len(entries) == 2
+    assert (heartbeat.extended, heartbeat.expired, heartbeat.tracked) == (2, 1, 0)
+
+
+def test_consumer_keeps_long_jobs_alive_with_heartbeats():
+    from video_processor_shared.aws.sqs_consumer import SQSConsumer
+
+    queue = FakeQueue(1)
+    extended = []
+
+    async def change_visibility_batch(timeouts):
+        extended.append(dict(timeouts))
+
+    queue.change_visibility_batch = change_visibility_batch
+
+    async def handler(message):
+        await asyncio.sleep(0.05)
+
+    consumer = SQSConsumer(
+        queue, handler, concurrency=1, visibility_timeout=30, heartbeat_interval=0.01
+    )
+    run_until(consumer, lambda: consumer.processed == 1)
+
+    assert extended and extended[0] == {"rh-0": 30}
+    assert queue.deleted == ["rh-0"]
+
+
+def test_consumer_keeps_buffered_messages_alive_from_first_receive():
+    import time as time_module
+
+    from video_processor_shared.aws.messages import QueueMessage
+    from video_processor_shared.aws.sqs_consumer import SQSConsumer
+
+    queue = FakeQueue(0)
+    first_receive = str(int((time_module.time() - 50) * 1000))
+    queue.messages = [
+        QueueMessage(f"m-{n}", f"rh-{n}", "{}", {"ApproximateFirstReceiveTimestamp": first_receive})
+        for n in range(3)
+    ]
+    extended = []
+
+    async def change_visibility_batch(timeouts):
+        extended.append(dict(timeouts))
+
+    queue.change_visibility_batch = change_visibility_batch
+
+    async def handler(message):
+        await asyncio.sleep(0.05)
+
+    consumer = SQSConsumer(
+        queue,
+        handler,
+        concurrency=1,
+        visibility_timeout=30,
+        heartbeat_interval=0.01,
+        max_visibility_extension=60,
+        attribute_names=["SentTimestamp"],
+    )
+    run_until(consumer, lambda: consumer.processed == 3)
+
+    # Messages waiting in the buffer are extended too, capped at the time
+    # left since their first receive, and dropped once acknowledged.
+    assert set(extended[0]) == {"rh-0", "rh-1", "rh-2"}
+    assert all(0 < timeout <= 10 for timeout in extended[0].values())
+    assert "rh-0" not in extended[-1]
+    assert queue.receive_calls[0][2]["attribute_names"] == [
+        "SentTimestamp",
+        "ApproximateFirstReceiveTimestamp",
+    ]
+    assert consumer._heartbeat is None
+
+
+class FakeObjectStore:
+    def __init__(self):
+        self.objects = {}
+        self.gets = 0
+
+    def put_object(self, Bucket, Key, Body, **kwargs):  # noqa: N803
+        self.objects[(Bucket, Key)] = (Body, kwargs)
+
+    def get_object(self, Bucket, Key):  # noqa: N803
+        self.gets += 1
+        return {"Body": io.BytesIO(self.objects[(Bucket, Key)][0])}
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_claim_check_offloads_large_bodies_and_resolves_lazily(monkeypatch, compress):
+    from video_processor_shared.aws.claim_check import ClaimCheckStore
+
+    s3 = FakeObjectStore()
+    store = ClaimCheckStore(bucket="claims", threshold=100, compress=compress, client=s3)
+    client = Mock()
+    client.send_message.return_value = {"MessageId": "m1"}
+    service, _ = make_service(monkeypatch, client=client, claim_checks=store)
+    big = {"frames": ["frame_%04d.jpg" % n for n in range(50)]}
+
+    asyncio.run(service.send_message({"job_id": "small"}))
+    asyncio.run(service.send_message(big))
+
+    small_body = client.send_message.call_args_list[0].kwargs["MessageBody"]
+    pointer_body = client.send_message.call_args_list[1].kwargs["MessageBody"]
+    assert json.loads(small_body) == {"job_id": "small"}
+    pointer = json.loads(pointer_body)["__claim_check__"]
+    assert pointer["bucket"] == "claims" and pointer["key"].startswith("claim-checks/")
+    stored, extra = s3.objects[("claims", pointer["key"])]
+    assert (extra.get("ContentEncoding") == "gzip") is compress
+
+    client.receive_message.return_value = {
+        "Messages": [{"MessageId": "m2", "Body": pointer_body, "ReceiptHandle": "rh"}]
+    }
+    message = asyncio.run(service.receive_messages())[0]
+    assert message.is_claim_check and s3.gets == 0
+    assert message["body"] == big
+    assert message.body == big and s3.gets == 1
+
+
+def test_queue_message_load_body_and_attributes(monkeypatch):
+    from video_processor_shared.aws.claim_check import ClaimCheckStore
+    from video_processor_shared.aws.messages import QueueMessage
+
+    s3 = FakeObjectStore()
+    store = ClaimCheckStore(bucket="claims", threshold=10, client=s3)
+    pointer = store.put(json.dumps({"error": "x" * 50}))
+    message = QueueMessage.from_response(
+        {
+            "MessageId": "m1",
+            "ReceiptHandle": "rh",
+            "Body": pointer,
+            "MessageAttributes": {"event_type": {"DataType": "String", "StringValue": "job"}},
+        },
+        store,
+    )
+
+    assert message.message_attributes["event_type"]["StringValue"] == "job"
+    assert asyncio.run(message.load_body()) == {"error": "x" * 50}
+    assert message.to_dict()["receipt_handle"] == "rh"
+    assert list(message) == ["message_id", "body", "receipt_handle"] and len(message) == 3
+    with pytest.raises(KeyError):
+        message["attributes"]
+    assert repr(message) == "QueueMessage(message_id='m1')"
+
+
+def test_queue_message_is_a_dict_that_decodes_on_demand():
+    from video_processor_shared.aws.messages import QueueMessage
+
+    message = QueueMessage("m1", "rh", json.dumps({"n": 1}))
+
+    assert isinstance(message, dict)
+    assert "body" in message and len(message) == 3 and not message._loaded
+    expected = {"message_id": "m1", "body": {"n": 1}, "receipt_handle": "rh"}
+    assert json.loads(json.dumps(message)) == expected
+    assert message == expected
+
+    message["body"]["n"] = 2
+    message["attempt"] = 1
+    assert dict(message) == {**expected, "body": {"n": 2}, "attempt": 1}
+    assert message.get("missing", "default") == "default"
+
+
+def test_claim_check_inside_an_sns_envelope_is_resolved_in_place():
+    from video_processor_shared.aws.claim_check import ClaimCheckStore, is_claim_check
+    from video_processor_shared.aws.messages import QueueMessage
+
+    s3 = FakeObjectStore()
+    store = ClaimCheckStore(bucket="claims", threshold=10, client=s3)
+    payload = json.dumps({"trace": "t" * 50})
+    # SNS delivers to SQS in this envelope unless RawMessageDelivery is on.
+    envelope = json.dumps(
+        {"Type": "Notification", "TopicArn": "arn:events", "Message": store.put(payload)},
+        indent=2,
+        separators=(",", " : "),
+    )
+
+    assert is_claim_check(envelope)
+    assert not is_claim_check(json.dumps({"Type": "Notification", "Message": payload}))
+    message = QueueMessage("m1", "rh", envelope, claim_checks=store)
+    body = asyncio.run(message.load_body())
+    assert body["Message"] == payload and body["TopicArn"] == "arn:events"
+
+
+def test_sns_publish_offloads_large_messages(monkeypatch):
+    from video_processor_shared.aws.claim_check import ClaimCheckStore
+    from video_processor_shared.aws.sns_service import SNSService
+
+    client = Mock()
+    client.publish.return_value = {"MessageId": "sns-1"}
+    monkeypatch.setattr("video_processor_shared.aws.sns_service.get_sns_client", lambda: client)
+    monkeypatch.setattr(
+        "video_processor_shared.aws.sns_service.get_sns_topic_arn", lambda name: f"arn:{name}"
+    )
+    s3 = FakeObjectStore()
+    service = SNSService(claim_checks=ClaimCheckStore(bucket="claims", threshold=20, client=s3))
+
+    asyncio.run(service.publish({"trace": "t" * 100}, subject="Failed"))
+
+    body = client.publish.call_args.kwargs["Message"]
+    assert body.startswith('{"__claim_check__"')
+    assert len(s3.objects) == 1
+
+
+@pytest.mark.parametrize("use_orjson", [False, True])
+def test_json_serializer_round_trips_with_either_backend(use_orjson):
+    from video_processor_shared.aws.serializers import JSONSerializer
+
+    serializer = JSONSerializer(use_orjson=use_orjson)
+    body = serializer.dumps({"job_id": "j1", "frames": [1, 2]})
+
+    assert json.loads(body) == {"job_id": "j1", "frames": [1, 2]}
+    assert serializer.loads(body) == {"job_id": "j1", "frames": [1, 2]}
+    assert serializer.message_attributes() == {}
+
+
+def test_json_serializer_uses_orjson_only_on_request(monkeypatch):
+    from video_processor_shared.aws.serializers import JSONSerializer
+
+    monkeypatch.delenv("MESSAGE_USE_ORJSON", raising=False)
+    assert not JSONSerializer().use_orjson
+    monkeypatch.setenv("MESSAGE_USE_ORJSON", "true")
+    assert JSONSerializer().use_orjson
+
+
+def test_msgpack_bodies_are_tagged_and_decoded_lazily(monkeypatch):
+    from video_processor_shared.aws import serializers
+    from video_processor_shared.aws.messages import QueueMessage
+    from video_processor_shared.aws.serializers import MsgpackSerializer, get_serializer
+
+    class FakeMsgpack:
+        """Stands in for msgpack, which is an optional dependency."""
+
+        decoded = 0
+
+        @staticmethod
+        def packb(payload, use_bin_type):
+            return json.dumps(payload).encode()
+
+        @classmethod
+        def unpackb(cls, data, raw):
+            cls.decoded += 1
+            return json.loads(data)
+
+    monkeypatch.setattr(serializers, "msgpack", FakeMsgpack)
+    monkeypatch.setattr(serializers, "_serializers", {})
+    client = Mock()
+    client.send_message.return_value = {"MessageId": "m1"}
+    service, _ = make_service(monkeypatch, client=client, serializer=MsgpackSerializer())
+
+    asyncio.run(service.send_message({"job_id": "j1"}))
+
+    sent = client.send_message.call_args.kwargs
+    assert sent["MessageAttributes"]["content_type"]["StringValue"] == "application/x-msgpack"
+    client.receive_message.return_value = {
+        "Messages": [
+            {
+                "MessageId": "m1",
+                "Body": sent["MessageBody"],
+                "ReceiptHandle": "rh",
+                "MessageAttributes": sent["MessageAttributes"],
+            }
+        ]
+    }
+    message = asyncio.run(service.receive_messages())[0]
+    assert message.attribute("content_type") == "application/x-msgpack"
+    assert message.attribute("event_type", "none") == "none"
+    assert FakeMsgpack.decoded == 0
+    assert message["body"] == {"job_id": "j1"}
+    assert FakeMsgpack.decoded == 1
+
+    # Through SNS without RawMessageDelivery the tag moves into the envelope.
+    envelope = json.dumps(
+        {
+            "Type": "Notification",
+            "Message": sent["MessageBody"],
+            "MessageAttributes": {
+                "content_type": {"Type": "String", "Value": "application/x-msgpack"}
+            },
+        }
+    )
+    message = QueueMessage("m2", "rh-2", envelope)
+    assert message["body"]["Message"] == {"job_id": "j1"}
+
+    with pytest.raises(ValueError):
+        get_serializer("text/xml")
+    monkeypatch.setattr(serializers, "msgpack", None)
+    with pytest.raises(RuntimeError):
+        MsgpackSerializer()
+
+
+def test_default_serializer_follows_environment(monkeypatch):
+    from video_processor_shared.aws import serializers
+
+    monkeypatch.setattr(serializers, "msgpack", object())
+    monkeypatch.setattr(serializers, "_serializers", {})
+    monkeypatch.setenv("MESSAGE_SERIALIZER", "msgpack")
+    assert serializers.default_serializer().content_type == "application/x-msgpack"
+    monkeypatch.delenv("MESSAGE_SERIALIZER")
+    assert serializers.default_serializer().content_type == "application/json"
+
+
+@pytest.mark.parametrize("backend", ["memory", "sqlite", "file"])
+def test_idempotency_stores_expire_keys(tmp_path, backend):
+    from video_processor_shared.aws.idempotency import (
+        FileIdempotencyStore,
+        InMemoryIdempotencyStore,
+        SQLiteIdempotencyStore,
+    )
+
+    now = [1000.0]
+    clock = lambda: now[0]  # noqa: E731
+    factories = {
+        "memory": lambda: InMemoryIdempotencyStore(ttl=60, clock=clock),
+        "sqlite": lambda: SQLiteIdempotencyStore(str(tmp_path / "ids.db"), ttl=60, clock=clock),
+        "file": lambda: FileIdempotencyStore(str(tmp_path / "ids.jsonl"), ttl=60, clock=clock),
+    }
+    store = factories[backend]()
+    store.mark("message:m1")
+    now[0] += 30
+    store.mark("event:e1")
+
+    assert store.seen("message:m1") and store.seen("event:e1")
+    assert not store.seen("message:m2")
+
+    if backend != "memory":
+        store.close()
+        store = factories[backend]()
+        assert store.seen("message:m1") and store.seen("event:e1")
+
+    now[0] += 40
+    assert not store.seen("message:m1")
+    assert store.seen("event:e1")
+
+
+def test_persistent_idempotency_stores_compact_on_open(tmp_path):
+    from video_processor_shared.aws.idempotency import FileIdempotencyStore, SQLiteIdempotencyStore
+
+    now = [0.0]
+    path = tmp_path / "ids.jsonl"
+    store = FileIdempotencyStore(str(path), ttl=10, clock=lambda: now[0])
+    store.mark("old")
+    now[0] = 5
+    store.mark("new")
+    store.close()
+    with open(path, "a") as handle:
+        handle.write('{"key": "torn"')
+
+    now[0] = 12
+    store = FileIdempotencyStore(str(path), ttl=10, clock=lambda: now[0])
+    assert [json.loads(line)["key"] for line in path.read_text().splitlines()] == ["new"]
+    store.close()
+
+    db = SQLiteIdempotencyStore(str(tmp_path / "ids.db"), ttl=10, clock=lambda: now[0])
+    db.mark("a")
+    now[0] = 30
+    assert db.prune() == 1
+    db.close()
+
+
+def test_file_idempotency_store_remembers_every_live_key(tmp_path):
+    from video_processor_shared.aws.idempotency import FileIdempotencyStore
+
+    now = [0.0]
+    store = FileIdempotencyStore(str(tmp_path / "ids.jsonl"), ttl=10, clock=lambda: now[0])
+    for n in range(1500):
+        store.mark(f"key-{n}")
+    assert all(store.seen(f"key-{n}") for n in range(1500))
+
+    now[0] = 11
+    store.mark("fresh")
+    for n in range(1600):
+        store.mark(f"next-{n}")
+    # Expired keys were pruned from the index once it doubled in size.
+    assert len(store._live) == 1601
+    assert not store.seen("key-0") and store.seen("fresh")
+    store.close()
+
+
+def test_idempotency_keys_and_default_store(monkeypatch, tmp_path):
+    from video_processor_shared.aws import idempotency
+
+    assert idempotency.idempotency_keys({"message_id": "m1", "body": {"event_id": "e1"}}) == [
+        "message:m1",
+        "event:e1",
+    ]
+    assert idempotency.idempotency_keys({"message_id": "m1", "body": [1]}) == ["message:m1"]
+
+    for path, kind in [(None, "InMemory"), ("ids.sqlite", "SQLite"), ("ids.jsonl", "File")]:
+        monkeypatch.setattr(idempotency, "_default_store", None)
+        if path:
+            monkeypatch.setenv("IDEMPOTENCY_STORE_PATH", str(tmp_path / path))
+        store = idempotency.default_idempotency_store()
+        assert type(store).__name__ == f"{kind}IdempotencyStore"
+        assert idempotency.default_idempotency_store() is store
+
+
+@pytest.mark.parametrize("backend", ["memory", "sqlite"])
+def test_consumer_skips_processed_messages_and_events(tmp_path, backend):
+    from video_processor_shared.aws.idempotency import (
+        InMemoryIdempotencyStore,
+        SQLiteIdempotencyStore,
+    )
+    from video_processor_shared.aws.sqs_consumer import SQSConsumer
+
+    queue = FakeQueue(0)
+    queue.messages = [
+        {"message_id": "m1", "body": {"event_id": "e1"}, "receipt_handle": "rh-1"},
+        {"message_id": "m1", "body": {"event_id": "e1"}, "receipt_handle": "rh-2"},
+        {"message_id": "m2", "body": {"event_id": "e1"}, "receipt_handle": "rh-3"},
+        {"message_id": "m3", "body": {"event_id": "e2"}, "receipt_handle": "rh-4"},
+    ]
+    if backend == "memory":
+        store = InMemoryIdempotencyStore()
+    else:
+        store = SQLiteIdempotencyStore(str(tmp_path / "ids.db"))
+    store.mark("message:m3")
+    handled = []
+
+    async def handler(message):
+        await asyncio.sleep(0.01)
+        handled.append(message["receipt_handle"])
+
+    consumer = SQSConsumer(queue, handler, concurrency=4, idempotency=store, ack_latency=0.01)
+    run_until(consumer, lambda: consumer.processed + consumer.duplicates == 4)
+
+    # The copies of e1 arrive while the first one is still running: they are
+    # left for redelivery instead of being processed or acknowledged.
+    assert len(handled) == 1 and handled[0] in ("rh-1", "rh-2", "rh-3")
+    assert sorted(queue.deleted) == sorted(handled + ["rh-4"])
+    assert store.seen("event:e1")
+
+
+
+def test_consumer_keeps_keys_claimed_until_a_slow_store_has_marked_them():
+    import time
+
+    from video_processor_shared.aws.idempotency import IdempotencyStore
+    from video_processor_shared.aws.sqs_consumer import SQSConsumer
+
+    class SlowStore(IdempotencyStore):
+        def __init__(self):
+            self.keys = set()
+
+        def seen(self, key):
+            return key in self.keys
+
+        def mark(self, key):
+            time.sleep(0.1)
+            self.keys.add(key)
+
+    copy = {"message_id": "m1", "body": {"event_id": "e1"}}
+    queue = FakeQueue(0)
+    queue.messages = [dict(copy, receipt_handle="rh-1")]
+    handled = []
+
+    async def handler(message):
+        handled.append(message["receipt_handle"])
+        # The redelivered copy arrives while the first one is being marked.
+        queue.messages.append(dict(copy, receipt_handle="rh-2"))
+
+    consumer = SQSConsumer(queue, handler, concurrency=2, idempotency=SlowStore(), ack_latency=0.01)
+    run_until(consumer, lambda: consumer.processed == 1 and consumer.duplicates == 1)
+
+    assert handled == ["rh-1"]
+    assert queue.deleted == ["rh-1"]
+
+def test_fifo_queue_sets_group_and_deduplication_ids(monkeypatch):
+    client = Mock()
+    client.send_message.return_value = {"MessageId": "m1"}
+    client.send_message_batch.side_effect = lambda QueueUrl, Entries: {  # noqa: N803
+        "Successful": [{"Id": entry["Id"], "MessageId": entry["Id"]} for entry in Entries]
+    }
+    service, _ = make_service(monkeypatch, client=client, queue_name="jobs.fifo")
+    assert service.fifo
+
+    asyncio.run(service.send_message({"user_id": "u1", "event_id": "e1"}))
+    sent = client.send_message.call_args.kwargs
+    assert (sent["MessageGroupId"], sent["MessageDeduplicationId"]) == ("u1", "e1")
+    assert "DelaySeconds" not in sent
+
+    asyncio.run(service.send_message({"job": "x"}, group_id="g", deduplication_id="d"))
+    sent = client.send_message.call_args.kwargs
+    assert (sent["MessageGroupId"], sent["MessageDeduplicationId"]) == ("g", "d")
+
+    asyncio.run(service.send_messages([{"n": n} for n in range(15)]))
+    batches = [call.kwargs["Entries"] for call in client.send_message_batch.call_args_list]
+    assert [[entry["Id"] for entry in batch] for batch in batches] == [
+        [str(n) for n in range(10)],
+        [str(n) for n in range(10, 15)],
+    ]
+    first = batches[0][0]
+    assert first["MessageGroupId"] == "default"
+    assert len(first["MessageDeduplicationId"]) == 64
+    assert first["MessageDeduplicationId"] != batches[0][1]["MessageDeduplicationId"]
+
+    with pytest.raises(ValueError):
+        asyncio.run(service.send_message({"job": "x"}, delay_seconds=5))
+
+
+def test_ordered_consumer_keeps_group_order_and_runs_groups_in_parallel():
+    from video_processor_shared.aws.messages import QueueMessage
+    from video_processor_shared.aws.sqs_consumer import SQSConsumer
+
+    def fifo_message(group, n):
+        return QueueMessage(
+            message_id=f"{group}-{n}",
+            receipt_handle=f"rh-{group}-{n}",
+            raw_body=json.dumps({"n": n}),
+            attributes={"MessageGroupId": group},
+        )
+
+    queue = FakeQueue(0)
+    queue.fifo = True
+    queue.messages = [fifo_message(group, n) for n in range(4) for group in ("a", "b")]
+    queue.messages.append(fifo_message("c", 0))
+    queue.messages.append(fifo_message("c", 1))
+    order = {"a": [], "b": [], "c": []}
+    active, peak = 0, 0
+
+    async def handler(message):
+        nonlocal active, peak
+        group = message["message_id"][0]
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01 if message["body"]["n"] % 2 else 0.02)
+        active -= 1
+        order[group].append(message["body"]["n"])
+        if message["message_id"] == "c-0":
+            raise ValueError("boom")
+
+    consumer = SQSConsumer(queue, handler, concurrency=4, ack_latency=0.01)
+    assert consumer.ordered
+    run_until(consumer, lambda: consumer.processed + consumer.failed + consumer.skipped == 10)
+
+    assert order == {"a": [0, 1, 2, 3], "b": [0, 1, 2, 3], "c": [0]}
+    assert peak == 3
+    assert (consumer.processed, consumer.failed, consumer.skipped) == (8, 1, 1)
+    assert "rh-c-1" not in queue.deleted
+    assert queue.visibility == [{"rh-c-1": 0}]
+
+
+def test_ordered_consumer_returns_messages_queued_behind_a_failure():
+    from video_processor_shared.aws.messages import QueueMessage
+    from video_processor_shared.aws.sqs_consumer import SQSConsumer
+
+    queue = FakeQueue(0)
+    queue.fifo = True
+    queue.messages = [
+        QueueMessage(f"g-{n}", f"rh-g-{n}", json.dumps({"n": n}), {"MessageGroupId": "g"})
+        for n in range(3)
+    ]
+    handled = []
+
+    async def handler(message):
+        handled.append(message["message_id"])
+        if message["message_id"] == "g-0":
+            # Give the other worker time to queue g-1 and g-2 behind g-0.
+            await asyncio.sleep(0.05)
+            raise ValueError("boom")
+
+    consumer = SQSConsumer(queue, handler, concurrency=2, visibility_timeout=30)
+    run_until(consumer, lambda: consumer.failed + consumer.skipped == 3)
+
+    assert handled == ["g-0"]
+    assert (consumer.processed, consumer.failed, consumer.skipped) == (0, 1, 2)
+    # The heartbeat's own extensions have non-zero timeouts.
+    assert [timeouts for timeouts in queue.visibility if 0 in timeouts.values()] == [
+        {"rh-g-1": 0, "rh-g-2": 0}
+    ]
+    assert queue.deleted == []
+
+
+def test_get_queue_metrics_reads_all_counts_in_one_call(monkeypatch):
+    client = Mock()
+    client.get_queue_attributes.return_value = {
+        "Attributes": {
+            "ApproximateNumberOfMessages": "40",
+            "ApproximateNumberOfMessagesNotVisible": "8",
+            "ApproximateNumberOfMessagesDelayed": "2",
+        }
+    }
+    service, _ = make_service(monkeypatch, client=client)
+
+    metrics = asyncio.run(service.get_queue_metrics())
+
+    assert (metrics.visible, metrics.in_flight, metrics.delayed, metrics.total) == (40, 8, 2, 50)
+    assert metrics.backlog_per_worker(4) == 10
+    assert client.get_queue_attributes.call_count == 1
+
+
+def test_metrics_poller_caches_and_estimates_drain_time():
+    from video_processor_shared.aws.sqs_metrics import QueueMetrics, QueueMetricsPoller
+
+    class MetricsQueue:
+        def __init__(self, name, visible_counts):
+            self.queue_name = name
+            self.visible_counts = list(visible_counts)
+
+        async def get_queue_metrics(self):
+            visible = self.visible_counts.pop(0)
+            if visible is None:
+                raise ConnectionError("down")
+            return QueueMetrics(self.queue_name, visible, 5, 0)
+
+    now = [0.0]
+    jobs = MetricsQueue("jobs", [100, 80, None, 20])
+    events = MetricsQueue("events", [10, 20, 30, 40, 50])
+    poller = QueueMetricsPoller([jobs, events], smoothing=0.5, clock=lambda: now[0])
+
+    async def scenario():
+        await poller.poll_once()
+        assert poller.get("jobs").net_rate is None
+        assert poller.get("jobs").drain_seconds is None
+        for _ in range(3):
+            now[0] += 10
+            await poller.poll_once()
+
+    asyncio.run(scenario())
+
+    jobs_metrics = poller.get("jobs")
+    # Rates -2/s (0-10 s) and -3/s (10-30 s, the failed poll kept the old sample).
+    assert jobs_metrics.visible == 20
+    assert jobs_metrics.net_rate == pytest.approx(-2.5)
+    assert jobs_metrics.drain_seconds == pytest.approx(8.0)
+    assert poller.snapshot()["events"].net_rate == pytest.approx(1.0)
+    assert poller.snapshot()["events"].drain_seconds is None
+    assert QueueMetrics("idle", 0, 0, 0).drain_seconds == 0.0
+    assert poller.get("missing") is None
+
+
+def test_metrics_poller_polls_in_background():
+    from video_processor_shared.aws.sqs_metrics import QueueMetrics, QueueMetricsPoller
+
+    calls = []
+
+    class CountingQueue:
+        queue_name = "jobs"
+
+        async def get_queue_metrics(self):
+            calls.append(1)
+            return QueueMetrics("jobs", len(calls), 0, 0)
+
+    async def scenario():
+        async with QueueMetricsPoller([CountingQueue()], interval=0.01) as poller:
+            assert poller.get("jobs").visible == 1
+            await asyncio.sleep(0.05)
+        return poller
+
+    poller = asyncio.run(scenario())
+    assert poller.get("jobs").visible >= 3
+
+
+def test_receive_messages_requests_only_declared_attributes(monkeypatch):
+    client = Mock()
+    client.receive_message.return_value = {}
+    service, _ = make_service(monkeypatch, client=client, queue_name="jobs.fifo")
+
+    asyncio.run(service.receive_messages())
+    assert client.receive_message.call_args.kwargs["AttributeNames"] == ["All"]
+    assert client.receive_message.call_args.kwargs["MessageAttributeNames"] == ["All"]
+
+    asyncio.run(
+        service.receive_messages(
+            attribute_names=["ApproximateReceiveCount"], message_attribute_names=["event_type"]
+        )
+    )
+    kwargs = client.receive_message.call_args.kwargs
+    assert kwargs["AttributeNames"] == ["ApproximateReceiveCount", "MessageGroupId"]
+    assert kwargs["MessageAttributeNames"] == ["event_type", "content_type"]
+
+
+def test_adaptive_receive_policy_tracks_backlog_and_idleness():
+    from video_processor_shared.aws.sqs_receive_policy import AdaptiveReceivePolicy
+
+    policy = AdaptiveReceivePolicy(min_wait=2, max_wait=20, window=4)
+    assert policy.next_request() == (10, 20)
+
+    for received in (10, 10, 10, 10):
+        policy.record(received)
+    assert policy.next_request() == (10, 2)
+
+    policy.record(3)
+    assert policy.next_request() == (3, 2)
+    policy.record(0)
+    policy.record(0)
+    assert policy.empty_rate == 0.5
+    assert policy.next_request() == (1, 11)
+    policy.record(1)
+    assert policy.next_request()[0] == 10
+
+
+def test_consumer_uses_receive_policy_and_declared_attributes():
+    from video_processor_shared.aws.sqs_consumer import SQSConsumer
+    from video_processor_shared.aws.sqs_receive_policy import AdaptiveReceivePolicy
+
+    queue = FakeQueue(3)
+
+    async def handler(message):
+        pass
+
+    consumer = SQSConsumer(
+        queue,
+        handler,
+        receive_policy=AdaptiveReceivePolicy(min_wait=0, max_wait=0),
+        message_attribute_names=["event_type"],
+    )
+    run_until(consumer, lambda: consumer.processed == 3 and len(queue.receive_calls) > 1)
+
+    first, second = queue.receive_calls[:2]
+    assert first == (10, 0, {"attribute_names": None, "message_attribute_names": ["event_type"]})
+    assert second[0] == 3
+
+
+def make_sns_service(monkeypatch, client, **kwargs):
+    from video_processor_shared.aws.sns_service import SNSService
+
+    monkeypatch.setattr("video_processor_shared.aws.sns_service.get_sns_client", lambda: client)
+    monkeypatch.setattr(
+        "video_processor_shared.aws.sns_service.get_sns_topic_arn", lambda name: f"arn:{name}"
+    )
+    return SNSService(topic_name="events", **kwargs)
+
+
+def test_sns_publish_promotes_routing_keys_to_attributes(monkeypatch):
+    client = Mock()
+    client.publish.return_value = {"MessageId": "sns-1"}
+    service = make_sns_service(monkeypatch, client)
+
+    asyncio.run(service.publish_job_failed("j1", "u1", "v1", "boom"))
+    attributes = client.publish.call_args.kwargs["MessageAttributes"]
+    assert {name: value["StringValue"] for name, value in attributes.items()} == {
+        "event_type": "job_failed",
+        "user_id": "u1",
+        "job_id": "j1",
+        "video_id": "v1",
+    }
+
+    asyncio.run(service.publish({"a": 1}, attributes={"tenant": "acme"}))
+    attributes = client.publish.call_args.kwargs["MessageAttributes"]
+    assert attributes == {"tenant": {"DataType": "String", "StringValue": "acme"}}
+
+
+def test_sns_publish_batch_sends_events_in_groups_and_retries(monkeypatch):
+    from uuid import uuid4
+
+    from video_processor_shared.domain.events import JobCompletedEvent
+
+    calls = []
+
+    def publish_batch(TopicArn, PublishBatchRequestEntries):  # noqa: N803
+        calls.append(PublishBatchRequestEntries)
+        failed = [
+            entry for entry in PublishBatchRequestEntries if entry["Id"] == "3" and len(calls) == 1
+        ]
+        return {
+            "Successful": [
+                {"Id": entry["Id"], "MessageId": f"sns-{entry['Id']}"}
+                for entry in PublishBatchRequestEntries
+                if entry not in failed
+            ],
+            "Failed": [{"Id": entry["Id"], "Code": "InternalError"} for entry in failed],
+        }
+
+    client = Mock()
+    client.publish_batch.side_effect = publish_batch
+    service = make_sns_service(monkeypatch, client)
+    user_id = uuid4()
+    events = [JobCompletedEvent(job_id=uuid4(), user_id=user_id) for _ in range(11)]
+    events.append({"event_type": "custom", "n": 1})
+
+    ids = asyncio.run(service.publish_batch(events))
+
+    assert ids == [f"sns-{n}" for n in range(12)]
+    assert [len(entries) for entries in calls[:2]] == [10, 2]
+    assert [entry["Id"] for entry in calls[2]] == ["3"]
+    first = calls[0][0]
+    assert json.loads(first["Message"])["event_id"] == str(events[0].event_id)
+    assert first["MessageAttributes"]["event_type"]["StringValue"] == "JobCompletedEvent"
+    assert first["MessageAttributes"]["user_id"]["StringValue"] == str(user_id)
+    assert calls[1][1]["MessageAttributes"] == {
+        "event_type": {"DataType": "String", "StringValue": "custom"}
+    }
+    # Entries keep the subject publish() would give their event type.
+    assert first["Subject"] == "Video Processing Completed"
+    assert "Subject" not in calls[1][1]
+
+
+class FakeTopic:
+    """In-memory stand-in for SNSService used by publisher tests."""
+
+    topic_name = "events"
+
+    def __init__(self, fail_first=0):
+        self.batches = []
+        self.fail_first = fail_first
+        self.gate = None
+
+    async def publish_batch(self, events, max_attempts=3):
+        if self.gate is not None:
+            await self.gate.wait()
+        if self.fail_first:
+            self.fail_first -= 1
+            raise ConnectionError("down")
+        self.batches.append([event["n"] for event in events])
+        return [f"id-{event['n']}" for event in events]
+
+
+def test_buffered_publisher_batches_in_background_and_flushes_on_close(monkeypatch):
+    from video_processor_shared.aws.event_publisher import BufferedEventPublisher
+
+    monkeypatch.setattr(
+        "video_processor_shared.aws.event_publisher.backoff_delay", lambda *args, **kwargs: 0
+    )
+    topic = FakeTopic(fail_first=1)
+
+    async def scenario():
+        async with BufferedEventPublisher(topic, flush_interval=0.01, max_batch_events=20) as publisher:
+            for n in range(25):
+                await publisher.publish({"n": n})
+            assert publisher.stats.queued <= 25
+        return publisher
+
+    publisher = asyncio.run(scenario())
+
+    assert [n for batch in topic.batches for n in batch] == list(range(25))
+    assert max(len(batch) for batch in topic.batches) <= 20
+    stats = publisher.stats
+    assert (stats.published, stats.queued, stats.lag_seconds) == (25, 0, 0.0)
+    with pytest.raises(RuntimeError):
+        asyncio.run(publisher.publish({"n": 99}))
+
+
+def test_buffered_publisher_overflow_policies(tmp_path):
+    from video_processor_shared.aws.event_publisher import BufferedEventPublisher
+
+    async def fill(publisher, topic, count):
+        topic.gate = asyncio.Event()
+        for n in range(count):
+            await publisher.publish({"n": n})
+        return publisher.stats
+
+    drop_topic = FakeTopic()
+
+    async def drop_scenario():
+        publisher = BufferedEventPublisher(
+            drop_topic, max_queue=3, overflow="drop_oldest", flush_interval=0
+        )
+        stats = await fill(publisher, drop_topic, 6)
+        drop_topic.gate.set()
+        await publisher.close()
+        return stats
+
+    stats = asyncio.run(drop_scenario())
+    assert stats.dropped >= 2
+    published = [n for batch in drop_topic.batches for n in batch]
+    assert published[-3:] == [3, 4, 5]
+
+    spill_path = str(tmp_path / "spill.jsonl")
+    spill_topic = FakeTopic()
+
+    async def spill_scenario():
+        publisher = BufferedEventPublisher(
+            spill_topic, max_queue=2, overflow="spill", spill_path=spill_path, flush_interval=0
+        )
+        stats = await fill(publisher, spill_topic, 6)
+        await asyncio.sleep(0)
+        spill_topic.gate.set()
+        await publisher.close()
+        return stats
+
+    stats = asyncio.run(spill_scenario())
+    assert stats.spilled >= 3
+    assert sorted(n for batch in spill_topic.batches for n in batch) == list(range(6))
+    assert open(spill_path).read() == ""
+
+    with pytest.raises(ValueError):
+        BufferedEventPublisher(spill_topic, overflow="spill")
+    with pytest.raises(ValueError):
+        BufferedEventPublisher(spill_topic, overflow="discard")
+
+
+def test_buffered_publisher_blocks_and_spills_unsent_on_close_timeout(tmp_path):
+    from video_processor_shared.aws.event_publisher import BufferedEventPublisher
+
+    topic = FakeTopic()
+    spill_path = str(tmp_path / "spill.jsonl")
+
+    async def scenario():
+        topic.gate = asyncio.Event()
+        publisher = BufferedEventPublisher(
+            topic, max_queue=2, spill_path=spill_path, flush_interval=0
+        )
+        for n in range(4):
+            await publisher.publish({"n": n})
+        blocked = asyncio.ensure_future(publisher.publish({"n": 4}))
+        await asyncio.sleep(0.01)
+        assert not blocked.done()
+        await publisher.close(timeout=0.01)
+        blocked.cancel()
+
+    asyncio.run(scenario())
+
+    unsent = [json.loads(line)["n"] for line in open(spill_path)]
+    assert sorted(unsent) == [0, 1, 2, 3]
+
+    # A new publisher picks up the spilled events.
+    topic.gate = None
+
+    async def restart():
+        publisher = BufferedEventPublisher(topic, spill_path=spill_path, flush_interval=0)
+        assert publisher.stats.spilled == 4
+        await publisher.close()
+
+    asyncio.run(restart())
+    assert sorted(n for batch in topic.batches for n in batch) == [0, 1, 2, 3]
+
+
+def test_buffered_publisher_spills_unsent_events_ahead_of_spilled_ones(tmp_path):
+    from video_processor_shared.aws.event_publisher import BufferedEventPublisher
+
+    topic = FakeTopic()
+    spill_path = str(tmp_path / "spill.jsonl")
+
+    async def scenario():
+        topic.gate = asyncio.Event()
+        publisher = BufferedEventPublisher(
+            topic, max_queue=2, overflow="spill", spill_path=spill_path, flush_interval=0
+        )
+        for n in range(6):
+            await publisher.publish({"n": n})
+            await asyncio.sleep(0.001)
+        await publisher.close(timeout=0.01)
+
+    asyncio.run(scenario())
+
+    assert [json.loads(line)["n"] for line in open(spill_path)] == list(range(6))
+
+
+
+def test_buffered_publisher_close_waits_for_a_running_unspill(tmp_path):
+    import time
+
+    from video_processor_shared.aws.event_publisher import BufferedEventPublisher
+
+    topic = FakeTopic()
+    spill_path = tmp_path / "spill.jsonl"
+    spill_path.write_text("".join(json.dumps({"n": n}) + "\n" for n in range(4)))
+
+    async def scenario():
+        topic.gate = asyncio.Event()
+        publisher = BufferedEventPublisher(topic, spill_path=str(spill_path), flush_interval=0)
+        unspill = publisher._unspill
+
+        def slow_unspill():
+            time.sleep(0.1)
+            unspill()
+
+        publisher._unspill = slow_unspill
+        publisher.start()
+        await asyncio.sleep(0.01)
+        await publisher.close(timeout=0.01)
+
+    asyncio.run(scenario())
+    time.sleep(0.2)  # Let an unspill that outlived close() finish.
+
+    assert [json.loads(line)["n"] for line in open(spill_path)] == [0, 1, 2, 3]
+
+def test_buffered_publisher_retries_transient_entry_failures(monkeypatch):
+    from video_processor_shared.aws.event_publisher import BufferedEventPublisher
+
+    monkeypatch.setattr(
+        "video_processor_shared.aws.event_publisher.backoff_delay", lambda *args, **kwargs: 0
+    )
+    attempts = []
+
+    class PartialTopic(FakeTopic):
+        async def publish_batch(self, events, max_attempts=3):
+            attempts.append([event["n"] for event in events])
+            if len(attempts) > 1:
+                return ["ok"] * len(events)
+            failures = {
+                1: EntryFailure("InvalidParameter", sender_fault=True),
+                2: EntryFailure("InternalError"),
+            }
+            raise BatchOperationError(["ok", None, None], failures)
+
+    async def scenario():
+        async with BufferedEventPublisher(PartialTopic(), flush_interval=0) as publisher:
+            for n in range(3):
+                await publisher.publish({"n": n})
+        return publisher
+
+    publisher = asyncio.run(scenario())
+
+    assert attempts == [[0, 1, 2], [2]]
+    assert (publisher.published, publisher.failed) == (2, 1)
+
+
+@pytest.mark.parametrize("backend", ["sqlite", "file"])
+def test_outbox_persists_pending_records_across_restarts(tmp_path, backend):
+    from video_processor_shared.aws.outbox import FileOutbox, SQLiteOutbox
+
+    def open_outbox():
+        if backend == "sqlite":
+            return SQLiteOutbox(str(tmp_path / "outbox.db"))
+        return FileOutbox(str(tmp_path / "outbox"))
+
+    outbox = open_outbox()
+    first = outbox.append({"job_id": "a", "n": 0})
+    second = outbox.append({"job_id": "b", "n": 1})
+    third = outbox.append({"n": 2}, aggregate_id="c")
+    assert [record.aggregate_id for record in outbox.pending()] == ["a", "b", "c"]
+
+    outbox.acknowledge([second])
+    assert [record.id for record in outbox.pending()] == [first, third]
+    outbox.close()
+
+    outbox = open_outbox()
+    pending = outbox.pending()
+    # The file outbox only checkpoints a contiguous prefix, so an
+    # out-of-order acknowledgement may be replayed after a restart.
+    assert [record.payload["n"] for record in pending][0] == 0
+    assert pending[-1].payload == {"n": 2}
+    outbox.acknowledge(record.id for record in pending)
+    assert outbox.pending() == []
+    assert outbox.append({"n": 3}) > third
+    outbox.close()
+
+
+def test_file_outbox_truncates_log_when_fully_published(tmp_path):
+    from video_processor_shared.aws.outbox import FileOutbox
+
+    outbox = FileOutbox(str(tmp_path))
+    ids = [outbox.append({"n": n}) for n in range(3)]
+    outbox.acknowledge(ids)
+    assert (tmp_path / "outbox.jsonl").read_text() == ""
+    outbox.close()
+
+    with open(tmp_path / "outbox.jsonl", "a") as handle:
+        handle.write('{"id": 9, "aggregate_id": null, "pay')
+    assert FileOutbox(str(tmp_path)).pending() == []
+
+
+def test_outbox_relay_keeps_per_job_order_and_checkpoints(monkeypatch, tmp_path):
+    from video_processor_shared.aws.outbox import OutboxRelay, SQLiteOutbox
+
+    outbox = SQLiteOutbox(str(tmp_path / "outbox.db"))
+    for job_id, step in [("a", 1), ("a", 2), ("b", 1), ("a", 3), ("b", 2)]:
+        outbox.append({"job_id": job_id, "step": step})
+    rounds = []
+
+    def publish_batch(TopicArn, PublishBatchRequestEntries):  # noqa: N803
+        events = [json.loads(entry["Message"]) for entry in PublishBatchRequestEntries]
+        rounds.append([(event["job_id"], event["step"]) for event in events])
+        return {"Successful": [{"Id": entry["Id"], "MessageId": "m"} for entry in PublishBatchRequestEntries]}
+
+    client = Mock()
+    client.publish_batch.side_effect = publish_batch
+    relay = OutboxRelay(outbox, make_sns_service(monkeypatch, client), batch_size=10)
+
+    # One round drains every job's backlog, a wave per position in the job.
+    assert asyncio.run(relay.relay_once()) == 5
+    assert rounds == [[("a", 1), ("b", 1)], [("a", 2), ("b", 2)], [("a", 3)]]
+    assert relay.relayed == 5
+    assert outbox.pending() == []
+
+
+def test_outbox_relay_stops_a_job_at_its_first_transient_failure(monkeypatch, tmp_path):
+    from video_processor_shared.aws.outbox import OutboxRelay, SQLiteOutbox
+
+    outbox = SQLiteOutbox(str(tmp_path / "outbox.db"))
+    for job_id, step in [("a", 1), ("b", 1), ("a", 2), ("b", 2), ("c", 1)]:
+        outbox.append({"job_id": job_id, "step": step})
+    rounds = []
+
+    def publish_batch(TopicArn, PublishBatchRequestEntries):  # noqa: N803
+        events = [json.loads(entry["Message"]) for entry in PublishBatchRequestEntries]
+        rounds.append([(event["job_id"], event["step"]) for event in events])
+        outcome = {"Successful": [], "Failed": []}
+        for entry, event in zip(PublishBatchRequestEntries, events):
+            if event["job_id"] == "a":
+                outcome["Failed"].append({"Id": entry["Id"], "Code": "InternalError"})
+            else:
+                outcome["Successful"].append({"Id": entry["Id"], "MessageId": "m"})
+        return outcome
+
+    client = Mock()
+    client.publish_batch.side_effect = publish_batch
+    relay = OutboxRelay(outbox, make_sns_service(monkeypatch, client), max_attempts=1)
+
+    assert asyncio.run(relay.relay_once()) == 3
+    assert rounds == [[("a", 1), ("b", 1), ("c", 1)], [("b", 2)]]
+    assert [(record.payload["job_id"], record.payload["step"]) for record in outbox.pending()] == [
+        ("a", 1),
+        ("a", 2),
+    ]
+
+
+def test_sqlite_outbox_appends_inside_the_callers_transaction(tmp_path):
+    import sqlite3
+
+    from video_processor_shared.aws.outbox import SQLiteOutbox
+
+    path = str(tmp_path / "outbox.db")
+    outbox = SQLiteOutbox(path)
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE jobs (id TEXT, status TEXT)")
+
+    with pytest.raises(RuntimeError):
+        with conn:
+            conn.execute("INSERT INTO jobs VALUES ('a', 'done')")
+            outbox.append({"job_id": "a", "step": 1}, connection=conn)
+            raise RuntimeError("rolled back")
+    assert outbox.pending() == []
+
+    with conn:
+        conn.execute("INSERT INTO jobs VALUES ('a', 'done')")
+        outbox.append_all([{"job_id": "a", "step": 2}], connection=conn.cursor())
+    assert [record.payload["step"] for record in outbox.pending()] == [2]
+    conn.close()
+
+
+def test_outbox_relay_retries_transient_failures_and_skips_rejected(monkeypatch, tmp_path):
+    from video_processor_shared.aws.outbox import FileOutbox, OutboxRelay
+
+    outbox = FileOutbox(str(tmp_path))
+    for job_id in "abc":
+        outbox.append({"job_id": job_id})
+    sent = []
+
+    def send_message_batch(QueueUrl, Entries):  # noqa: N803
+        sent.append([json.loads(entry["MessageBody"])["job_id"] for entry in Entries])
+        failed = []
+        if len(sent) == 1:
+            failed = [
+                {"Id": "1", "Code": "InvalidParameterValue", "SenderFault": True},
+                {"Id": "2", "Code": "ServiceUnavailable", "SenderFault": False},
+            ]
+        failed_ids = {failure["Id"] for failure in failed}
+        successful = [{"Id": entry["Id"], "MessageId": "m"} for entry in Entries if entry["Id"] not in failed_ids]
+        return {"Successful": successful, "Failed": failed}
+
+    client = Mock()
+    client.send_message_batch.side_effect = send_message_batch
+    service, _ = make_service(monkeypatch, client=client)
+    relay = OutboxRelay(outbox, service, max_attempts=1)
+    asyncio.run(relay.drain())
+
+    assert sent == [["a", "b", "c"], ["c"]]
+    assert (relay.relayed, relay.failed) == (2, 1)
+    assert outbox.pending() == []
+
+
+def test_outbox_relay_runs_in_background(monkeypatch, tmp_path):
+    from video_processor_shared.aws.outbox import OutboxRelay, SQLiteOutbox
+
+    outbox = SQLiteOutbox(str(tmp_path / "outbox.db"))
+    client = Mock()
+    client.publish_batch.return_value = {"Successful": [{"Id": "0", "MessageId": "m-1"}]}
+    sns = make_sns_service(monkeypatch, client)
+
+    async def scenario():
+        async with OutboxRelay(outbox, sns, interval=0.01) as relay:
+            outbox.append({"job_id": "a", "event_type": "job.completed"})
+            for _ in range(200):
+                if relay.relayed:
+                    break
+                await asyncio.sleep(0.01)
+        return relay
+
+    assert asyncio.run(scenario()).relayed == 1
+    entries = client.publish_batch.call_args.kwargs["PublishBatchRequestEntries"]
+    assert json.loads(entries[0]["Message"])["job_id"] == "a"
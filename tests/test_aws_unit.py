@@ -1,11 +1,19 @@
 """Unit tests for AWS helpers and services."""
 
 import asyncio
+import json
+import threading
+import time
 from io import BytesIO
 from types import SimpleNamespace
 from unittest.mock import Mock
 
+import pytest
+
 from video_processor_shared.aws import (
+    ClientProfile,
+    close_all_clients,
+    configure_client_profile,
     get_aws_client,
     get_aws_resource,
     get_s3_client,
@@ -15,6 +23,12 @@ from video_processor_shared.aws import (
     get_sns_topic_arn,
     get_sqs_queue_url,
 )
+from video_processor_shared.aws.executor import (
+    AsyncExecutor,
+    configure_executor,
+    get_executor,
+    shutdown_executors,
+)
 from video_processor_shared.aws.s3_storage import S3StorageService
 from video_processor_shared.aws.ses_service import SESService
 from video_processor_shared.aws.sns_service import SNSService
@@ -61,6 +75,87 @@ def test_get_aws_client_without_endpoint(monkeypatch):
     assert "aws_access_key_id" not in captured
 
 
+def test_get_aws_client_reuses_pooled_client_per_key(monkeypatch):
+    calls = []
+
+    def fake_client(**kwargs):
+        calls.append(kwargs)
+        return Mock()
+
+    monkeypatch.delenv("AWS_ENDPOINT_URL", raising=False)
+    monkeypatch.setattr("video_processor_shared.aws.boto3.client", fake_client)
+
+    first = get_aws_client("sqs", region_name="sa-east-1")
+    assert get_aws_client("sqs", region_name="sa-east-1") is first
+    assert get_aws_client("sqs", region_name="us-east-1") is not first
+    assert get_aws_client("sqs", region_name="sa-east-1", endpoint_url="http://ls:4566") is not first
+    assert len(calls) == 3
+
+    close_all_clients()
+    first.close.assert_called_once()
+    assert get_aws_client("sqs", region_name="sa-east-1") is not first
+
+
+def test_client_profiles_configure_pool_keepalive_and_service_timeouts(monkeypatch):
+    captured = []
+    monkeypatch.delenv("AWS_ENDPOINT_URL", raising=False)
+    monkeypatch.setattr(
+        "video_processor_shared.aws.boto3.client",
+        lambda **kwargs: captured.append(kwargs) or Mock(),
+    )
+
+    configure_client_profile(
+        "workers",
+        ClientProfile(max_pool_connections=64, service_timeouts={"sqs": (2, 30)}),
+    )
+    stale = get_aws_client("sqs", profile="workers")
+    get_aws_client("s3", profile="workers")
+
+    sqs_config = captured[0]["config"]
+    assert sqs_config.max_pool_connections == 64
+    assert sqs_config.tcp_keepalive is True
+    assert (sqs_config.connect_timeout, sqs_config.read_timeout) == (2, 30)
+    assert captured[1]["config"].read_timeout == 60
+
+    configure_client_profile("workers", ClientProfile(max_pool_connections=8))
+    stale.close.assert_called_once()
+    assert get_aws_client("sqs", profile="workers") is not stale
+
+    with pytest.raises(KeyError):
+        get_aws_client("sqs", profile="missing")
+
+
+def test_reconfigured_default_profile_reaches_cached_getters(monkeypatch):
+    from video_processor_shared.aws.client_registry import registry
+
+    monkeypatch.setattr(registry, "_profiles", dict(registry._profiles))
+    monkeypatch.delenv("AWS_ENDPOINT_URL", raising=False)
+    monkeypatch.setattr(
+        "video_processor_shared.aws.boto3.client",
+        lambda **kwargs: Mock(pool=kwargs["config"].max_pool_connections),
+    )
+    stale = get_s3_client()
+
+    configure_client_profile("default", ClientProfile(max_pool_connections=50))
+
+    stale.close.assert_called_once()
+    client = get_s3_client()
+    assert client is not stale and client.pool == 50
+    assert get_aws_client("s3") is client
+
+
+def test_default_profile_reads_environment(monkeypatch):
+    monkeypatch.setenv("AWS_MAX_POOL_CONNECTIONS", "32")
+    monkeypatch.setenv("AWS_TCP_KEEPALIVE", "false")
+    monkeypatch.setenv("AWS_READ_TIMEOUT", "25")
+
+    profile = ClientProfile.from_env()
+
+    assert profile.max_pool_connections == 32
+    assert profile.tcp_keepalive is False
+    assert profile.timeouts_for("sns") == (5.0, 25.0)
+
+
 def test_get_aws_resource_with_and_without_endpoint(monkeypatch):
     first = {}
     second = {}
@@ -196,9 +291,10 @@ def test_sns_service_publish_and_specialized_events(monkeypatch):
     )
 
     service = SNSService(topic_name="events")
-    assert asyncio.run(service.publish({"a": 1})) == "sns-1"
+    assert asyncio.run(service.publish({"a": 1, "event_type": "job_completed"})) == "sns-1"
     first_args = client.publish.call_args.kwargs
     assert first_args["TopicArn"] == "arn:test:events"
+    # Only publish_batch derives a subject from the event type.
     assert "Subject" not in first_args
 
     asyncio.run(service.publish_job_completed("j1", "u1", "v1", "url", 10))
@@ -243,3 +339,320 @@ def test_sqs_service_send_receive_delete_and_size(monkeypatch):
 
     size = asyncio.run(service.get_queue_size())
     assert size == 7
+
+
+def test_async_executor_runs_blocking_calls_off_the_event_loop():
+    executor = AsyncExecutor("test", max_workers=2)
+    release = threading.Event()
+
+    async def scenario():
+        blocked = asyncio.ensure_future(executor.run(release.wait, 5))
+        ticks = 0
+        while not blocked.done() and ticks < 3:
+            await asyncio.sleep(0.01)
+            ticks += 1
+        release.set()
+        return ticks, await blocked
+
+    ticks, result = asyncio.run(scenario())
+    assert ticks == 3
+    assert result is True
+    executor.shutdown()
+
+
+def test_async_executor_timeout_and_cancellation_of_queued_calls():
+    executor = AsyncExecutor("test", max_workers=1, timeout=0.05)
+    gate = threading.Event()
+    queued = Mock()
+
+    async def scenario():
+        with pytest.raises(asyncio.TimeoutError):
+            await executor.run(gate.wait, 5)
+        # The only worker is still busy, so this call is cancelled before it starts.
+        with pytest.raises(asyncio.TimeoutError):
+            await executor.run(queued)
+        gate.set()
+        return await executor.run(time.monotonic, timeout=None)
+
+    assert asyncio.run(scenario()) > 0
+    queued.assert_not_called()
+    executor.shutdown()
+
+
+def test_shared_executors_are_configurable_per_service():
+    default = get_executor("s3")
+    assert get_executor("s3") is default
+
+    configured = configure_executor("s3", max_workers=3, timeout=1.5)
+    assert configured is default
+    assert (configured.max_workers, configured.timeout) == (3, 1.5)
+    # Holders of the previous instance keep working after a reconfigure.
+    assert asyncio.run(default.run(lambda: "still running")) == "still running"
+
+    shutdown_executors()
+    assert get_executor("s3") is not configured
+
+
+def test_token_bucket_refills_at_rate_and_is_shared():
+    from video_processor_shared.aws.ses_scheduler import TokenBucket, shared_token_bucket
+
+    now = [0.0]
+    bucket = TokenBucket(rate=2, clock=lambda: now[0])
+    assert [bucket.try_acquire() for _ in range(3)] == [0.0, 0.0, 0.5]
+    now[0] = 0.5
+    assert bucket.try_acquire() == 0.0
+
+    bucket.configure(rate=10)
+    now[0] = 10.0
+    assert bucket.capacity == 10
+    bucket.drain()
+    assert bucket.try_acquire() == pytest.approx(0.1)
+    bucket.pause(2)
+    assert bucket.try_acquire() == pytest.approx(2)
+    now[0] = 12.0
+    assert bucket.try_acquire() == 0.0
+    # More than the capacity is granted from a full bucket and paid back later.
+    now[0] = 20.0
+    assert bucket.try_acquire(15) == 0.0
+    assert bucket.try_acquire() == pytest.approx(0.6)
+    assert shared_token_bucket("ses-test") is shared_token_bucket("ses-test")
+
+
+def make_scheduler(monkeypatch, client, **kwargs):
+    from video_processor_shared.aws.ses_scheduler import SESSendScheduler, TokenBucket
+
+    monkeypatch.setattr("video_processor_shared.aws.ses_service.get_ses_client", lambda: client)
+    monkeypatch.setattr("video_processor_shared.aws.ses_scheduler.backoff_delay", lambda *args, **kwargs: 0)
+    client.get_send_quota.return_value = kwargs.pop(
+        "quota", {"Max24HourSend": 200.0, "MaxSendRate": 1000.0, "SentLast24Hours": 10.0}
+    )
+    return SESSendScheduler(SESService(), bucket=TokenBucket(1000), **kwargs)
+
+
+def test_ses_scheduler_sends_failure_notices_first(monkeypatch):
+    client = Mock()
+    client.send_email.side_effect = lambda **kwargs: {
+        "MessageId": kwargs["Message"]["Subject"]["Data"]
+    }
+    scheduler = make_scheduler(monkeypatch, client, concurrency=1)
+
+    async def scenario():
+        sends = [
+            scheduler.send_job_completed_email("a@test.local", "a.mp4", 1, "https://a"),
+            scheduler.send_job_completed_email("b@test.local", "b.mp4", 2, "https://b"),
+            scheduler.send_job_failed_email("c@test.local", "c.mp4", "boom"),
+        ]
+        ids = await asyncio.gather(*sends)
+        await scheduler.close()
+        return ids
+
+    ids = asyncio.run(scenario())
+
+    assert "Video Processing Failed" in ids[2]
+    recipients = [call.kwargs["Destination"]["ToAddresses"][0] for call in client.send_email.call_args_list]
+    assert recipients == ["c@test.local", "a@test.local", "b@test.local"]
+    stats = scheduler.stats
+    assert (stats.queued, stats.sent, stats.quota_remaining) == (0, 3, 187)
+    assert stats.latency_seconds >= 0
+    assert scheduler.bucket.rate == 1000
+
+
+
+def test_ses_scheduler_spends_one_token_per_email(monkeypatch):
+    client = Mock()
+    client.send_email.return_value = {"MessageId": "msg-1"}
+    scheduler = make_scheduler(monkeypatch, client, concurrency=4)
+    acquire = scheduler.bucket.acquire
+    tokens = []
+
+    async def counting_acquire(count=1.0):
+        tokens.append(count)
+        await acquire(count)
+
+    monkeypatch.setattr(scheduler.bucket, "acquire", counting_acquire)
+
+    async def scenario():
+        await asyncio.gather(*(scheduler.send_email(f"{n}@test.local", "Hi", "Body") for n in range(2)))
+        await scheduler.close()
+
+    asyncio.run(scenario())
+
+    # Four senders wake for the queued emails, but only two take a token.
+    assert len(tokens) == client.send_email.call_count == 2
+
+def test_ses_scheduler_requeues_throttled_sends_and_fails_others(monkeypatch):
+    from botocore.exceptions import ClientError
+
+    client = Mock()
+    throttled = ClientError({"Error": {"Code": "Throttling", "Message": "Maximum sending rate exceeded."}}, "SendEmail")
+    rejected = ClientError({"Error": {"Code": "MessageRejected", "Message": "Address blacklisted."}}, "SendEmail")
+    client.send_email.side_effect = [throttled, {"MessageId": "msg-1"}, rejected]
+    scheduler = make_scheduler(monkeypatch, client, concurrency=1)
+
+    async def scenario():
+        async with scheduler:
+            first = await scheduler.send_email("a@test.local", "Hi", "Body")
+            with pytest.raises(ClientError):
+                await scheduler.send_email("b@test.local", "Hi", "Body")
+        return first
+
+    assert asyncio.run(scenario()) == "msg-1"
+    assert (scheduler.throttled, scheduler.sent, scheduler.failed) == (1, 1, 1)
+
+
+def test_ses_scheduler_pauses_the_shared_bucket_and_retries_failed_quota_refresh(monkeypatch):
+    from botocore.exceptions import ClientError
+
+    client = Mock()
+    throttled = ClientError({"Error": {"Code": "Throttling"}}, "SendEmail")
+    client.send_email.side_effect = [throttled, {"MessageId": "msg-1"}, {"MessageId": "msg-2"}]
+    scheduler = make_scheduler(monkeypatch, client, concurrency=1)
+    quota = client.get_send_quota.return_value
+    client.get_send_quota.side_effect = [ConnectionError("down"), quota]
+    pauses = []
+    monkeypatch.setattr(scheduler.bucket, "pause", pauses.append)
+
+    async def scenario():
+        first = await scheduler.send_email("a@test.local", "Hi", "Body")
+        second = await scheduler.send_email("b@test.local", "Hi", "Body")
+        await scheduler.close()
+        return first, second
+
+    assert asyncio.run(scenario()) == ("msg-1", "msg-2")
+    assert pauses == [0]
+    # The failed refresh did not count as fetched, so the next send retried it.
+    assert client.get_send_quota.call_count == 2
+    assert scheduler.quota is not None
+
+
+def test_ses_scheduler_holds_mail_when_daily_quota_is_used_up(monkeypatch):
+    client = Mock()
+    scheduler = make_scheduler(
+        monkeypatch,
+        client,
+        quota={"Max24HourSend": 200.0, "MaxSendRate": 14.0, "SentLast24Hours": 200.0},
+    )
+
+    async def scenario():
+        await scheduler.refresh_quota()
+        future = await scheduler.submit("a@test.local", Mock())
+        await scheduler.close(timeout=0.05)
+        return future
+
+    future = asyncio.run(scenario())
+
+    assert future.cancelled()
+    client.send_email.assert_not_called()
+    assert scheduler.stats.quota_remaining == 0
+
+
+def test_email_templates_render_locally_with_html_escaping():
+    from video_processor_shared.aws.email_templates import (
+        JOB_COMPLETED_TEMPLATE,
+        EmailTemplate,
+        compile_template,
+    )
+
+    template = EmailTemplate("Greeting", "Hi {{{name}}}", "Hi {{{ name }}}, {{missing}}!", "<p>{{name}}</p>")
+    content = template.render({"name": "<Ana & Bo>"})
+    assert content.subject == "Hi <Ana & Bo>"
+    assert content.body_text == "Hi <Ana & Bo>, !"
+    assert content.body_html == "<p>&lt;Ana &amp; Bo&gt;</p>"
+    assert compile_template(template.html) is compile_template("<p>{{name}}</p>")
+
+    assert JOB_COMPLETED_TEMPLATE.to_ses()["TemplateName"] == "VideoProcessorJobCompleted"
+    assert "HtmlPart" not in template.__class__("Plain", "s", "t").to_ses()
+
+
+def test_ses_bulk_job_completed_registers_template_and_sends_in_chunks(monkeypatch):
+    from botocore.exceptions import ClientError
+
+    from video_processor_shared.aws.batching import BatchOperationError
+    from video_processor_shared.aws.rate_limit import TokenBucket
+    from video_processor_shared.aws.ses_service import JobCompletedNotification
+
+    client = Mock()
+    client.create_template.side_effect = ClientError({"Error": {"Code": "AlreadyExists"}}, "CreateTemplate")
+    calls = []
+
+    def send_bulk_templated_email(**kwargs):
+        destinations = kwargs["Destinations"]
+        calls.append(destinations)
+        statuses = []
+        for destination in destinations:
+            to = destination["Destination"]["ToAddresses"][0]
+            if to == "user-3@test.local" and len(calls) == 1:
+                statuses.append({"Status": "TransientFailure", "Error": "try again"})
+            elif to == "user-7@test.local":
+                statuses.append({"Status": "MessageRejected", "Error": "blocked"})
+            else:
+                statuses.append({"Status": "Success", "MessageId": f"msg-{to}"})
+        return {"Status": statuses}
+
+    client.send_bulk_templated_email.side_effect = send_bulk_templated_email
+    client.get_send_quota.return_value = {
+        "Max24HourSend": 200.0, "MaxSendRate": 1000.0, "SentLast24Hours": 0.0
+    }
+    monkeypatch.setattr("video_processor_shared.aws.ses_service.get_ses_client", lambda: client)
+    monkeypatch.setattr("video_processor_shared.aws.batching.backoff_delay", lambda *args, **kwargs: 0)
+    service = SESService(from_email="noreply@test.local", bucket=TokenBucket(1))
+    notifications = [
+        JobCompletedNotification(f"user-{n}@test.local", f"video-{n}.mp4", n, f"https://download/{n}")
+        for n in range(60)
+    ]
+
+    with pytest.raises(BatchOperationError) as error:
+        asyncio.run(service.send_bulk_job_completed(notifications))
+
+    assert list(error.value.failures) == [7]
+    assert error.value.results[3] == "msg-user-3@test.local"
+    assert [len(destinations) for destinations in calls] == [50, 10, 1]
+    assert json.loads(calls[0][2]["ReplacementTemplateData"]) == {
+        "video_filename": "video-2.mp4",
+        "frame_count": 2,
+        "download_url": "https://download/2",
+    }
+    assert client.send_bulk_templated_email.call_args.kwargs["Template"] == "VideoProcessorJobCompleted"
+    client.update_template.assert_called_once()
+
+    asyncio.run(service.send_bulk_job_completed(notifications[:2]))
+    client.create_template.assert_called_once()
+    assert service.bucket.rate == 1000
+    client.get_send_quota.assert_called_once()
+
+
+def test_ses_bulk_send_retries_throttled_requests_and_missing_statuses(monkeypatch):
+    from botocore.exceptions import ClientError
+
+    from video_processor_shared.aws.email_templates import EmailTemplate
+    from video_processor_shared.aws.rate_limit import TokenBucket
+
+    client = Mock()
+    client.get_send_quota.return_value = {
+        "Max24HourSend": 200.0, "MaxSendRate": 10.0, "SentLast24Hours": 0.0
+    }
+    throttled = ClientError({"Error": {"Code": "Throttling"}}, "SendBulkTemplatedEmail")
+    # A throttled request, then a response missing the second recipient's status.
+    client.send_bulk_templated_email.side_effect = [
+        throttled,
+        {"Status": [{"Status": "Success", "MessageId": "m-a"}]},
+        {"Status": [{"Status": "Success", "MessageId": "m-b"}]},
+    ]
+    monkeypatch.setattr("video_processor_shared.aws.ses_service.get_ses_client", lambda: client)
+    monkeypatch.setattr("video_processor_shared.aws.batching.backoff_delay", lambda *args, **kwargs: 0)
+    service = SESService(bucket=TokenBucket(1000))
+    acquired, pauses = [], []
+
+    async def acquire(tokens):
+        acquired.append(tokens)
+
+    monkeypatch.setattr(service.bucket, "acquire", acquire)
+    monkeypatch.setattr(service.bucket, "pause", pauses.append)
+    template = EmailTemplate("Hello", "Hi {{name}}", "Hi {{name}}")
+
+    ids = asyncio.run(service.send_bulk_templated_email(template, [("a@x", {}), ("b@x", {})]))
+
+    assert ids == ["m-a", "m-b"]
+    assert acquired == [2, 2, 1]
+    assert len(pauses) == 1
+    assert service.bucket.rate == 10